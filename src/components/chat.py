@@ -4,7 +4,8 @@ import csv
 import io
 from datetime import datetime
 from src.services.pinecone_service import PineconeService
-from src.services.langchain_service import LangChainService
+from src.services.service_container import get_service_container
+from src.services.geo_index import parse_coordinates
 from src.config.settings import (
     load_prompt_templates
 )
@@ -59,16 +60,17 @@ def load_chat_history(file):
 def get_property_list(pinecone_service: PineconeService) -> list:
     """物件情報の一覧を取得"""
     try:
-        # Pineconeから物件情報の一覧を取得
-        results = pinecone_service.list_vectors(namespace="property")
+        # ローカルのメタデータカタログから取得（使えない場合はPineconeから順次取得）
+        catalog = pinecone_service.get_catalog(["property"])
+        if catalog:
+            entries = catalog.list_entries("property")
+        else:
+            entries = ({"id": match.id, "metadata": match.metadata} for match in pinecone_service.iter_vectors(namespace="property"))
         
-        if not results:
-            return []
-            
         properties = []
-        for match in results:
+        for entry in entries:
             # テキストから物件情報を抽出
-            text = match.metadata["text"]
+            text = entry["metadata"].get("text", "")
             lines = text.split('\n')
             
             # 物件名と場所を抽出（最初の2行を想定）
@@ -76,9 +78,11 @@ def get_property_list(pinecone_service: PineconeService) -> list:
             location = lines[1].strip() if len(lines) > 1 else "不明"
             
             properties.append({
-                "id": match.id,
+                "id": entry["id"],
                 "name": name,
                 "location": location,
+                "city": entry["metadata"].get("city", ""),
+                "coordinates": parse_coordinates(entry["metadata"]),
                 "text": text
             })
             
@@ -104,19 +108,12 @@ def get_property_info(property_id: str, pinecone_service: PineconeService) -> st
 def get_all_property_info(pinecone_service: PineconeService) -> str:
     """すべての物件情報を取得して結合"""
     try:
-        # Pineconeから物件情報の一覧を取得
-        results = pinecone_service.list_vectors(namespace="property")
+        # 物件情報の一覧から結合
+        all_properties = [prop["text"] for prop in get_property_list(pinecone_service)]
         
-        if not results:
+        if not all_properties:
             return "物件情報が登録されていません。"
             
-        # 物件情報を結合
-        all_properties = []
-        for match in results:
-            # テキストから物件情報を抽出
-            text = match.metadata["text"]
-            all_properties.append(text)
-            
         # 物件情報を結合して返す
         return "\n\n---\n\n".join(all_properties)
     except Exception as e:
@@ -133,8 +130,8 @@ def render_chat(pinecone_service: PineconeService):
 
     # LangChainサービスの初期化
     if "langchain_service" not in st.session_state:
-        from streamlit_app import callback_manager
-        st.session_state.langchain_service = LangChainService(callback_manager=callback_manager)
+        # LLMやベクトルストアは共有し、会話履歴などセッション固有の状態のみ作成する
+        st.session_state.langchain_service = get_service_container().create_langchain_service()
         # API使用状況の確認
         st.session_state.langchain_service.check_api_usage()
     
@@ -193,7 +190,20 @@ def render_chat(pinecone_service: PineconeService):
                 )
                 
                 # 選択された物件のIDを取得
-                selected_property_id = properties[property_options.index(selected_property)]["id"]
+                selected_property_data = properties[property_options.index(selected_property)]
+                selected_property_id = selected_property_data["id"]
+                
+                # 選択された物件の市区町村で文脈検索を絞り込む
+                filter_by_city = st.checkbox(
+                    "物件の市区町村で検索を絞り込む",
+                    value=True,
+                    disabled=not selected_property_data["city"],
+                    help="他の市区町村の情報を検索対象から除外します（市区町村が設定されていない共通情報は含めます）"
+                )
+                st.session_state.property_city = selected_property_data["city"] if filter_by_city else None
+                
+                # 選択された物件の位置から周辺施設を距離で検索する
+                st.session_state.property_location = selected_property_data["coordinates"]
                 
                 # 選択された物件の詳細情報を取得
                 st.session_state.property_info = get_property_info(selected_property_id, pinecone_service)
@@ -204,6 +214,8 @@ def render_chat(pinecone_service: PineconeService):
             else:
                 st.warning("物件情報が登録されていません。")
                 st.session_state.property_info = "物件情報が登録されていません。"
+                st.session_state.property_city = None
+                st.session_state.property_location = None
         
         with property_tab2:
             # すべての物件情報を取得
@@ -380,7 +392,10 @@ def render_chat(pinecone_service: PineconeService):
                 system_prompt=selected_template_data["system_prompt"],
                 response_template=selected_template_data["response_template"],
                 property_info=st.session_state.get("property_info", "物件情報はありません。"),
-                chat_history=chat_history  # 会話履歴を渡す
+                chat_history=chat_history,  # 会話履歴を渡す
+                filter=pinecone_service.build_filter(city=st.session_state.get("property_city")),
+                location=st.session_state.get("property_location") if st.session_state.get("geo_search", True) else None,
+                city=st.session_state.get("property_city")
             )
             
             # アシスタントの応答を追加
@@ -3,98 +3,37 @@ from src.utils.text_processing import process_text_file
 from src.services.pinecone_service import PineconeService
 from src.services.category_classifier import CategoryClassifier
 from src.services.response_templates import AnswerExampleGenerator
-from src.config.settings import METADATA_CATEGORIES
+from src.services.namespace_router import namespace_city
+from src.config.settings import METADATA_CATEGORIES, CITY_NAMESPACES_ENABLED
+from src.utils.chunk_ids import make_chunk_id
+from src.utils.chunking import decode_text, read_facility_csv, build_csv_chunks, advanced_manual_chunk_split
 from datetime import datetime
-import pandas as pd
-import json
 import traceback
-import io
 import re
 from typing import List, Dict, Any
 
 def read_file_content(file) -> str:
     """ファイルの内容を適切なエンコーディングで読み込む"""
-    encodings = ['utf-8', 'shift-jis', 'cp932', 'euc-jp']
-    content = file.getvalue()
-    
-    for encoding in encodings:
-        try:
-            # バイト列を文字列にデコード
-            decoded_content = content.decode(encoding)
-            # デコードした文字列を再度エンコードして元のバイト列と比較
-            if decoded_content.encode(encoding) == content:
-                return decoded_content
-        except (UnicodeDecodeError, UnicodeEncodeError):
-            continue
-    
-    # すべてのエンコーディングで失敗した場合
-    try:
-        # UTF-8で強制的にデコードを試みる（一部の文字が化ける可能性あり）
-        return content.decode('utf-8', errors='replace')
-    except Exception as e:
-        raise ValueError(f"ファイルのエンコーディングを特定できませんでした。エラー: {str(e)}")
+    return decode_text(file.getvalue())
 
 def process_csv_file(file):
     """CSVファイルを処理してチャンクに分割"""
     try:
-        # エンコーディングのリスト（日本語のCSVで一般的なエンコーディング）
-        encodings = ['utf-8', 'shift-jis', 'cp932', 'euc-jp']
-        
-        # 各エンコーディングで試行
-        for encoding in encodings:
-            try:
-                # ファイルの内容をバイト列として読み込む
-                content = file.getvalue()
-                # 指定したエンコーディングでデコード
-                decoded_content = content.decode(encoding)
-                # デコードした内容をStringIOに変換
-                file_like = io.StringIO(decoded_content)
-                # CSVとして読み込む
-                df = pd.read_csv(file_like, header=None, names=[
-                    "大カテゴリ", "中カテゴリ", "施設名", "緯度", "経度", "徒歩距離", "徒歩分数", "直線距離"
-                ])
-                break  # 成功したらループを抜ける
-            except (UnicodeDecodeError, pd.errors.EmptyDataError):
-                continue  # 失敗したら次のエンコーディングを試す
-        
-        if 'df' not in locals():
-            raise ValueError("CSVファイルのエンコーディングを特定できませんでした。")
+        df = read_facility_csv(file.getvalue())
         
         # デバッグ情報の表示
         st.write("CSVファイルの内容:")
         st.dataframe(df)
         
-        # 各列を結合してテキストを作成
-        chunks = []
-        for index, row in df.iterrows():
-            try:
-                # 各行をテキストに変換
-                text = f"{row['施設名']}は{row['大カテゴリ']}の{row['中カテゴリ']}です。"
-                if text.strip():
-                    # NaN値を適切に処理し、型変換を確実に行う
-                    metadata = {
-                        "main_category": str(row['大カテゴリ']) if pd.notna(row['大カテゴリ']) else "",
-                        "sub_category": str(row['中カテゴリ']) if pd.notna(row['中カテゴリ']) else "",
-                        "facility_name": str(row['施設名']) if pd.notna(row['施設名']) else "",
-                        "latitude": float(row['緯度']) if pd.notna(row['緯度']) else 0.0,
-                        "longitude": float(row['経度']) if pd.notna(row['経度']) else 0.0,
-                        "walking_distance": int(float(row['徒歩距離'])) if pd.notna(row['徒歩距離']) else 0,
-                        "walking_minutes": int(float(row['徒歩分数'])) if pd.notna(row['徒歩分数']) else 0,
-                        "straight_distance": int(float(row['直線距離'])) if pd.notna(row['直線距離']) else 0
-                    }
-                    
-                    # デバッグ情報の表示
-                    st.write(f"行 {index + 1} のメタデータ:")
-                    st.json(metadata)
-                    
-                    chunks.append({
-                        "id": f"csv_{index}_{datetime.now().strftime('%Y%m%d%H%M%S')}",
-                        "text": text,
-                        "metadata": metadata
-                    })
-            except Exception as e:
-                st.error(f"行 {index + 1} の処理中にエラーが発生しました: {str(e)}")
-                continue
+        chunks = build_csv_chunks(
+            df,
+            file.name,
+            on_error=lambda index, e: st.error(f"行 {index + 1} の処理中にエラーが発生しました: {str(e)}")
+        )
+        for i, chunk in enumerate(chunks):
+            # デバッグ情報の表示
+            st.write(f"チャンク {i + 1} のメタデータ:")
+            st.json(chunk["metadata"])
         
         if not chunks:
             raise ValueError("有効なデータが1件も見つかりませんでした。")
@@ -103,7 +42,7 @@ def process_csv_file(file):
     except Exception as e:
         raise ValueError(f"CSVファイルの処理に失敗しました: {str(e)}")
 
-def manual_chunk_split(text: str, chunk_separators: str = "---") -> List[Dict[str, Any]]:
+def manual_chunk_split(text: str, chunk_separators: str = "---", source: str = "") -> List[Dict[str, Any]]:
     """手動でチャンクを分割"""
     chunks = []
     
@@ -125,7 +64,7 @@ def manual_chunk_split(text: str, chunk_separators: str = "---") -> List[Dict[st
         part = part.strip()
         if part:  # 空でない部分のみをチャンクとして追加
             chunks.append({
-                "id": f"manual_chunk_{i}_{datetime.now().strftime('%Y%m%d%H%M%S')}",
+                "id": make_chunk_id("manual", source, part),
                 "text": part,
                 "metadata": {
                     "chunk_type": "manual",
@@ -135,95 +74,28 @@ def manual_chunk_split(text: str, chunk_separators: str = "---") -> List[Dict[st
     
     return chunks
 
-def advanced_manual_chunk_split(text: str, chunk_separators: str = "---") -> List[Dict[str, Any]]:
-    """高度な手動チャンク分割（複数セパレータ対応）"""
-    chunks = []
-    
-    if not chunk_separators:
-        # セパレータがない場合は全体を1つのチャンクとして扱う
-        if text.strip():
-            chunks.append({
-                "id": f"manual_chunk_0_{datetime.now().strftime('%Y%m%d%H%M%S')}",
-                "text": text.strip(),
-                "metadata": {
-                    "chunk_type": "manual",
-                    "chunk_index": 0
-                }
-            })
-        return chunks
-    
-    # 複数のセパレータをサポート（改行で区切る）
-    separators = [sep.strip() for sep in chunk_separators.split('\n') if sep.strip()]
-    
-    if not separators:
-        # 有効なセパレータがない場合
-        if text.strip():
-            chunks.append({
-                "id": f"manual_chunk_0_{datetime.now().strftime('%Y%m%d%H%M%S')}",
-                "text": text.strip(),
-                "metadata": {
-                    "chunk_type": "manual",
-                    "chunk_index": 0
-                }
-            })
-        return chunks
-    
-    # 最初のセパレータで分割
-    parts = text.split(separators[0])
-    
-    # 各部分を処理
-    chunk_index = 0
-    for part in parts:
-        part = part.strip()
-        if not part:  # 空の部分はスキップ
-            continue
-        
-        # 追加のセパレータがある場合は、さらに分割を試みる
-        if len(separators) > 1:
-            sub_parts = []
-            current_part = part
-            
-            for sep in separators[1:]:
-                if sep in current_part:
-                    sub_parts.extend(current_part.split(sep))
-                    current_part = ""
-                    break
-                else:
-                    sub_parts = [current_part]
-                    break
-            
-            # サブパーツを処理
-            for sub_part in sub_parts:
-                sub_part = sub_part.strip()
-                if sub_part:  # 空でない部分のみをチャンクとして追加
-                    chunks.append({
-                        "id": f"manual_chunk_{chunk_index}_{datetime.now().strftime('%Y%m%d%H%M%S')}",
-                        "text": sub_part,
-                        "metadata": {
-                            "chunk_type": "manual",
-                            "chunk_index": chunk_index,
-                            "separators_used": separators
-                        }
-                    })
-                    chunk_index += 1
-        else:
-            # 単一セパレータの場合
-            chunks.append({
-                "id": f"manual_chunk_{chunk_index}_{datetime.now().strftime('%Y%m%d%H%M%S')}",
-                "text": part,
-                "metadata": {
-                    "chunk_type": "manual",
-                    "chunk_index": chunk_index,
-                    "separators_used": separators
-                }
-            })
-            chunk_index += 1
-    
-    return chunks
+def upload_or_sync(pinecone_service: PineconeService, chunks: List[Dict[str, Any]], replace_existing: bool, by_city: bool = False) -> Dict[str, Any]:
+    """チャンクをアップロードして結果を表示（置き換えを指定した場合は同じファイル名の古いチャンクを削除、by_cityでは市区町村ごとのnamespaceに登録）"""
+    if by_city:
+        report = pinecone_service.upload_chunks_by_city(chunks, sync=replace_existing)
+    elif replace_existing:
+        report = pinecone_service.sync_chunks(chunks)
+    else:
+        report = pinecone_service.upload_chunks(chunks)
+    st.success("アップロードが完了しました！")
+    if report.get("unchanged_chunks"):
+        st.info(f"内容が変わっていない{report['unchanged_chunks']}件のチャンクはスキップしました")
+    if report.get("deleted_chunks"):
+        st.info(f"修正前の内容の{report['deleted_chunks']}件のチャンクを削除しました")
+    if report.get("namespaces"):
+        st.info("登録先: " + ", ".join(
+            f"{namespace_city(namespace) or '共通'}（{count}件）" for namespace, count in report["namespaces"].items()
+        ))
+    return report
 
-def preview_chunks(text: str, chunk_separators: str = "---") -> List[Dict[str, Any]]:
+def preview_chunks(text: str, chunk_separators: str = "---", source: str = "") -> List[Dict[str, Any]]:
     """チャンク分割のプレビューを生成"""
-    return advanced_manual_chunk_split(text, chunk_separators)
+    return advanced_manual_chunk_split(text, chunk_separators, source)
 
 def render_file_upload(pinecone_service: PineconeService):
     """ファイルアップロード機能のUIを表示"""
@@ -241,6 +113,11 @@ def render_file_upload(pinecone_service: PineconeService):
         
         if file_extension == 'csv':
             # CSVファイルの場合はメタデータ入力フォームを表示しない
+            replace_existing = st.checkbox(
+                "同じファイル名の登録済みチャンクを置き換える",
+                value=False,
+                help="修正したファイルを再アップロードする場合に、今回のファイルに含まれない古いチャンクを削除します"
+            )
             if st.button("データベースに保存"):
                 try:
                     with st.spinner("ファイルを処理中..."):
@@ -248,8 +125,7 @@ def render_file_upload(pinecone_service: PineconeService):
                         st.write(f"ファイルを{len(chunks)}個のチャンクに分割しました")
                         
                         with st.spinner("Pineconeにアップロード中..."):
-                            pinecone_service.upload_chunks(chunks)
-                            st.success("アップロードが完了しました！")
+                            upload_or_sync(pinecone_service, chunks, replace_existing)
                 except ValueError as e:
                     st.error(str(e))
                 except Exception as e:
@@ -372,7 +248,7 @@ def render_file_upload(pinecone_service: PineconeService):
             # プレビューボタン
             if st.button("👁️ チャンク分割をプレビュー"):
                 # プレビューチャンクを生成
-                preview_chunks_list = preview_chunks(edited_text, chunk_separators)
+                preview_chunks_list = preview_chunks(edited_text, chunk_separators, uploaded_file.name)
                 
                 # セッション状態に保存
                 st.session_state['preview_chunks'] = preview_chunks_list
@@ -822,6 +698,17 @@ def render_file_upload(pinecone_service: PineconeService):
                     st.code(chunk_separators)
             
             # 保存ボタン
+            replace_existing = st.checkbox(
+                "同じファイル名の登録済みチャンクを置き換える",
+                value=False,
+                help="修正したファイルを再アップロードする場合に、今回のファイルに含まれない古いチャンクを削除します"
+            )
+            by_city = st.checkbox(
+                "市区町村ごとのnamespaceに登録する",
+                value=CITY_NAMESPACES_ENABLED,
+                disabled=not city,
+                help="物件の市区町村で検索する際に、他の市区町村のチャンクを検索対象から外します（市区町村が未選択の場合は共通情報として登録します）"
+            )
             if st.button("💾 データベースに保存"):
                 try:
                     with st.spinner("ファイルを処理中..."):
@@ -830,7 +717,7 @@ def render_file_upload(pinecone_service: PineconeService):
                             chunks = st.session_state['preview_chunks']
                             st.info(f"セッション状態から{len(chunks)}個のチャンクを取得しました")
                         else:
-                            chunks = advanced_manual_chunk_split(edited_text, chunk_separators)
+                            chunks = advanced_manual_chunk_split(edited_text, chunk_separators, uploaded_file.name)
                             st.info(f"新しく{len(chunks)}個のチャンクを生成しました")
                         
                         if not chunks:
@@ -901,8 +788,7 @@ def render_file_upload(pinecone_service: PineconeService):
                             st.write(f"  - 最終メタデータ: {metadata}")
                         
                         with st.spinner("Pineconeにアップロード中..."):
-                            pinecone_service.upload_chunks(chunks)
-                            st.success("アップロードが完了しました！")
+                            upload_or_sync(pinecone_service, chunks, replace_existing, by_city and bool(city))
                             
                             # セッション状態をクリア
                             if 'preview_chunks' in st.session_state:
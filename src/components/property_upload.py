@@ -1,9 +1,9 @@
 import streamlit as st
 from src.services.pinecone_service import PineconeService
+from src.utils.chunk_ids import chunk_id_prefix, make_chunk_id
 import pandas as pd
 import json
 import traceback
-from datetime import datetime
 import tiktoken
 
 # 都道府県と市区町村のデータ
@@ -204,6 +204,12 @@ def render_property_upload(pinecone_service: PineconeService):
                 help="物件の経度を入力してください"
             )
         
+        replace_existing = st.checkbox(
+            "同じ物件の登録済み情報を置き換える",
+            value=True,
+            help="物件情報を修正して再登録する場合に、修正前の内容のチャンクを削除します"
+        )
+        
         # アップロードボタン
         submit_button = st.form_submit_button("アップロード")
         
@@ -229,15 +235,29 @@ def render_property_upload(pinecone_service: PineconeService):
                 # 物件データをチャンクに分割
                 chunks = split_property_data(property_data)
                 
-                # チャンクごとにIDを付与
-                timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-                for i, chunk in enumerate(chunks):
-                    chunk["id"] = f"property_{timestamp}_{i}"
+                # チャンクごとに物件と内容から決まるIDを付与（同じ物件の再登録では変更されたチャンクのみアップロードされる）
+                # 同じ文字列を同期のキーとしても保存し、別の市区町村の同じ名前の物件を置き換えないようにする
+                property_source = f"{prefecture}{city}{detailed_address}{property_name}"
+                for chunk in chunks:
+                    chunk["id"] = make_chunk_id("property", property_source, chunk["text"])
+                    chunk["metadata"] = dict(chunk.get("metadata", {}), property_key=property_source)
                 
                 # Pineconeへのアップロード
-                pinecone_service.upload_chunks(chunks, namespace="property")
+                if replace_existing:
+                    # キーを保存する前に登録したチャンクは、同じ物件から作られるIDの接頭辞で判定して置き換える
+                    report = pinecone_service.sync_chunks(
+                        chunks,
+                        namespace="property",
+                        legacy_id_prefixes=[chunk_id_prefix("property", property_source)]
+                    )
+                else:
+                    report = pinecone_service.upload_chunks(chunks, namespace="property")
                 
                 st.success(f"✅ 物件情報を{len(chunks)}件のチャンクに分割してアップロードしました")
+                if report.get("unchanged_chunks"):
+                    st.info(f"内容が変わっていない{report['unchanged_chunks']}件のチャンクはスキップしました")
+                if report.get("deleted_chunks"):
+                    st.info(f"修正前の内容の{report['deleted_chunks']}件のチャンクを削除しました")
                 
             except Exception as e:
                 st.error(f"❌ アップロードに失敗しました: {str(e)}")
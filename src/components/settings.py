@@ -1,16 +1,24 @@
 import streamlit as st
 from src.services.pinecone_service import PineconeService
+from src.services.embedding_cache import get_embedding_cache
+from src.services.query_cache import get_query_cache
+from src.services.retry_scheduler import get_retry_scheduler
+from src.services.namespace_router import namespace_city
 from src.config.settings import (
     CHUNK_SIZE,
     BATCH_SIZE,
     EMBEDDING_MODEL,
     DEFAULT_TOP_K,
     SIMILARITY_THRESHOLD,
+    HYBRID_ALPHA,
+    GEO_SEARCH_ENABLED,
+    RERANK_ENABLED,
     load_prompt_templates,
     save_prompt_templates
 )
 import json
 import pandas as pd
+from datetime import datetime
 import traceback
 
 def render_settings(pinecone_service: PineconeService):
@@ -103,12 +111,55 @@ def render_settings(pinecone_service: PineconeService):
         else:
             st.info("⚡ **基本的な検索モード**\n\n- 従来の単純なベクトル検索\n- 高速な処理\n- シンプルな結果")
         
+        # ハイブリッド検索の設定（dotproductのインデックスでのみ使用可能）
+        st.markdown("### 🔤 ハイブリッド検索設定")
+        hybrid_available = pinecone_service.sparse_encoder is not None
+        hybrid_search = st.checkbox(
+            "施設名・駅名などを含む質問はハイブリッド検索を使用する",
+            value=st.session_state.get("hybrid_search", True) and hybrid_available,
+            disabled=not hybrid_available,
+            help="BM25の疎ベクトルと密ベクトルを組み合わせた1回の検索で、LLMによるクエリ拡張を省略します。"
+        )
+        hybrid_alpha = st.slider(
+            "⚖️ 密ベクトルの重み（alpha）",
+            min_value=0.0,
+            max_value=1.0,
+            value=st.session_state.get("hybrid_alpha", HYBRID_ALPHA),
+            step=0.05,
+            disabled=not hybrid_available,
+            help="1.0に近いほど意味の類似度を、0.0に近いほどキーワードの一致を重視します。"
+        )
+        if not hybrid_available:
+            st.caption(f"ハイブリッド検索にはメトリックがdotproductのインデックスが必要です（現在: {pinecone_service.metric}）")
+        
+        # 周辺施設検索の設定
+        st.markdown("### 📍 周辺施設検索設定")
+        geo_search = st.checkbox(
+            "選択中の物件から周辺施設までの距離を参照文脈に含める",
+            value=st.session_state.get("geo_search", True) and GEO_SEARCH_ENABLED,
+            disabled=not GEO_SEARCH_ENABLED,
+            help="「最寄りのスーパー」などの質問に、施設データの緯度・経度から計算した直線距離と徒歩分数で回答します。"
+        )
+        
+        # 再ランキングの設定
+        st.markdown("### 🧮 再ランキング設定")
+        rerank = st.checkbox(
+            "高度な検索の候補をベクトルでローカルに再ランキングする",
+            value=st.session_state.get("rerank", True) and RERANK_ENABLED,
+            disabled=not RERANK_ENABLED,
+            help="候補のベクトルを元の質問とクエリバリエーションの重心に対して再評価し、内容の重複する候補の順位を下げます（LLMの呼び出しは増えません）。"
+        )
+        
         st.markdown("---")
         st.markdown("### 現在の設定値")
         st.json({
             "検索結果数": top_k,
             "類似度しきい値": similarity_threshold,
-            "検索モード": "高度な検索" if selected_mode == "advanced" else "基本的な検索"
+            "検索モード": "高度な検索" if selected_mode == "advanced" else "基本的な検索",
+            "ハイブリッド検索": hybrid_search,
+            "密ベクトルの重み": hybrid_alpha,
+            "周辺施設検索": geo_search,
+            "再ランキング": rerank
         })
 
     # プロンプト設定タブ
@@ -225,32 +276,114 @@ def render_settings(pinecone_service: PineconeService):
         st.markdown("### データベースの状態")
         st.markdown("Pineconeデータベースの状態を確認します。")
         
+        # 埋め込みキャッシュの状態
+        embedding_cache = get_embedding_cache()
+        if embedding_cache:
+            with st.expander("🧠 埋め込みキャッシュの状態", expanded=False):
+                cache_stats = embedding_cache.stats()
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.metric("キャッシュ件数", cache_stats["entries"])
+                with col2:
+                    st.metric("ヒット / ミス", f"{cache_stats['hits']} / {cache_stats['misses']}")
+                with col3:
+                    st.metric("ヒット率", f"{cache_stats['hit_rate']:.1%}")
+        
+        # 検索結果キャッシュの状態
+        query_cache = get_query_cache()
+        if query_cache:
+            with st.expander("🔎 検索結果キャッシュの状態", expanded=False):
+                query_cache_stats = query_cache.stats()
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.metric("キャッシュ件数", query_cache_stats["entries"])
+                with col2:
+                    st.metric("ヒット / ミス", f"{query_cache_stats['hits']} / {query_cache_stats['misses']}")
+                with col3:
+                    st.metric("ヒット率", f"{query_cache_stats['hit_rate']:.1%}")
+                st.caption(f"世代: {query_cache_stats['generation']}（アップロードやクリアのたびに更新され、以前の結果は破棄されます）")
+        
+        # API呼び出しの再試行の状態
+        retry_stats = get_retry_scheduler().stats()
+        if retry_stats:
+            with st.expander("🔁 API呼び出しの再試行", expanded=False):
+                circuit_labels = {"closed": "正常", "open": "一時停止中", "half_open": "回復確認中"}
+                st.dataframe(
+                    [
+                        {
+                            "エンドポイント": endpoint,
+                            "呼び出し": endpoint_stats["calls"],
+                            "成功": endpoint_stats["successes"],
+                            "失敗": endpoint_stats["failures"],
+                            "再試行": endpoint_stats["retries"],
+                            "待機秒数": endpoint_stats["sleep_seconds"],
+                            "停止中に拒否": endpoint_stats["rejected"],
+                            "状態": circuit_labels[endpoint_stats["circuit"]]
+                        }
+                        for endpoint, endpoint_stats in sorted(retry_stats.items())
+                    ],
+                    use_container_width=True,
+                    hide_index=True
+                )
+        
+        # 統計情報キャッシュの状態
+        stats_cache_info = pinecone_service.get_stats_cache_info()
+        if stats_cache_info["age_seconds"] is not None:
+            st.caption(
+                f"統計情報は{stats_cache_info['age_seconds']:.0f}秒前に取得したものです"
+                f"（キャッシュ有効期間: {stats_cache_info['ttl_seconds']:.0f}秒）"
+            )
+        
+        if st.button("♻️ Pineconeと同期", help="ローカルのメタデータカタログをPineconeの内容で作り直します"):
+            try:
+                with st.spinner("メタデータカタログを同期中..."):
+                    counts = pinecone_service.reconcile_catalog()
+                st.success(f"✅ メタデータカタログを同期しました（{sum(counts.values())}件）")
+            except Exception as e:
+                st.error(f"❌ メタデータカタログの同期に失敗しました: {str(e)}")
+        
         if st.button("🔄 データベースの状態を確認", type="primary"):
             try:
-                # インデックスの統計情報を取得
-                stats = pinecone_service.get_index_stats()
+                # インデックスの統計情報を取得（ボタン押下時は最新の値を取得する）
+                stats = pinecone_service.get_index_stats(force_refresh=True)
                 
                 st.markdown("#### 📊 データベースの概要")
                 st.json(stats)
                 
-                # データを取得
-                data = pinecone_service.get_index_data()
+                # ローカルのメタデータカタログで集計する（使えない場合はPineconeから順次取得）
+                catalog = pinecone_service.get_catalog()
+                if catalog:
+                    df_grouped = pd.DataFrame(catalog.group_by_filename())
+                    if not df_grouped.empty:
+                        df_grouped = df_grouped.rename(columns={'chunk_count': 'chunk_id'})
+                else:
+                    data = []
+                    progress_text = st.empty()
+                    for item in pinecone_service.iter_index_data():
+                        data.append(item)
+                        if len(data) % 500 == 0:
+                            progress_text.text(f"データを取得中... {len(data)}件")
+                    progress_text.empty()
+                    
+                    df_grouped = pd.DataFrame(data)
+                    if not df_grouped.empty:
+                        # ファイルごとにグループ化して集計
+                        df_grouped = df_grouped.groupby('filename').agg({
+                            'chunk_id': 'count',
+                            'main_category': 'first',
+                            'sub_category': 'first',
+                            'city': 'first',
+                            'created_date': 'first',
+                            'upload_date': 'first',
+                            'source': 'first'
+                        }).reset_index()
                 
-                if data:
+                if not df_grouped.empty:
                     st.markdown("#### 📋 データベースの内容")
-                    # データフレームを作成
-                    df = pd.DataFrame(data)
-                    
-                    # ファイルごとにグループ化して集計
-                    df_grouped = df.groupby('filename').agg({
-                        'chunk_id': 'count',
-                        'main_category': 'first',
-                        'sub_category': 'first',
-                        'city': 'first',
-                        'created_date': 'first',
-                        'upload_date': 'first',
-                        'source': 'first'
-                    }).reset_index()
+                    if catalog:
+                        last_synced = max(catalog.synced_at().values(), default=None)
+                        if last_synced:
+                            st.caption(f"メタデータカタログ（最終同期: {datetime.fromtimestamp(last_synced).strftime('%Y-%m-%d %H:%M:%S')}）")
                     
                     # 列名の日本語対応
                     column_names = {
@@ -276,6 +409,16 @@ def render_settings(pinecone_service: PineconeService):
                 else:
                     st.info("ℹ️ データベースにデータがありません。")
                 
+                # 市区町村ごとのnamespaceのベクトル数
+                city_namespace_counts = [
+                    {"市区町村": namespace_city(namespace), "namespace": namespace, "ベクトル数": namespace_stats.get('vector_count', 0)}
+                    for namespace, namespace_stats in sorted(stats["namespaces"].items())
+                    if namespace_city(namespace)
+                ]
+                if city_namespace_counts:
+                    st.markdown("#### 🏙️ 市区町村ごとのnamespace")
+                    st.dataframe(city_namespace_counts, hide_index=True, use_container_width=True)
+                
                 # 各namespaceのデータを取得して表示
                 namespaces = ["default", "property"]
                 for namespace in namespaces:
@@ -296,8 +439,11 @@ def render_settings(pinecone_service: PineconeService):
                         st.markdown(f"#### 📋 {namespace} namespaceの内容")
                         st.markdown(f"##### 📊 ベクトル数: {vector_count}件")
                         
-                        # ベクトルを取得
-                        vectors = pinecone_service.list_vectors(namespace=namespace, limit=100)
+                        # ベクトルを取得（カタログがあればローカルから取得）
+                        if catalog:
+                            vectors = catalog.list_entries(namespace, limit=100)
+                        else:
+                            vectors = pinecone_service.list_vectors(namespace=namespace, limit=100)
                         
                         if vectors:
                             # メタデータをDataFrameに変換
@@ -325,7 +471,10 @@ def render_settings(pinecone_service: PineconeService):
                                     ]
                                     
                                     # 市区町村ごとの件数を表示
-                                    city_counts = df['city'].value_counts().reset_index()
+                                    if catalog:
+                                        city_counts = pd.DataFrame(catalog.count_by('city', namespace))
+                                    else:
+                                        city_counts = df['city'].value_counts().reset_index()
                                     city_counts.columns = ['市区町村', '件数']
                                     st.markdown("##### 📍 市区町村別物件数")
                                     st.dataframe(
@@ -402,6 +551,10 @@ def render_settings(pinecone_service: PineconeService):
             "batch_size": batch_size,
             "top_k": top_k,
             "similarity_threshold": similarity_threshold,
-            "search_mode": selected_mode
+            "search_mode": selected_mode,
+            "hybrid_search": hybrid_search,
+            "hybrid_alpha": hybrid_alpha,
+            "geo_search": geo_search,
+            "rerank": rerank
         })
         st.success("✅ 設定を保存しました。") 
\ No newline at end of file
@@ -22,10 +22,110 @@ PINECONE_ASSISTANT_NAME = os.getenv("PINECONE_ASSISTANT_NAME") or st.secrets.get
 # Text Processing Settings
 CHUNK_SIZE = 500  # テキストを分割する際の1チャンクあたりの文字数
 BATCH_SIZE = 100  # Pineconeへのアップロード時のバッチサイズ
+UPLOAD_QUEUE_DEPTH = 4  # 埋め込み済みでアップロード待ちのバッチを保持する最大数
+UPLOAD_EMBEDDING_WORKERS = 2  # 埋め込みベクトルを生成するワーカー数
+UPLOAD_UPSERT_WORKERS = 2  # Pineconeへアップロードするワーカー数
+UPSERT_MAX_REQUEST_BYTES = 1_800_000  # 1回のアップロードリクエストの最大サイズ（Pineconeの上限2MBに余裕を持たせた値）
+UPSERT_MAX_VECTORS_PER_REQUEST = 1000  # 1回のアップロードリクエストの最大ベクトル数（Pineconeの上限）
+UPSERT_MAX_WORKERS = 4  # アップロードリクエストを並行して送信するスレッド数
+UPLOAD_MAX_RETRY_ROUNDS = 3  # 失敗したチャンクを再試行する最大ラウンド数
+SKIP_UNCHANGED_CHUNKS = os.getenv("SKIP_UNCHANGED_CHUNKS", "true").lower() != "false"  # 登録済みで内容が変わっていないチャンクの再アップロードを省略する
+CONTENT_HASH_EXCLUDED_FIELDS = ["upload_date", "content_hash"]  # 内容の変更判定に含めないメタデータのフィールド
+DELETE_BATCH_SIZE = 1000  # 1回の削除リクエストに含める最大ID数（Pineconeの上限）
+SYNC_KEY_FIELDS = {"property": "property_key"}  # 同期モードで置き換えの単位にするメタデータのフィールド（namespaceごと、未指定はfilename）
+IMPORT_BATCH_SIZE = 500  # 事前計算済みのベクトルをインポートする際に1回に読み込んでアップロードする件数
 
 # OpenAI Settings
 EMBEDDING_MODEL = "text-embedding-3-large"  # 使用する埋め込みモデル
-EMBEDDING_DIMENSION = 3072  # 埋め込みベクトルの次元数
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "3072"))  # 埋め込みベクトルの次元数（1024・512・256に削減可能）
+SUPPORTED_EMBEDDING_DIMENSIONS = [3072, 1024, 512, 256]  # dimensionsパラメータで指定できる次元数
+EMBEDDING_BATCH_MAX_INPUTS = 256  # 1回の埋め込みリクエストに含める最大テキスト数（APIの上限は2048）
+EMBEDDING_BATCH_MAX_TOKENS = 100000  # 1回の埋め込みリクエストに含める最大トークン数（APIの上限は300,000）
+EMBEDDING_MAX_INPUT_TOKENS = 8191  # 1テキストあたりの最大トークン数（超える場合は単独で送信）
+
+# Local State Settings
+LOCAL_STATE_DIR = os.getenv("PINECHAT_STATE_DIR", ".pinechat")  # キャッシュなどを保存するローカルディレクトリ
+
+# Vector Backend Settings
+# localにするとPineconeの代わりにローカルのNumPy行列（メモリマップ）にベクトルを保存して検索する（オフライン・CI用）
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone").lower()  # ベクトルの保存先（pinecone/local）
+LOCAL_INDEX_DIR = os.path.join(LOCAL_STATE_DIR, "local_index")  # ローカルインデックスの保存先ディレクトリ
+LOCAL_INDEX_NAME = "local"  # インデックス名が設定されていない場合のローカルインデックス名
+LOCAL_INDEX_METRIC = os.getenv("LOCAL_INDEX_METRIC", "cosine")  # ローカルインデックスの類似度（cosine/dotproduct）
+LOCAL_INDEX_DTYPE = os.getenv("LOCAL_INDEX_DTYPE", "float32")  # ベクトルの保存形式（float32/float16）
+LOCAL_INDEX_HNSW = os.getenv("LOCAL_INDEX_HNSW", "false").lower() == "true"  # hnswlibによる近似検索の有効/無効（未インストール時は全件検索）
+LOCAL_INDEX_HNSW_MIN_VECTORS = 5000  # 近似検索を使用する最小ベクトル数（これ未満は全件検索）
+
+# Embedding Cache Settings
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() != "false"  # 埋め込みキャッシュの有効/無効
+EMBEDDING_CACHE_PATH = os.path.join(LOCAL_STATE_DIR, "embedding_cache.sqlite3")  # 埋め込みキャッシュのファイルパス
+EMBEDDING_CACHE_MAX_ENTRIES = 50000  # キャッシュに保持する最大件数（超えた分は古い順に削除）
+
+# Ingestion Journal Settings
+INGESTION_JOURNAL_ENABLED = os.getenv("INGESTION_JOURNAL_ENABLED", "true").lower() != "false"  # アップロードの途中再開の有効/無効
+INGESTION_JOURNAL_PATH = os.path.join(LOCAL_STATE_DIR, "ingestion_journal.sqlite3")  # ジャーナルのファイルパス
+INGESTION_JOURNAL_RETENTION_DAYS = 7  # 未完了ジョブの記録を保持する日数
+
+# Document Store Settings
+# 有効にするとテキストなどの大きなフィールドをローカルに保存し、Pineconeには絞り込み用の小さなフィールドのみ保存する
+# （ローカルのファイルが失われる環境では無効のままにしてください）
+SLIM_METADATA = os.getenv("SLIM_METADATA", "false").lower() == "true"
+DOCUMENT_STORE_PATH = os.path.join(LOCAL_STATE_DIR, "documents.sqlite3")  # ドキュメントストアのファイルパス
+DOCUMENT_STORE_FIELDS = ["text", "search_text", "answer_examples"]  # ドキュメントストアに移すメタデータのフィールド
+
+# Index Stats Cache Settings
+INDEX_STATS_CACHE_TTL = float(os.getenv("INDEX_STATS_CACHE_TTL", "30"))  # インデックス統計情報をキャッシュする秒数（0で無効）
+
+# Metadata Catalog Settings
+METADATA_CATALOG_ENABLED = os.getenv("METADATA_CATALOG_ENABLED", "true").lower() != "false"  # ローカルのメタデータカタログの有効/無効
+METADATA_CATALOG_PATH = os.path.join(LOCAL_STATE_DIR, "metadata_catalog.sqlite3")  # メタデータカタログのファイルパス
+
+# Vector Listing Settings
+LIST_PAGE_SIZE = 100  # ベクトルIDを列挙する際の1ページあたりの件数（list_paginatedの上限は100）
+LIST_FETCH_WORKERS = 4  # 列挙したベクトルを並行してfetchするスレッド数
+
+# Query Result Cache Settings
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE_ENABLED", "true").lower() != "false"  # 検索結果キャッシュの有効/無効
+QUERY_CACHE_MAX_ENTRIES = 1000  # メモリに保持する検索結果の最大件数
+QUERY_CACHE_TTL = 600  # 検索結果を再利用する最大秒数（他のインスタンスからの書き込みに備える。0で無期限）
+QUERY_CACHE_PERSIST = os.getenv("QUERY_CACHE_PERSIST", "false").lower() == "true"  # SQLiteに保存してプロセス間で共有するか
+QUERY_CACHE_PATH = os.path.join(LOCAL_STATE_DIR, "query_cache.sqlite3")  # 検索結果キャッシュのファイルパス
+
+# Hybrid Search Settings（疎ベクトルはdotproductのインデックスでのみ使用できます）
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() != "false"  # BM25疎ベクトルによるハイブリッド検索の有効/無効
+HYBRID_ALPHA = 0.5  # ハイブリッド検索での密ベクトルの重み（1.0で密ベクトルのみ、0.0で疎ベクトルのみ）
+BM25_K1 = 1.2  # BM25の語の出現回数の飽和パラメータ
+BM25_B = 0.75  # BM25の文書長による正規化の強さ
+BM25_STATS_PATH = os.path.join(LOCAL_STATE_DIR, "bm25_stats.sqlite3")  # BM25のコーパス統計のファイルパス
+KEYWORD_PROPER_NOUN_RATIO = 0.5  # 固有名詞が語のこの割合以上を占める質問はキーワード中心とみなす
+
+# Geo Search Settings
+GEO_SEARCH_ENABLED = os.getenv("GEO_SEARCH_ENABLED", "true").lower() != "false"  # 施設の位置情報による周辺検索の有効/無効
+GEO_GRID_CELL_DEGREES = 0.01  # 空間インデックスのグリッドの1セルの大きさ（度、緯度方向で約1.1km）
+GEO_DEFAULT_RADIUS_METERS = 1000  # 周辺施設を検索する既定の半径（メートル）
+GEO_CONTEXT_TOP_K = 5  # 参照文脈に含める周辺施設の最大件数（カテゴリごと）
+WALKING_METERS_PER_MINUTE = 80  # 徒歩分数の換算に使用する分速（不動産の表示規約に準拠）
+
+# Rerank Settings
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "true").lower() != "false"  # 候補ベクトルによるローカルの再ランキングの有効/無効
+RERANK_QUERY_WEIGHT = 0.7  # 再ランキングでの元の質問との類似度の重み（残りはクエリバリエーションの重心との類似度）
+RERANK_MMR_LAMBDA = 0.7  # MMRで関連度を重視する割合（1.0で多様性を考慮しない）
+CANDIDATE_VECTOR_STORE_DIR = os.path.join(LOCAL_STATE_DIR, "candidate_vectors")  # 候補ベクトル（float16）の保存先ディレクトリ
+CANDIDATE_VECTOR_STORE_MAX_ROWS = 20000  # 保持する候補ベクトルの最大件数（超えた分は古い順に上書き）
+
+# City Namespace Settings
+# 有効にすると市区町村が設定されたチャンクを市区町村ごとのnamespaceに登録し、検索は物件の市区町村のnamespaceと共通情報のみを対象にする
+CITY_NAMESPACES_ENABLED = os.getenv("CITY_NAMESPACES_ENABLED", "false").lower() == "true"  # アップロード時の既定値
+CITY_NAMESPACE_PREFIX = "city-"  # 市区町村のnamespace名の接頭辞（以降は市区町村名をパーセントエンコードしたもの）
+QUERY_FANOUT_WORKERS = 8  # 複数のnamespaceを並行して検索するスレッド数
+
+# Retry Settings（OpenAI・Pineconeの呼び出しで共有）
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))  # 1回の呼び出しあたりの最大試行回数
+RETRY_BASE_DELAY = 0.5  # 再試行までの最短の待機秒数
+RETRY_MAX_DELAY = 20  # 再試行までの最長の待機秒数（ゆらぎを加えた後の上限）
+RETRY_AFTER_MAX_SECONDS = 60  # Retry-Afterヘッダーに従って待機する最大秒数
+CIRCUIT_FAILURE_THRESHOLD = 5  # 連続して失敗した場合に呼び出しを一時停止する回数
+CIRCUIT_RESET_SECONDS = 30  # 呼び出しを一時停止する秒数（経過後に1件だけ試行して回復を確認）
 
 # Search Settings
 DEFAULT_TOP_K = 10  # デフォルトの検索結果数
@@ -1,27 +1,36 @@
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional
 from openai import OpenAI
 import re
 import json
 from src.services.pinecone_service import PineconeService
-from src.config.settings import OPENAI_API_KEY, SIMILARITY_THRESHOLD
+from src.services.retry_scheduler import get_retry_scheduler
+from src.services.vector_reranker import VectorReranker
+from src.config.settings import OPENAI_API_KEY, SIMILARITY_THRESHOLD, HYBRID_ALPHA, RERANK_ENABLED
 import streamlit as st
 
 class AdvancedSearchService:
-    def __init__(self, pinecone_service: PineconeService):
-        """高度な検索サービスの初期化"""
+    def __init__(self, pinecone_service: PineconeService, openai_client: OpenAI = None):
+        """高度な検索サービスの初期化（OpenAIクライアントを渡した場合はそれを共有する）"""
         self.pinecone_service = pinecone_service
-        self.openai_client = OpenAI(api_key=OPENAI_API_KEY)
+        self.openai_client = openai_client or OpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+        self.retry = get_retry_scheduler()
         
         # 検索設定
         self.base_similarity_threshold = SIMILARITY_THRESHOLD
         self.max_query_variations = 5
         self.max_results_per_query = 10
         
+        # 候補のベクトルによるローカルの再ランキング
+        self.reranker = VectorReranker(pinecone_service) if RERANK_ENABLED else None
+        
     def extract_keywords(self, query: str) -> List[str]:
         """クエリから重要なキーワードを抽出"""
         try:
             # OpenAIを使用してキーワード抽出
-            response = self.openai_client.chat.completions.create(
+            response = self.retry.call(
+                "openai.chat",
+                self.openai_client.chat.completions.create,
+                description="キーワードの抽出",
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": "与えられた質問から重要なキーワードを抽出してください。地域情報や施設情報に関連する重要な単語のみを抽出し、JSON形式で返してください。"},
@@ -100,7 +109,10 @@ class AdvancedSearchService:
 - 「〜の代替案を教えてください」
 """
             
-            response = self.openai_client.chat.completions.create(
+            response = self.retry.call(
+                "openai.chat",
+                self.openai_client.chat.completions.create,
+                description="クエリのバリエーション生成",
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -139,10 +151,17 @@ class AdvancedSearchService:
         
         return variations
     
-    def multi_step_search(self, query: str, namespace: str = None) -> Dict[str, Any]:
-        """マルチステップ検索を実行"""
+    def multi_step_search(self, query: str, namespace: str = None, filter: Dict[str, Any] = None, city: str = None) -> Dict[str, Any]:
+        """マルチステップ検索を実行（filterは各クエリのメタデータフィルター、cityは検索するnamespaceの絞り込みに使用）"""
         print(f"\n=== マルチステップ検索開始 ===")
         print(f"クエリ: {query}")
+        if filter:
+            print(f"メタデータフィルター: {json.dumps(filter, ensure_ascii=False)}")
+        
+        # 施設名・駅名などを含むキーワード中心の質問は、LLMによるクエリ拡張の代わりにハイブリッド検索1回で済ませる
+        sparse_encoder = self.pinecone_service.sparse_encoder
+        if sparse_encoder and st.session_state.get("hybrid_search", True) and sparse_encoder.is_keyword_heavy(query):
+            return self.hybrid_search(query, namespace, filter, city)
         
         # ステップ1: キーワード抽出
         print("\nステップ1: キーワード抽出")
@@ -154,41 +173,50 @@ class AdvancedSearchService:
         query_variations = self.generate_query_variations(query, keywords)
         print(f"生成されたクエリバリエーション: {query_variations}")
         
-        # ステップ3: 複数クエリでの検索
+        # ステップ3: 複数クエリでの検索（埋め込みは1回のリクエストにまとめ、検索は並行して行う）
         print("\nステップ3: 複数クエリでの検索")
         all_results = []
+        query_vectors = self.pinecone_service.get_embeddings(query_variations)
         
-        for i, variation in enumerate(query_variations):
-            print(f"\nクエリバリエーション {i+1}: {variation}")
-            
+        # 画面の設定はワーカースレッドから参照できないため、しきい値はここで決めておく
+        session_threshold = st.session_state.get("similarity_threshold", SIMILARITY_THRESHOLD)
+        similarity_thresholds = []
+        for i in range(len(query_variations)):
             # 動的しきい値調整
             similarity_threshold = self.base_similarity_threshold
             if i > 0:  # 2番目以降のクエリはしきい値を下げる
                 similarity_threshold = max(0.2, similarity_threshold - 0.1)
-            
-            try:
-                results = self.pinecone_service.query(
-                    query_text=variation,
-                    namespace=namespace,
-                    top_k=self.max_results_per_query,
-                    similarity_threshold=similarity_threshold
-                )
-                
-                # 結果にクエリ情報を追加
-                for match in results["matches"]:
-                    match.query_variation = variation
-                    match.query_index = i
-                
-                all_results.extend(results["matches"])
-                print(f"  結果数: {len(results['matches'])}")
-                
-            except Exception as e:
-                print(f"  検索エラー: {str(e)}")
+            if similarity_threshold == SIMILARITY_THRESHOLD:  # デフォルト値の場合は設定画面の値を使用
+                similarity_threshold = session_threshold
+            similarity_thresholds.append(similarity_threshold)
+        
+        # 完了したクエリから順に結果を統合する
+        for i, results in self.pinecone_service.query_many(
+            query_variations,
+            query_vectors=query_vectors,
+            namespace=namespace,
+            top_k=self.max_results_per_query,
+            similarity_thresholds=similarity_thresholds,
+            filter=filter,
+            city=city
+        ):
+            variation = query_variations[i]
+            if results is None:
+                print(f"\nクエリバリエーション {i+1}: {variation}\n  検索エラー")
                 continue
+            
+            # 結果にクエリ情報を追加
+            for match in results["matches"]:
+                match.query_variation = variation
+                match.query_index = i
+            
+            all_results.extend(results["matches"])
+            print(f"\nクエリバリエーション {i+1}: {variation}（しきい値 {similarity_thresholds[i]}）")
+            print(f"  結果数: {len(results['matches'])}")
         
         # ステップ4: 結果の統合とランキング
         print("\nステップ4: 結果の統合とランキング")
-        final_results = self._merge_and_rank_results(all_results, query_variations)
+        final_results = self._merge_and_rank_results(all_results, query_variations, query_vectors)
         
         print(f"\n=== 検索完了 ===")
         print(f"最終結果数: {len(final_results)}")
@@ -199,11 +227,54 @@ class AdvancedSearchService:
             "keywords": keywords,
             "search_details": {
                 "query_variations": query_variations,
-                "original_query": query
+                "original_query": query,
+                "filter": filter
             }
         }
     
-    def _merge_and_rank_results(self, all_results: List, query_variations: List[str]) -> List:
+    def hybrid_search(self, query: str, namespace: str = None, filter: Dict[str, Any] = None, city: str = None) -> Dict[str, Any]:
+        """BM25の疎ベクトルと密ベクトルを組み合わせた1回の検索を実行"""
+        alpha = st.session_state.get("hybrid_alpha", HYBRID_ALPHA)
+        print(f"\nハイブリッド検索（alpha={alpha}）")
+        
+        # 疎ベクトルが一致しない場合のスコアはalpha倍になるため、しきい値も同じ割合で調整する
+        current_threshold = st.session_state.get("similarity_threshold", self.base_similarity_threshold)
+        hybrid_threshold = current_threshold * alpha
+        results = self.pinecone_service.query(
+            query_text=query,
+            namespace=namespace,
+            top_k=self.max_results_per_query,
+            similarity_threshold=hybrid_threshold,
+            filter=filter,
+            alpha=alpha,
+            city=city
+        )
+        
+        matches = results["matches"]
+        for match in matches:
+            match.query_variation = query
+            match.query_index = 0
+            match.adjusted_score = match.score
+        matches.sort(key=lambda x: x.adjusted_score, reverse=True)
+        
+        keywords = self.pinecone_service.sparse_encoder.processor.extract_terms(query)
+        print(f"\n=== 検索完了 ===")
+        print(f"最終結果数: {len(matches)}")
+        
+        return {
+            "matches": matches,
+            "total_variations": 1,
+            "keywords": keywords,
+            "search_details": {
+                "query_variations": [query],
+                "original_query": query,
+                "filter": filter,
+                "search_mode": "hybrid",
+                "alpha": alpha
+            }
+        }
+    
+    def _merge_and_rank_results(self, all_results: List, query_variations: List[str], query_vectors: Optional[List[Optional[List[float]]]] = None) -> List:
         """検索結果を統合してランキング"""
         if not all_results:
             return []
@@ -219,9 +290,39 @@ class AdvancedSearchService:
                 if result.score > unique_results[result_id].score:
                     unique_results[result_id] = result
         
-        # スコアの正規化とランキング
+        # 候補のベクトルで再評価できた場合は、その順序とスコアを使う
+        ranked_results = self._rerank_results(list(unique_results.values()), query_variations, query_vectors)
+        if ranked_results is None:
+            ranked_results = self._rank_by_query_penalty(list(unique_results.values()))
+        
+        # 設定画面のしきい値でフィルタリング
+        current_threshold = st.session_state.get("similarity_threshold", self.base_similarity_threshold)
+        filtered_results = [
+            result for result in ranked_results
+            if result.adjusted_score >= current_threshold
+        ]
+        
+        return filtered_results
+    
+    def _rerank_results(self, results: List, query_variations: List[str], query_vectors: Optional[List[Optional[List[float]]]] = None) -> Optional[List]:
+        """候補のベクトルを元の質問とクエリバリエーションに対して再評価し、MMRで並べ替える（できない場合はNone）"""
+        if not self.reranker or not st.session_state.get("rerank", True):
+            return None
+        try:
+            # 検索時に埋め込んだベクトルがなければ取得する（通常は埋め込みキャッシュから取得される）
+            if query_vectors is None:
+                query_vectors = self.pinecone_service.get_embeddings(query_variations)
+            if not query_vectors or query_vectors[0] is None:
+                return None
+            return self.reranker.rerank(results, [vector for vector in query_vectors if vector is not None])
+        except Exception as e:
+            print(f"再ランキングに失敗しました（Pineconeのスコアで並べ替えます）: {str(e)}")
+            return None
+    
+    def _rank_by_query_penalty(self, results: List) -> List:
+        """Pineconeのスコアからクエリバリエーションの順序によるペナルティを引いて並べ替え"""
         ranked_results = []
-        for result in unique_results.values():
+        for result in results:
             # クエリバリエーションの順序を考慮したスコア調整
             query_penalty = result.query_index * 0.05  # 後半のクエリは少しペナルティ
             
@@ -233,15 +334,7 @@ class AdvancedSearchService:
         
         # 調整されたスコアでソート
         ranked_results.sort(key=lambda x: x.adjusted_score, reverse=True)
-        
-        # 設定画面のしきい値でフィルタリング
-        current_threshold = st.session_state.get("similarity_threshold", self.base_similarity_threshold)
-        filtered_results = [
-            result for result in ranked_results
-            if result.adjusted_score >= current_threshold
-        ]
-        
-        return filtered_results
+        return ranked_results
     
     def get_search_analytics(self, search_results: Dict[str, Any]) -> Dict[str, Any]:
         """検索分析情報を取得"""
@@ -0,0 +1,150 @@
+from typing import List, Dict, Optional, Tuple
+import os
+import threading
+import numpy as np
+from src.utils.local_state import open_sqlite
+from src.config.settings import (
+    RERANK_ENABLED,
+    CANDIDATE_VECTOR_STORE_DIR,
+    CANDIDATE_VECTOR_STORE_MAX_ROWS
+)
+
+# 行列ファイルを拡張する際の最小行数
+MIN_CAPACITY = 1024
+
+class CandidateVectorStore:
+    """
+    検索候補のベクトルを正規化してfloat16のメモリマップ行列に保持するストア
+    行はSQLiteでベクトルIDと内容のハッシュに対応付け、上限に達したら古い行から再利用する
+    """
+
+    def __init__(self, dimension: int, directory: str = CANDIDATE_VECTOR_STORE_DIR, max_rows: int = CANDIDATE_VECTOR_STORE_MAX_ROWS):
+        self.dimension = dimension
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"vectors_{dimension}.float16")
+        self._conn = open_sqlite(os.path.join(directory, f"rows_{dimension}.sqlite3"))
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS candidate_vectors (
+                vector_id TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                row INTEGER NOT NULL UNIQUE
+            )
+            """
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS store_state (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.commit()
+
+        self.matrix = None
+        self.capacity = 0
+        if os.path.exists(self.path):
+            self.capacity = os.path.getsize(self.path) // (dimension * 2)
+            if self.capacity:
+                self.matrix = np.memmap(self.path, dtype=np.float16, mode="r+", shape=(self.capacity, dimension))
+
+    def _ensure_capacity(self, rows: int) -> None:
+        """行数が足りない場合は行列ファイルを拡張して開き直す（上限はmax_rows）"""
+        if rows <= self.capacity:
+            return
+        capacity = min(self.max_rows, max(MIN_CAPACITY, self.capacity * 2, rows))
+        if self.matrix is not None:
+            self.matrix.flush()
+            self.matrix = None
+        with open(self.path, "ab") as file:
+            file.truncate(capacity * self.dimension * 2)
+        self.matrix = np.memmap(self.path, dtype=np.float16, mode="r+", shape=(capacity, self.dimension))
+        self.capacity = capacity
+
+    def get_many(self, items: List[Tuple[str, str]]) -> Dict[str, np.ndarray]:
+        """(ベクトルID, 内容のハッシュ) のベクトルを取得（内容が変わったものと未保存のものは含まれない）"""
+        found: Dict[str, np.ndarray] = {}
+        if not items:
+            return found
+
+        expected = dict(items)
+        ids = list(expected)
+        with self._lock:
+            rows = []
+            # SQLiteのパラメータ数上限を超えないように分割して検索
+            for i in range(0, len(ids), 500):
+                id_batch = ids[i:i + 500]
+                placeholders = ",".join("?" * len(id_batch))
+                rows.extend(self._conn.execute(
+                    f"SELECT vector_id, content_hash, row FROM candidate_vectors WHERE vector_id IN ({placeholders})",
+                    id_batch
+                ).fetchall())
+            for vector_id, content_hash, row in rows:
+                if content_hash == expected[vector_id] and row < self.capacity:
+                    found[vector_id] = np.asarray(self.matrix[row], dtype=np.float32)
+            self.hits += len(found)
+            self.misses += len(ids) - len(found)
+        return found
+
+    def put_many(self, items: List[Tuple[str, str, List[float]]]) -> None:
+        """(ベクトルID, 内容のハッシュ, ベクトル) を正規化して保存（上限を超えた分は古い行を上書き）"""
+        # 同じIDは最後の値のみ保存し、1回で保存する件数は上限の行数までにする
+        items = list({vector_id: (vector_id, content_hash, vector) for vector_id, content_hash, vector in items}.values())[-self.max_rows:]
+        if not items:
+            return
+
+        vectors = np.asarray([vector for _, _, vector in items], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms > 0, norms, 1.0)
+
+        with self._lock:
+            next_row = self._conn.execute("SELECT value FROM store_state WHERE key = 'next_row'").fetchone()
+            next_row = next_row[0] if next_row else 0
+            assignments = []
+            for (vector_id, content_hash, _), vector in zip(items, vectors):
+                existing = self._conn.execute("SELECT row FROM candidate_vectors WHERE vector_id = ?", (vector_id,)).fetchone()
+                if existing:
+                    row = existing[0]
+                else:
+                    # 上限に達したら最も古く割り当てた行から再利用する
+                    row = next_row % self.max_rows
+                    next_row += 1
+                    self._conn.execute("DELETE FROM candidate_vectors WHERE row = ?", (row,))
+                assignments.append((vector_id, content_hash, row, vector))
+
+            self._ensure_capacity(max(row for _, _, row, _ in assignments) + 1)
+            for vector_id, content_hash, row, vector in assignments:
+                self.matrix[row] = vector
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO candidate_vectors (vector_id, content_hash, row) VALUES (?, ?, ?)",
+                    (vector_id, content_hash, row)
+                )
+            self.matrix.flush()
+            self._conn.execute("INSERT OR REPLACE INTO store_state (key, value) VALUES ('next_row', ?)", (next_row,))
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """保存件数とヒット・ミスの件数を取得"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM candidate_vectors").fetchone()[0]
+            return {"entries": entries, "max_rows": self.max_rows, "hits": self.hits, "misses": self.misses}
+
+_shared_stores: Dict[int, CandidateVectorStore] = {}
+_shared_store_failed = False
+_shared_store_lock = threading.Lock()
+
+def get_candidate_vector_store(dimension: int) -> Optional[CandidateVectorStore]:
+    """プロセス全体で共有する次元数ごとの候補ベクトルストアを取得（無効または初期化失敗時はNone）"""
+    global _shared_store_failed
+    if not RERANK_ENABLED or _shared_store_failed:
+        return None
+
+    with _shared_store_lock:
+        if dimension not in _shared_stores:
+            try:
+                _shared_stores[dimension] = CandidateVectorStore(dimension)
+            except Exception as e:
+                # 再ランキングできなくても検索結果は返せるようにする
+                print(f"候補ベクトルストアの初期化に失敗しました（再ランキングなしで続行します）: {str(e)}")
+                _shared_store_failed = True
+                return None
+        return _shared_stores[dimension]
@@ -1,6 +1,7 @@
 from typing import Dict, List, Tuple, Optional
 from openai import OpenAI
 from src.config.settings import OPENAI_API_KEY, METADATA_CATEGORIES
+from src.services.retry_scheduler import get_retry_scheduler
 import json
 import streamlit as st
 
@@ -10,7 +11,9 @@ class CategoryClassifier:
         if not OPENAI_API_KEY:
             raise ValueError("OpenAI APIキーが設定されていません")
         
-        self.openai_client = OpenAI(api_key=OPENAI_API_KEY)
+        # 再試行は共有の再試行スケジューラーで行うため、クライアント側では再試行しない
+        self.openai_client = OpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+        self.retry = get_retry_scheduler()
         self.categories = METADATA_CATEGORIES
 
     def classify_text(self, text: str) -> Dict[str, str]:
@@ -44,7 +47,10 @@ class CategoryClassifier:
 """
 
             # OpenAI APIを呼び出し
-            response = self.openai_client.chat.completions.create(
+            response = self.retry.call(
+                "openai.chat",
+                self.openai_client.chat.completions.create,
+                description="カテゴリの分類",
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": "あなたは不動産・地域情報の専門家です。テキストを分析して適切なカテゴリを分類してください。"},
@@ -0,0 +1,130 @@
+from typing import List, Dict, Any, Optional
+import json
+import threading
+import time
+from src.utils.local_state import open_sqlite
+from src.config.settings import (
+    SLIM_METADATA,
+    DOCUMENT_STORE_PATH,
+    DOCUMENT_STORE_FIELDS
+)
+
+class DocumentStore:
+    def __init__(self, path: str = DOCUMENT_STORE_PATH, fields: List[str] = None):
+        """ベクトルIDをキーにテキストなどの大きなメタデータを保存するストアの初期化"""
+        self.path = path
+        self.fields = list(fields or DOCUMENT_STORE_FIELDS)
+        self._lock = threading.Lock()
+        self._conn = open_sqlite(path)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                namespace TEXT NOT NULL,
+                vector_id TEXT NOT NULL,
+                fields TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (namespace, vector_id)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def slim_metadata(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """メタデータからPineconeに保存する小さなフィールドのみを取り出す"""
+        return {key: value for key, value in metadata.items() if key not in self.fields}
+
+    def put_many(self, namespace: Optional[str], vectors: List[Dict[str, Any]]) -> None:
+        """アップロードするベクトルのメタデータから大きなフィールドを保存"""
+        now = time.time()
+        rows = [
+            (
+                namespace or "",
+                vector["id"],
+                json.dumps({field: vector["metadata"][field] for field in self.fields if field in vector["metadata"]}, ensure_ascii=False),
+                now
+            )
+            for vector in vectors
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO documents (namespace, vector_id, fields, updated_at) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def get_many(self, namespace: Optional[str], vector_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """ベクトルIDに対応するフィールドをまとめて取得"""
+        found = {}
+        with self._lock:
+            for i in range(0, len(vector_ids), 500):
+                id_batch = vector_ids[i:i + 500]
+                placeholders = ",".join("?" * len(id_batch))
+                rows = self._conn.execute(
+                    f"SELECT vector_id, fields FROM documents WHERE namespace = ? AND vector_id IN ({placeholders})",
+                    [namespace or ""] + id_batch
+                ).fetchall()
+                for vector_id, fields in rows:
+                    found[vector_id] = json.loads(fields)
+        return found
+
+    def hydrate(self, namespace: Optional[str], items: List[Any]) -> None:
+        """検索結果や取得したベクトルのメタデータにローカルのフィールドを補完（itemsはid・metadataを持つオブジェクト）"""
+        targets = [item for item in items if item.metadata is not None and "text" not in item.metadata]
+        if not targets:
+            return
+
+        documents = self.get_many(namespace, [item.id for item in targets])
+        missing = 0
+        for item in targets:
+            document = documents.get(item.id)
+            if document is None:
+                missing += 1
+                document = {}
+            item.metadata.update(document)
+            # 参照側でKeyErrorにならないように欠けたフィールドを補う
+            item.metadata.setdefault("text", "")
+            item.metadata.setdefault("answer_examples", [])
+
+        if missing:
+            print(f"警告: {missing}件のベクトルのテキストがドキュメントストアに見つかりませんでした")
+
+    def delete(self, namespace: Optional[str], vector_ids: List[str]) -> None:
+        """指定されたベクトルIDのドキュメントを削除"""
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM documents WHERE namespace = ? AND vector_id = ?",
+                [(namespace or "", vector_id) for vector_id in vector_ids]
+            )
+            self._conn.commit()
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        """namespaceのドキュメントを全件削除"""
+        with self._lock:
+            self._conn.execute("DELETE FROM documents WHERE namespace = ?", (namespace or "",))
+            self._conn.commit()
+
+    def count(self) -> int:
+        """保存されているドキュメント数を取得"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+_shared_store: Optional[DocumentStore] = None
+_shared_store_failed = False
+_shared_store_lock = threading.Lock()
+
+def get_document_store() -> Optional[DocumentStore]:
+    """プロセス全体で共有するドキュメントストアを取得（SLIM_METADATAが無効または初期化失敗時はNone）"""
+    global _shared_store, _shared_store_failed
+    if not SLIM_METADATA or _shared_store_failed:
+        return None
+
+    with _shared_store_lock:
+        if _shared_store is None:
+            try:
+                _shared_store = DocumentStore()
+            except Exception as e:
+                # ストアが使えない場合はメタデータをそのままPineconeに保存する
+                print(f"ドキュメントストアの初期化に失敗しました（メタデータをPineconeに保存します）: {str(e)}")
+                _shared_store_failed = True
+                return None
+        return _shared_store
@@ -0,0 +1,163 @@
+from typing import List, Dict, Any, Optional, Tuple
+import hashlib
+import threading
+import time
+import unicodedata
+from src.utils.local_state import open_sqlite, encode_vector, decode_vector
+from src.config.settings import (
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_MAX_ENTRIES
+)
+
+class EmbeddingCache:
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        """埋め込みキャッシュの初期化（SQLiteにモデル・次元数・正規化テキストのハッシュをキーとして保存）"""
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self._conn = open_sqlite(path)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                dimensions INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """キャッシュキー用にテキストを正規化（全角・半角の揺れと前後の空白を吸収）"""
+        return unicodedata.normalize("NFKC", text).strip()
+
+    def make_key(self, model: str, dimensions: int, text: str) -> str:
+        """モデル・次元数・正規化テキストからキャッシュキーを作成"""
+        source = f"{model}\0{dimensions}\0{self.normalize_text(text)}"
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+    def get(self, model: str, dimensions: int, text: str) -> Optional[List[float]]:
+        """キャッシュから埋め込みベクトルを取得（存在しない場合はNone）"""
+        return self.get_many(model, dimensions, [text])[0]
+
+    def get_many(self, model: str, dimensions: int, texts: List[str]) -> List[Optional[List[float]]]:
+        """複数テキストの埋め込みベクトルをまとめて取得"""
+        if not texts:
+            return []
+
+        keys = [self.make_key(model, dimensions, text) for text in texts]
+        unique_keys = list(dict.fromkeys(keys))
+        found: Dict[str, List[float]] = {}
+
+        with self._lock:
+            # SQLiteのパラメータ数上限を超えないように分割して検索
+            for i in range(0, len(unique_keys), 500):
+                key_batch = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(key_batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    key_batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = decode_vector(blob)
+
+            # LRUのために最終アクセス時刻を更新
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+            results = [found.get(key) for key in keys]
+            hit_count = sum(1 for result in results if result is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+
+        return results
+
+    def put(self, model: str, dimensions: int, text: str, vector: List[float]) -> None:
+        """埋め込みベクトルをキャッシュに保存"""
+        self.put_many(model, dimensions, [(text, vector)])
+
+    def put_many(self, model: str, dimensions: int, items: List[Tuple[str, List[float]]]) -> None:
+        """複数の埋め込みベクトルをまとめて保存し、上限を超えた分を古い順に削除"""
+        if not items:
+            return
+
+        now = time.time()
+        rows = [
+            (self.make_key(model, dimensions, text), model, dimensions, encode_vector(vector), now)
+            for text, vector in items
+            if vector is not None
+        ]
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, dimensions, vector, last_access) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """最大件数を超えた場合に最終アクセスが古いものから削除"""
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                (overflow,)
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """キャッシュのヒット率と件数を取得"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "path": self.path
+            }
+
+    def clear(self) -> None:
+        """キャッシュを全件削除"""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+_shared_cache: Optional[EmbeddingCache] = None
+_shared_cache_failed = False
+_shared_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """プロセス全体で共有する埋め込みキャッシュを取得（無効または初期化失敗時はNone）"""
+    global _shared_cache, _shared_cache_failed
+    if not EMBEDDING_CACHE_ENABLED or _shared_cache_failed:
+        return None
+
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            try:
+                _shared_cache = EmbeddingCache()
+            except Exception as e:
+                # キャッシュが使えなくても埋め込み自体は行えるようにする
+                print(f"埋め込みキャッシュの初期化に失敗しました（キャッシュなしで続行します）: {str(e)}")
+                _shared_cache_failed = True
+                return None
+        return _shared_cache
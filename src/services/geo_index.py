@@ -0,0 +1,257 @@
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+import math
+import numpy as np
+from src.config.settings import (
+    GEO_GRID_CELL_DEGREES,
+    GEO_DEFAULT_RADIUS_METERS,
+    GEO_CONTEXT_TOP_K,
+    WALKING_METERS_PER_MINUTE
+)
+
+# 地球の平均半径（メートル）
+EARTH_RADIUS_METERS = 6_371_000.0
+# 緯度1度あたりの距離（メートル）
+METERS_PER_DEGREE = EARTH_RADIUS_METERS * math.pi / 180
+# 周辺施設についての質問と判定する語
+PROXIMITY_KEYWORDS = ["最寄", "近く", "近い", "周辺", "徒歩", "距離", "歩いて"]
+
+def haversine_distances(latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """1地点から複数地点までの距離（メートル）をまとめて計算（緯度経度は度で指定）"""
+    lat1 = math.radians(latitude)
+    lon1 = math.radians(longitude)
+    lat2 = np.radians(latitudes)
+    lon2 = np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def parse_coordinates(metadata: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    """メタデータから緯度・経度を取得（未設定や0.0の場合はNone）"""
+    try:
+        latitude = float(metadata.get("latitude") or 0.0)
+        longitude = float(metadata.get("longitude") or 0.0)
+    except (TypeError, ValueError):
+        return None
+    if (latitude == 0.0 and longitude == 0.0) or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return latitude, longitude
+
+class GeoIndex:
+    def __init__(self, cell_degrees: float = GEO_GRID_CELL_DEGREES):
+        """施設の位置情報をグリッドで管理する空間インデックスの初期化"""
+        self.cell_degrees = cell_degrees
+        self.ids: List[str] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self.latitudes = np.empty(0, dtype=np.float64)
+        self.longitudes = np.empty(0, dtype=np.float64)
+        self.category_codes: Dict[str, int] = {}
+        self.main_categories = np.empty(0, dtype=np.int32)
+        self.sub_categories = np.empty(0, dtype=np.int32)
+        self._cells: Dict[Tuple[int, int], np.ndarray] = {}
+        self._bounds = ((0, 0), (0, 0))
+
+    @classmethod
+    def build(cls, entries: Iterable[Dict[str, Any]], cell_degrees: float = GEO_GRID_CELL_DEGREES) -> "GeoIndex":
+        """{"id", "metadata"} 形式のエントリから位置情報を持つ施設のインデックスを作成"""
+        index = cls(cell_degrees)
+        latitudes = []
+        longitudes = []
+        for entry in entries:
+            coordinates = parse_coordinates(entry["metadata"])
+            if coordinates is None:
+                continue
+            index.ids.append(entry["id"])
+            index.metadata.append(entry["metadata"])
+            latitudes.append(coordinates[0])
+            longitudes.append(coordinates[1])
+
+        index.latitudes = np.asarray(latitudes, dtype=np.float64)
+        index.longitudes = np.asarray(longitudes, dtype=np.float64)
+        # カテゴリ名は整数のコードに変換して保持し、絞り込みを数値の比較で行う
+        index.main_categories = np.asarray([index._encode_category(metadata.get("main_category", "")) for metadata in index.metadata], dtype=np.int32)
+        index.sub_categories = np.asarray([index._encode_category(metadata.get("sub_category", "")) for metadata in index.metadata], dtype=np.int32)
+
+        if index.ids:
+            # 施設をセルごとにまとめ、セルの座標から位置の配列を引けるようにする
+            rows, columns = index._cell_of(index.latitudes, index.longitudes)
+            order = np.lexsort((columns, rows))
+            keys = np.stack([rows[order], columns[order]], axis=1)
+            boundaries = np.flatnonzero(np.any(np.diff(keys, axis=0) != 0, axis=1)) + 1
+            for positions in np.split(order, boundaries):
+                index._cells[(int(rows[positions[0]]), int(columns[positions[0]]))] = positions
+            index._bounds = ((int(rows.min()), int(rows.max())), (int(columns.min()), int(columns.max())))
+        return index
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _cell_of(self, latitudes, longitudes) -> Tuple[np.ndarray, np.ndarray]:
+        """緯度経度が含まれるセルの座標を取得"""
+        return (
+            np.floor(np.asarray(latitudes) / self.cell_degrees).astype(np.int64),
+            np.floor(np.asarray(longitudes) / self.cell_degrees).astype(np.int64)
+        )
+
+    def _encode_category(self, name: str) -> int:
+        """カテゴリ名を整数のコードに変換"""
+        return self.category_codes.setdefault(str(name or ""), len(self.category_codes))
+
+    def categories(self) -> List[str]:
+        """インデックスに含まれる大カテゴリ・中カテゴリの一覧を取得"""
+        return sorted(name for name in self.category_codes if name)
+
+    def _category_mask(self, positions: np.ndarray, categories: Optional[List[str]]) -> np.ndarray:
+        """指定されたカテゴリ（大カテゴリまたは中カテゴリ）に該当する位置を取得"""
+        if not categories:
+            return positions
+        selected = np.zeros(len(self.category_codes), dtype=bool)
+        selected[[self.category_codes[name] for name in categories if name in self.category_codes]] = True
+        matched = selected[self.main_categories[positions]] | selected[self.sub_categories[positions]]
+        return positions[matched]
+
+    def _gather(self, row_range: range, column_range: range) -> np.ndarray:
+        """範囲内のセルに含まれる施設の位置を取得"""
+        if len(row_range) * len(column_range) >= len(self._cells):
+            # 範囲がセルの総数より広い場合は全セルを走査する方が速い
+            cells = [
+                positions for (row, column), positions in self._cells.items()
+                if row in row_range and column in column_range
+            ]
+        else:
+            cells = [
+                self._cells[(row, column)]
+                for row in row_range for column in column_range
+                if (row, column) in self._cells
+            ]
+        return np.concatenate(cells) if cells else np.empty(0, dtype=np.int64)
+
+    def _ring(self, center_row: int, center_column: int, ring: int) -> np.ndarray:
+        """中心のセルからちょうどringセル離れたセルに含まれる施設の位置を取得"""
+        if ring == 0:
+            return self._cells.get((center_row, center_column), np.empty(0, dtype=np.int64))
+        cells = []
+        for row in range(center_row - ring, center_row + ring + 1):
+            step = 1 if abs(row - center_row) == ring else 2 * ring
+            for column in range(center_column - ring, center_column + ring + 1, step):
+                positions = self._cells.get((row, column))
+                if positions is not None:
+                    cells.append(positions)
+        return np.concatenate(cells) if cells else np.empty(0, dtype=np.int64)
+
+    def _results(self, positions: np.ndarray, distances: np.ndarray, limit: int = None) -> List[Dict[str, Any]]:
+        """位置と距離から検索結果を作成（距離の近い順に最大limit件）"""
+        if limit is not None and limit < len(distances):
+            # 上位limit件だけを部分ソートで取り出してから並べ替える
+            top = np.argpartition(distances, limit - 1)[:limit]
+            order = top[np.argsort(distances[top], kind="stable")]
+        else:
+            order = np.argsort(distances, kind="stable")
+        return [
+            {
+                "id": self.ids[positions[i]],
+                "distance": float(distances[i]),
+                "metadata": self.metadata[positions[i]]
+            }
+            for i in order
+        ]
+
+    def within_radius(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_meters: float = GEO_DEFAULT_RADIUS_METERS,
+        categories: List[str] = None
+    ) -> List[Dict[str, Any]]:
+        """指定地点から半径radius_meters以内の施設を近い順に取得"""
+        if not self.ids:
+            return []
+        delta_latitude = radius_meters / METERS_PER_DEGREE
+        delta_longitude = delta_latitude / max(math.cos(math.radians(latitude)), 1e-6)
+        (min_row, max_row), (min_column, max_column) = self._cell_of(
+            [latitude - delta_latitude, latitude + delta_latitude],
+            [longitude - delta_longitude, longitude + delta_longitude]
+        )
+        positions = self._category_mask(
+            self._gather(range(min_row, max_row + 1), range(min_column, max_column + 1)),
+            categories
+        )
+        distances = haversine_distances(latitude, longitude, self.latitudes[positions], self.longitudes[positions])
+        within = distances <= radius_meters
+        return self._results(positions[within], distances[within])
+
+    def nearest(self, latitude: float, longitude: float, k: int = GEO_CONTEXT_TOP_K, categories: List[str] = None) -> List[Dict[str, Any]]:
+        """指定地点から近い順にk件の施設を取得（中心のセルから外側へ順に探索）"""
+        if not self.ids or k <= 0:
+            return []
+        (center_row,), (center_column,) = self._cell_of([latitude], [longitude])
+        center_row, center_column = int(center_row), int(center_column)
+        (min_row, max_row), (min_column, max_column) = self._bounds
+        last_ring = max(center_row - min_row, max_row - center_row, center_column - min_column, max_column - center_column)
+
+        found = []
+        ring = 0
+        # 1周あたりのセル数がセルの総数を超える場合は全件から計算する方が速い
+        while ring <= last_ring and 8 * ring <= len(self._cells):
+            positions = self._category_mask(self._ring(center_row, center_column, ring), categories)
+            if len(positions):
+                found.append(positions)
+            if sum(len(positions) for positions in found) >= k or ring == last_ring:
+                candidates = np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+                distances = haversine_distances(latitude, longitude, self.latitudes[candidates], self.longitudes[candidates])
+                if ring == last_ring:
+                    return self._results(candidates, distances, k)
+                # 探索済みの範囲の外にある施設は少なくともringセル分離れているため、k件目がそれより近ければ確定
+                kth_distance = np.partition(distances, k - 1)[k - 1]
+                covered_degrees = ring * self.cell_degrees
+                covered_meters = covered_degrees * METERS_PER_DEGREE * math.cos(math.radians(min(89.0, abs(latitude) + covered_degrees)))
+                if kth_distance <= covered_meters:
+                    return self._results(candidates, distances, k)
+            ring += 1
+
+        positions = self._category_mask(np.arange(len(self.ids)), categories)
+        distances = haversine_distances(latitude, longitude, self.latitudes[positions], self.longitudes[positions])
+        return self._results(positions, distances, k)
+
+    def match_categories(self, text: str) -> List[str]:
+        """テキストに含まれるカテゴリ名を取得（長い名前を優先し、包含される短い名前は除外）"""
+        matched = []
+        for name in sorted(self.categories(), key=len, reverse=True):
+            if name in text and not any(name in longer for longer in matched):
+                matched.append(name)
+        return matched
+
+    def describe_surroundings(
+        self,
+        latitude: float,
+        longitude: float,
+        query: str,
+        top_k: int = GEO_CONTEXT_TOP_K,
+        radius_meters: float = GEO_DEFAULT_RADIUS_METERS
+    ) -> str:
+        """質問に関係する周辺施設を距離付きのテキストにまとめる（関係しない質問の場合は空文字）"""
+        categories = self.match_categories(query)
+        sections = []
+        if categories:
+            # カテゴリが指定された質問は距離に関係なく最寄りの施設を返す
+            for category in categories:
+                results = self.nearest(latitude, longitude, top_k, [category])
+                if results:
+                    sections.append((f"【{category}】最寄り{len(results)}件", results))
+        elif any(keyword in query for keyword in PROXIMITY_KEYWORDS):
+            results = self.within_radius(latitude, longitude, radius_meters)[:top_k]
+            if results:
+                sections.append((f"【半径{int(radius_meters)}m以内】{len(results)}件", results))
+
+        if not sections:
+            return ""
+
+        lines = [f"物件の位置（緯度{latitude}, 経度{longitude}）からの直線距離で計算した周辺施設:"]
+        for title, results in sections:
+            lines.append(title)
+            for result in results:
+                metadata = result["metadata"]
+                name = metadata.get("facility_name") or metadata.get("text", "")[:30]
+                category = "/".join(value for value in (metadata.get("main_category"), metadata.get("sub_category")) if value)
+                distance = result["distance"]
+                walking_minutes = max(1, math.ceil(distance / WALKING_METERS_PER_MINUTE))
+                lines.append(f"- {name}（{category}）: 約{int(round(distance))}m（徒歩約{walking_minutes}分）")
+        return "\n".join(lines)
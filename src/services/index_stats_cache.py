@@ -0,0 +1,68 @@
+from typing import Any, Callable, Dict, Optional
+import threading
+import time
+from src.config.settings import INDEX_STATS_CACHE_TTL
+
+class IndexStatsCache:
+    """describe_index_statsの結果をTTLの間保持するキャッシュ"""
+
+    def __init__(self, ttl_seconds: float = INDEX_STATS_CACHE_TTL):
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._stats: Any = None
+        self._fetched_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def get(self, fetch: Callable[[], Any], force: bool = False) -> Any:
+        """キャッシュが有効ならその値を、期限切れまたはforce指定時はfetchを呼び出して取得"""
+        with self._lock:
+            if not force and self._is_fresh():
+                self.hits += 1
+                return self._stats
+            self.misses += 1
+            # 同時に複数のスレッドから呼ばれても取得は1回にする
+            self._stats = fetch()
+            self._fetched_at = time.monotonic()
+            return self._stats
+
+    def _is_fresh(self) -> bool:
+        """キャッシュがTTL内かを確認（ロックを取得した状態で呼び出す）"""
+        return (
+            self._fetched_at is not None
+            and self.ttl_seconds > 0
+            and time.monotonic() - self._fetched_at < self.ttl_seconds
+        )
+
+    def invalidate(self) -> None:
+        """書き込み後などにキャッシュを破棄"""
+        with self._lock:
+            self._stats = None
+            self._fetched_at = None
+
+    def age_seconds(self) -> Optional[float]:
+        """キャッシュされた値を取得してからの経過秒数（未取得の場合はNone）"""
+        with self._lock:
+            if self._fetched_at is None:
+                return None
+            return time.monotonic() - self._fetched_at
+
+    def info(self) -> Dict[str, Any]:
+        """キャッシュの状態を取得"""
+        age = self.age_seconds()
+        return {
+            "ttl_seconds": self.ttl_seconds,
+            "age_seconds": round(age, 1) if age is not None else None,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+_shared_caches: Dict[str, IndexStatsCache] = {}
+_shared_caches_lock = threading.Lock()
+
+def get_index_stats_cache(index_name: str) -> IndexStatsCache:
+    """インデックスごとにプロセス全体で共有する統計情報キャッシュを取得"""
+    with _shared_caches_lock:
+        if index_name not in _shared_caches:
+            _shared_caches[index_name] = IndexStatsCache()
+        return _shared_caches[index_name]
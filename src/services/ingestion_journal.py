@@ -0,0 +1,155 @@
+from typing import List, Dict, Any, Optional, Set, Tuple
+import hashlib
+import json
+import threading
+import time
+from src.utils.local_state import open_sqlite, encode_vector, decode_vector
+from src.utils.chunk_ids import make_content_hash
+from src.config.settings import (
+    CONTENT_HASH_EXCLUDED_FIELDS,
+    INGESTION_JOURNAL_ENABLED,
+    INGESTION_JOURNAL_PATH,
+    INGESTION_JOURNAL_RETENTION_DAYS
+)
+
+class IngestionJournal:
+    def __init__(self, path: str = INGESTION_JOURNAL_PATH, retention_days: int = INGESTION_JOURNAL_RETENTION_DAYS):
+        """アップロードの進捗を記録するジャーナルの初期化"""
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = open_sqlite(path)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                namespace TEXT,
+                total_chunks INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                job_id TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                state TEXT NOT NULL,
+                vector BLOB,
+                metadata TEXT,
+                PRIMARY KEY (job_id, chunk_id)
+            );
+            """
+        )
+        self._conn.commit()
+        self._prune(retention_days)
+
+    @staticmethod
+    def make_job_id(chunks: List[Dict[str, Any]], metadatas: List[Dict[str, Any]], namespace: str = None) -> str:
+        """namespaceとチャンクID・アップロードするメタデータからジョブIDを作成（同じアップロードは同じIDになる）"""
+        digest = hashlib.sha256()
+        digest.update(f"{namespace or ''}\n".encode("utf-8"))
+        # メタデータだけを変更した場合も別のジョブにし、記録済みの古いメタデータで再開しないようにする
+        for chunk, metadata in sorted(zip(chunks, metadatas), key=lambda item: str(item[0]["id"])):
+            metadata_hash = make_content_hash(metadata, CONTENT_HASH_EXCLUDED_FIELDS)
+            digest.update(f"{chunk['id']}:{metadata_hash}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def start(self, job_id: str, namespace: str, total_chunks: int) -> bool:
+        """ジョブを開始（既存のジョブを再開する場合はTrue）"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT job_id FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row:
+                self._conn.execute("UPDATE jobs SET updated_at = ? WHERE job_id = ?", (now, job_id))
+            else:
+                self._conn.execute(
+                    "INSERT INTO jobs (job_id, namespace, total_chunks, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (job_id, namespace or "", total_chunks, now, now)
+                )
+            self._conn.commit()
+            return row is not None
+
+    def upserted_ids(self, job_id: str) -> Set[str]:
+        """アップロード済みのチャンクIDを取得"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id FROM chunks WHERE job_id = ? AND state = 'upserted'",
+                (job_id,)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def load_embedded(self, job_id: str, chunk_ids: List[str]) -> Dict[str, Tuple[List[float], Dict[str, Any]]]:
+        """埋め込み済み（未アップロード）のベクトルとメタデータを取得"""
+        found = {}
+        with self._lock:
+            for i in range(0, len(chunk_ids), 500):
+                id_batch = chunk_ids[i:i + 500]
+                placeholders = ",".join("?" * len(id_batch))
+                rows = self._conn.execute(
+                    f"SELECT chunk_id, vector, metadata FROM chunks "
+                    f"WHERE job_id = ? AND state = 'embedded' AND chunk_id IN ({placeholders})",
+                    [job_id] + id_batch
+                ).fetchall()
+                for chunk_id, blob, metadata in rows:
+                    found[chunk_id] = (decode_vector(blob), json.loads(metadata))
+        return found
+
+    def record_embedded(self, job_id: str, vectors: List[Dict[str, Any]]) -> None:
+        """埋め込みが完了したベクトルを記録"""
+        rows = [
+            (job_id, vector["id"], "embedded", encode_vector(vector["values"]), json.dumps(vector["metadata"], ensure_ascii=False))
+            for vector in vectors
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO chunks (job_id, chunk_id, state, vector, metadata) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def record_upserted(self, job_id: str, chunk_ids: List[str]) -> None:
+        """アップロードが完了したチャンクを記録（ベクトルは不要になるため削除）"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO chunks (job_id, chunk_id, state) VALUES (?, ?, 'upserted') "
+                "ON CONFLICT (job_id, chunk_id) DO UPDATE SET state = 'upserted', vector = NULL, metadata = NULL",
+                [(job_id, chunk_id) for chunk_id in chunk_ids]
+            )
+            self._conn.execute("UPDATE jobs SET updated_at = ? WHERE job_id = ?", (time.time(), job_id))
+            self._conn.commit()
+
+    def finish(self, job_id: str) -> None:
+        """完了したジョブの記録を削除"""
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks WHERE job_id = ?", (job_id,))
+            self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            self._conn.commit()
+
+    def _prune(self, retention_days: int) -> None:
+        """保持期間を過ぎた未完了ジョブを削除"""
+        threshold = time.time() - retention_days * 86400
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM chunks WHERE job_id IN (SELECT job_id FROM jobs WHERE updated_at < ?)",
+                (threshold,)
+            )
+            self._conn.execute("DELETE FROM jobs WHERE updated_at < ?", (threshold,))
+            self._conn.commit()
+
+_shared_journal: Optional[IngestionJournal] = None
+_shared_journal_failed = False
+_shared_journal_lock = threading.Lock()
+
+def get_ingestion_journal() -> Optional[IngestionJournal]:
+    """プロセス全体で共有するジャーナルを取得（無効または初期化失敗時はNone）"""
+    global _shared_journal, _shared_journal_failed
+    if not INGESTION_JOURNAL_ENABLED or _shared_journal_failed:
+        return None
+
+    with _shared_journal_lock:
+        if _shared_journal is None:
+            try:
+                _shared_journal = IngestionJournal()
+            except Exception as e:
+                # ジャーナルが使えなくてもアップロード自体は行えるようにする
+                print(f"アップロードジャーナルの初期化に失敗しました（ジャーナルなしで続行します）: {str(e)}")
+                _shared_journal_failed = True
+                return None
+        return _shared_journal
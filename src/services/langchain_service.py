@@ -1,9 +1,9 @@
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_pinecone import PineconeVectorStore
 from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.schema import HumanMessage, AIMessage, SystemMessage
+from langchain.schema import HumanMessage, AIMessage, SystemMessage, Document
 import os
 import tiktoken
 from openai import OpenAI
@@ -11,6 +11,8 @@ from src.config.settings import (
     PINECONE_API_KEY,
     PINECONE_INDEX_NAME,
     OPENAI_API_KEY,
+    EMBEDDING_MODEL,
+    SLIM_METADATA,
     DEFAULT_TOP_K,
     SIMILARITY_THRESHOLD,
     DEFAULT_SYSTEM_PROMPT,
@@ -18,39 +20,98 @@ from src.config.settings import (
 )
 import streamlit as st
 from src.services.advanced_search_service import AdvancedSearchService
+from src.services.embedding_cache import get_embedding_cache
+from src.services.retry_scheduler import get_retry_scheduler
+from src.services.local_index import LocalIndex
 
-class LangChainService:
-    def __init__(self, callback_manager=None):
-        """LangChainサービスの初期化"""
+class CachedOpenAIEmbeddings(OpenAIEmbeddings):
+    """埋め込みキャッシュを共有するOpenAIEmbeddings"""
+
+    def embed_query(self, text: str) -> List[float]:
+        """クエリの埋め込みベクトルを取得（キャッシュにあればAPIを呼び出さない）"""
+        return self.embed_documents([text])[0]
+
+    def _embed_uncached(self, texts: List[str], chunk_size: int = None) -> List[List[float]]:
+        """APIで埋め込みベクトルを取得（共有の再試行スケジューラーで再試行する）"""
+        embed_documents = super().embed_documents
+        if chunk_size is not None:
+            return get_retry_scheduler().call("openai.embeddings", embed_documents, texts, chunk_size, description="埋め込みベクトルの生成")
+        return get_retry_scheduler().call("openai.embeddings", embed_documents, texts, description="埋め込みベクトルの生成")
+
+    def embed_documents(self, texts: List[str], chunk_size: int = None) -> List[List[float]]:
+        """複数テキストの埋め込みベクトルを取得（キャッシュにないものだけAPIに送信）"""
+        cache = get_embedding_cache()
+        if not cache:
+            return self._embed_uncached(texts, chunk_size)
+        
+        vectors = cache.get_many(self.model, self.dimensions, texts)
+        missing_indices = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing_indices:
+            missing_texts = [texts[i] for i in missing_indices]
+            new_vectors = self._embed_uncached(missing_texts, chunk_size)
+            for i, vector in zip(missing_indices, new_vectors):
+                vectors[i] = vector
+            cache.put_many(self.model, self.dimensions, list(zip(missing_texts, new_vectors)))
+        return vectors
+
+class ChatResources:
+    """セッション間で共有できるチャット用のクライアント（LLM・埋め込み・ベクトルストア・検索サービス）"""
+
+    def __init__(self, callback_manager=None, pinecone_service=None, openai_client: OpenAI = None):
+        """共有リソースの初期化（渡されたサービスやクライアントは作り直さずに使用する）"""
         # OpenAIクライアントの初期化
-        self.openai_client = OpenAI(api_key=OPENAI_API_KEY)
+        self.openai_client = openai_client or OpenAI(api_key=OPENAI_API_KEY, max_retries=0)
         
-        # チャットモデルの初期化
+        # チャットモデルの初期化（再試行は共有の再試行スケジューラーで行う）
         self.llm = ChatOpenAI(
             api_key=OPENAI_API_KEY,
             model_name="gpt-4o-mini",
             temperature=0.85,
+            max_retries=0,
             callback_manager=callback_manager
         )
         
-        # 埋め込みモデルの初期化
-        self.embeddings = OpenAIEmbeddings(
+        # Pineconeサービスの初期化（埋め込みの次元数をインデックスに合わせるため先に作成）
+        if pinecone_service is None:
+            from src.services.pinecone_service import PineconeService
+            pinecone_service = PineconeService(openai_client=self.openai_client)
+        self.pinecone_service = pinecone_service
+        
+        # 埋め込みモデルの初期化（PineconeServiceと同じキャッシュ・次元数を共有）
+        self.embeddings = CachedOpenAIEmbeddings(
             api_key=OPENAI_API_KEY,
-            model="text-embedding-3-large",
-            dimensions=3072
+            model=EMBEDDING_MODEL,
+            dimensions=pinecone_service.embedding_dimension,
+            max_retries=0
         )
         
         # トークンカウンターの初期化
         self.encoding = tiktoken.encoding_for_model("gpt-4")
         
-        # PineconeのAPIキーを環境変数に設定
-        os.environ["PINECONE_API_KEY"] = PINECONE_API_KEY
+        # Pineconeベクトルストアの初期化（ローカルのインデックスではPineconeServiceで検索する）
+        self.vectorstore = None
+        if not isinstance(pinecone_service.index, LocalIndex):
+            # PineconeのAPIキーを環境変数に設定
+            os.environ["PINECONE_API_KEY"] = PINECONE_API_KEY
+            self.vectorstore = PineconeVectorStore.from_existing_index(
+                index_name=PINECONE_INDEX_NAME,
+                embedding=self.embeddings
+            )
         
-        # Pineconeベクトルストアの初期化
-        self.vectorstore = PineconeVectorStore.from_existing_index(
-            index_name=PINECONE_INDEX_NAME,
-            embedding=self.embeddings
-        )
+        # 高度な検索サービスの初期化
+        self.advanced_search = AdvancedSearchService(pinecone_service, openai_client=self.openai_client)
+
+class LangChainService:
+    def __init__(self, callback_manager=None, resources: ChatResources = None):
+        """LangChainサービスの初期化（共有リソースを渡した場合はセッション固有の状態のみ作成）"""
+        resources = resources or ChatResources(callback_manager)
+        self.openai_client = resources.openai_client
+        self.llm = resources.llm
+        self.pinecone_service = resources.pinecone_service
+        self.embeddings = resources.embeddings
+        self.encoding = resources.encoding
+        self.vectorstore = resources.vectorstore
+        self.advanced_search = resources.advanced_search
         
         # チャット履歴の初期化
         self.message_history = ChatMessageHistory()
@@ -59,11 +120,6 @@ class LangChainService:
         self.system_prompt = DEFAULT_SYSTEM_PROMPT
         self.response_template = DEFAULT_RESPONSE_TEMPLATE
         
-        # 高度な検索サービスの初期化
-        from src.services.pinecone_service import PineconeService
-        pinecone_service = PineconeService()
-        self.advanced_search = AdvancedSearchService(pinecone_service)
-        
         # 検索モードの設定（デフォルトは高度な検索）
         self.use_advanced_search = True
 
@@ -111,14 +167,14 @@ class LangChainService:
         """テキストのトークン数をカウント"""
         return len(self.encoding.encode(text))
 
-    def get_relevant_context(self, query: str, top_k: int = DEFAULT_TOP_K) -> Tuple[str, List[Dict[str, Any]], int]:
-        """クエリに関連する文脈を取得（高度な検索を使用）"""
+    def get_relevant_context(self, query: str, top_k: int = DEFAULT_TOP_K, filter: Dict[str, Any] = None, city: str = None) -> Tuple[str, List[Dict[str, Any]], int]:
+        """クエリに関連する文脈を取得（高度な検索を使用。filterはPineconeのメタデータフィルター、cityは検索する市区町村のnamespace）"""
         try:
             # 高度な検索を使用するかどうかを確認
             if self.use_advanced_search:
-                return self._get_context_with_advanced_search(query, top_k)
+                return self._get_context_with_advanced_search(query, top_k, filter, city)
             else:
-                return self._get_context_with_basic_search(query, top_k)
+                return self._get_context_with_basic_search(query, top_k, filter, city)
                 
         except Exception as e:
             error_message = str(e)
@@ -140,12 +196,12 @@ class LangChainService:
                     "エラータイプ": "Unknown Error"
                 }], 0
 
-    def _get_context_with_advanced_search(self, query: str, top_k: int) -> Tuple[str, List[Dict[str, Any]], int]:
+    def _get_context_with_advanced_search(self, query: str, top_k: int, filter: Dict[str, Any] = None, city: str = None) -> Tuple[str, List[Dict[str, Any]], int]:
         """高度な検索を使用してコンテキストを取得"""
         print(f"\n=== 高度な検索を使用 ===")
         
         # マルチステップ検索を実行
-        search_results = self.advanced_search.multi_step_search(query)
+        search_results = self.advanced_search.multi_step_search(query, filter=filter, city=city)
         
         # 検索分析情報を取得
         analytics = self.advanced_search.get_search_analytics(search_results)
@@ -185,7 +241,7 @@ class LangChainService:
         
         return context_text, search_details, context_tokens
 
-    def _get_context_with_basic_search(self, query: str, top_k: int) -> Tuple[str, List[Dict[str, Any]], int]:
+    def _get_context_with_basic_search(self, query: str, top_k: int, filter: Dict[str, Any] = None, city: str = None) -> Tuple[str, List[Dict[str, Any]], int]:
         """基本的な検索を使用してコンテキストを取得（従来の方法）"""
         print(f"\n=== 基本的な検索を使用 ===")
         
@@ -201,7 +257,15 @@ class LangChainService:
         query_vector = self.embeddings.embed_query(query)
         
         # 検索を実行
-        docs = self.vectorstore.similarity_search_with_score(query, k=top_k)
+        if SLIM_METADATA or self.vectorstore is None or self.pinecone_service.route_query_namespaces(city) != [None]:
+            # Pineconeにテキストがない場合やローカルのバックエンド、市区町村ごとのnamespaceがある場合は、PineconeServiceで検索する
+            results = self.pinecone_service.query(query, top_k=top_k, similarity_threshold=0.0, filter=filter, city=city)
+            docs = [
+                (Document(page_content=match.metadata.get("text", ""), metadata=match.metadata), match.score)
+                for match in results["matches"]
+            ]
+        else:
+            docs = self.vectorstore.similarity_search_with_score(query, k=top_k, filter=filter)
         
         # メタデータを簡略化して保持
         simplified_docs = []
@@ -269,13 +333,38 @@ class LangChainService:
         
         return context_text, search_details, context_tokens
 
+    def get_nearby_context(self, query: str, location: Optional[Tuple[float, float]], city: Optional[str] = None) -> str:
+        """物件の位置から質問に関係する周辺施設を空間インデックスで検索し、距離付きのテキストを返す（cityの検索対象のnamespaceが対象）"""
+        if not location:
+            return ""
+        try:
+            geo_index = self.pinecone_service.get_geo_index(city=city)
+            if not geo_index:
+                return ""
+            latitude, longitude = location
+            return geo_index.describe_surroundings(latitude, longitude, query)
+        except Exception as e:
+            # 周辺施設が取得できなくても通常の文脈検索で応答する
+            print(f"周辺施設の検索に失敗しました: {str(e)}")
+            return ""
+
     def set_search_mode(self, use_advanced: bool = True):
         """検索モードを設定"""
         self.use_advanced_search = use_advanced
         print(f"検索モードを {'高度な検索' if use_advanced else '基本的な検索'} に設定しました")
 
-    def get_response(self, query: str, system_prompt: str = None, response_template: str = None, property_info: str = None, chat_history: list = None) -> Tuple[str, Dict[str, Any]]:
-        """クエリに対する応答を生成"""
+    def get_response(
+        self,
+        query: str,
+        system_prompt: str = None,
+        response_template: str = None,
+        property_info: str = None,
+        chat_history: list = None,
+        filter: Dict[str, Any] = None,
+        location: Optional[Tuple[float, float]] = None,
+        city: Optional[str] = None
+    ) -> Tuple[str, Dict[str, Any]]:
+        """クエリに対する応答を生成（filterは文脈検索のメタデータフィルター、locationは物件の緯度・経度、cityは検索する市区町村のnamespace）"""
         try:
             # プロンプトの設定
             system_prompt = system_prompt or self.system_prompt
@@ -302,7 +391,14 @@ class LangChainService:
             chain = prompt | self.llm
             
             # 関連する文脈を取得
-            context, search_details, context_tokens = self.get_relevant_context(query)
+            context, search_details, context_tokens = self.get_relevant_context(query, filter=filter, city=city)
+            
+            # 物件の位置から計算した周辺施設の距離を文脈の先頭に加える
+            nearby_context = self.get_nearby_context(query, location, city)
+            if nearby_context:
+                context = f"{nearby_context}\n\n{context}" if context.strip() else nearby_context
+                context_tokens = self.count_tokens(context)
+                print(f"周辺施設の情報を参照文脈に追加しました（{self.count_tokens(nearby_context)}トークン）")
             
             # 参照文脈が空の場合の処理
             if not context.strip():
@@ -346,12 +442,12 @@ class LangChainService:
             print(query)
             
             # 応答を生成
-            response = chain.invoke({
+            response = get_retry_scheduler().call("openai.chat", chain.invoke, {
                 "chat_history": self.message_history.messages,
                 "context": context,
                 "property_info": property_info or "物件情報はありません。",
                 "input": query
-            })
+            }, description="応答の生成")
             
             # 応答のトークン数をカウント
             response_tokens = self.count_tokens(response.content)
@@ -378,6 +474,7 @@ class LangChainService:
                     "チャット履歴": [{"type": msg.type, "content": msg.content} for msg in self.message_history.messages],
                     "参照文脈": context,
                     "参照文脈の詳細": search_details,
+                    "周辺施設": nearby_context,
                     "物件情報": property_info,
                     "ユーザー入力": query
                 }
@@ -0,0 +1,515 @@
+from typing import List, Dict, Any, Optional, Iterable
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+from src.utils.local_state import open_sqlite
+from src.services.vector_enumerator import VectorRecord
+from src.config.settings import (
+    LOCAL_INDEX_METRIC,
+    LOCAL_INDEX_DTYPE,
+    LOCAL_INDEX_HNSW,
+    LOCAL_INDEX_HNSW_MIN_VECTORS
+)
+
+# 対応している類似度と保存形式
+SUPPORTED_METRICS = ["cosine", "dotproduct"]
+SUPPORTED_DTYPES = {"float32": np.float32, "float16": np.float16}
+# 行列ファイルを拡張する際の最小の行数
+MIN_CAPACITY = 1024
+# 全件検索で一度に内積を計算する行数（float16の場合はこの単位でfloat32に変換する）
+SEARCH_BLOCK_ROWS = 16384
+
+class NamespaceSummary:
+    """namespaceごとの統計情報（Pineconeと同じく属性と添字で参照できる）"""
+
+    def __init__(self, vector_count: int):
+        self.vector_count = vector_count
+
+    def __getitem__(self, key: str) -> Any:
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
+
+class LocalIndexStats:
+    """describe_index_statsの結果（Pineconeの応答と同じ属性を持つ）"""
+
+    def __init__(self, dimension: int, metric: str, namespaces: Dict[str, NamespaceSummary]):
+        self.dimension = dimension
+        self.metric = metric
+        self.namespaces = namespaces
+        self.total_vector_count = sum(summary.vector_count for summary in namespaces.values())
+        self.index_fullness = 0.0
+
+class LocalMatch(VectorRecord):
+    """検索結果の1件（Pineconeのmatchと同じくid・score・metadata・valuesを持つ）"""
+
+    def __init__(self, id: str, score: float, metadata: Optional[Dict[str, Any]] = None, values: Optional[List[float]] = None):
+        super().__init__(id, metadata, values)
+        self.score = score
+
+class LocalQueryResponse:
+    def __init__(self, matches: List[LocalMatch], namespace: str = ""):
+        self.matches = matches
+        self.namespace = namespace
+
+class LocalFetchResponse:
+    def __init__(self, vectors: Dict[str, VectorRecord], namespace: str = ""):
+        self.vectors = vectors
+        self.namespace = namespace
+
+class LocalPagination:
+    def __init__(self, next: str):
+        self.next = next
+
+class LocalListResponse:
+    def __init__(self, vectors: List[VectorRecord], pagination: Optional[LocalPagination]):
+        self.vectors = vectors
+        self.pagination = pagination
+
+def _compare(operator: str, value: Any, operand: Any, exists: bool) -> bool:
+    """メタデータの値1つに対してフィルターの演算子を評価"""
+    values = value if isinstance(value, list) else [value]
+    if operator == "$exists":
+        return exists == bool(operand)
+    if operator == "$eq":
+        return exists and operand in values
+    if operator == "$ne":
+        return not exists or operand not in values
+    if operator == "$in":
+        return exists and any(item in operand for item in values)
+    if operator == "$nin":
+        return not exists or not any(item in operand for item in values)
+    if operator in ("$gt", "$gte", "$lt", "$lte"):
+        if not exists or isinstance(value, (list, bool)) or not isinstance(value, (int, float)):
+            return False
+        if operator == "$gt":
+            return value > operand
+        if operator == "$gte":
+            return value >= operand
+        if operator == "$lt":
+            return value < operand
+        return value <= operand
+    raise ValueError(f"未対応のフィルター演算子です: {operator}")
+
+def matches_filter(metadata: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+    """Pineconeのメタデータフィルターの書式で条件に一致するかを判定"""
+    if not filter:
+        return True
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub_filter) for sub_filter in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, sub_filter) for sub_filter in condition):
+                return False
+        else:
+            # {"field": value} は {"field": {"$eq": value}} の省略形
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for operator, operand in condition.items():
+                if not _compare(operator, metadata.get(key), operand, key in metadata):
+                    return False
+    return True
+
+class _NamespaceMatrix:
+    """1つのnamespaceのベクトルを保持するメモリマップの行列と、行ごとのID・メタデータ"""
+
+    def __init__(self, path: str, dimension: int, dtype):
+        self.path = path
+        self.dimension = dimension
+        self.dtype = np.dtype(dtype)
+        self.ids: List[Optional[str]] = []
+        self.metadata: List[Optional[Dict[str, Any]]] = []
+        self.sparse: List[Optional[Dict[int, float]]] = []
+        self.rows: Dict[str, int] = {}
+        self.free_rows: List[int] = []
+        self.norms = np.zeros(0, dtype=np.float32)
+        self.live = np.zeros(0, dtype=bool)
+        self.matrix = None
+        self.capacity = 0
+        self.hnsw = None
+        self.hnsw_dirty = True
+        if os.path.exists(path):
+            self.capacity = os.path.getsize(path) // (dimension * self.dtype.itemsize)
+            if self.capacity:
+                self.matrix = np.memmap(path, dtype=self.dtype, mode="r+", shape=(self.capacity, dimension))
+                self.norms = np.zeros(self.capacity, dtype=np.float32)
+                self.live = np.zeros(self.capacity, dtype=bool)
+
+    @property
+    def size(self) -> int:
+        """使用済みの行数（削除済みの行を含む）"""
+        return len(self.ids)
+
+    def ensure_capacity(self, rows: int) -> None:
+        """行数が足りない場合は行列ファイルを拡張して開き直す"""
+        if rows <= self.capacity:
+            return
+        capacity = max(MIN_CAPACITY, self.capacity * 2, rows)
+        if self.matrix is not None:
+            self.matrix.flush()
+            self.matrix = None
+        with open(self.path, "ab") as file:
+            file.truncate(capacity * self.dimension * self.dtype.itemsize)
+        self.matrix = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=(capacity, self.dimension))
+        self.capacity = capacity
+        self.norms = np.concatenate([self.norms, np.zeros(capacity - len(self.norms), dtype=np.float32)])
+        self.live = np.concatenate([self.live, np.zeros(capacity - len(self.live), dtype=bool)])
+
+    def allocate_row(self, vector_id: str) -> int:
+        """ベクトルIDに行を割り当て（既存のIDは同じ行を上書き）"""
+        if vector_id in self.rows:
+            return self.rows[vector_id]
+        if self.free_rows:
+            row = self.free_rows.pop()
+        else:
+            row = self.size
+            self.ensure_capacity(row + 1)
+            self.ids.append(None)
+            self.metadata.append(None)
+            self.sparse.append(None)
+        self.ids[row] = vector_id
+        self.rows[vector_id] = row
+        self.live[row] = True
+        return row
+
+    def release_row(self, vector_id: str) -> Optional[int]:
+        """ベクトルIDの行を解放（存在しない場合はNone）"""
+        row = self.rows.pop(vector_id, None)
+        if row is None:
+            return None
+        self.ids[row] = None
+        self.metadata[row] = None
+        self.sparse[row] = None
+        self.norms[row] = 0.0
+        self.live[row] = False
+        self.matrix[row] = 0
+        self.free_rows.append(row)
+        return row
+
+    def live_rows(self) -> np.ndarray:
+        """削除されていない行の番号を取得"""
+        return np.flatnonzero(self.live[:self.size])
+
+    def values(self, row: int) -> List[float]:
+        """行のベクトルをfloat32のリストで取得"""
+        return np.asarray(self.matrix[row], dtype=np.float32).tolist()
+
+class LocalIndex:
+    """Pinecone Indexと同じメソッド（upsert・query・fetch・delete・describe_index_stats・list_paginated）を持つローカルのベクトルインデックス"""
+
+    def __init__(
+        self,
+        directory: str,
+        dimension: int,
+        metric: str = LOCAL_INDEX_METRIC,
+        dtype: str = LOCAL_INDEX_DTYPE,
+        use_hnsw: bool = LOCAL_INDEX_HNSW,
+        hnsw_min_vectors: int = LOCAL_INDEX_HNSW_MIN_VECTORS
+    ):
+        """ローカルインデックスの初期化（既存のインデックスがあれば次元数・類似度・保存形式はそれに合わせる）"""
+        self.directory = directory
+        self.use_hnsw = use_hnsw
+        self.hnsw_min_vectors = hnsw_min_vectors
+        self._lock = threading.RLock()
+        self._namespaces: Dict[str, _NamespaceMatrix] = {}
+        self._hnswlib = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._conn = open_sqlite(os.path.join(directory, "metadata.sqlite3"))
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS vectors (
+                namespace TEXT NOT NULL,
+                vector_id TEXT NOT NULL,
+                row INTEGER NOT NULL,
+                metadata TEXT NOT NULL,
+                sparse TEXT,
+                PRIMARY KEY (namespace, vector_id)
+            );
+            """
+        )
+        requested = {"dimension": str(dimension), "metric": metric, "dtype": dtype}
+        for key, value in requested.items():
+            self._conn.execute("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", (key, value))
+        self._conn.commit()
+        stored = dict(self._conn.execute("SELECT key, value FROM settings").fetchall())
+        for key, value in requested.items():
+            if stored[key] != value:
+                print(f"警告: ローカルインデックスの{key}は作成時の設定（{stored[key]}）を使用します（指定値: {value}）")
+
+        self.dimension = int(stored["dimension"])
+        self.metric = stored["metric"]
+        self.dtype = stored["dtype"]
+        if self.metric not in SUPPORTED_METRICS:
+            raise ValueError(f"ローカルインデックスが対応していない類似度です: {self.metric}（対応: {', '.join(SUPPORTED_METRICS)}）")
+        if self.dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"ローカルインデックスが対応していない保存形式です: {self.dtype}（対応: {', '.join(SUPPORTED_DTYPES)}）")
+        self._load()
+
+    def _matrix_path(self, namespace: str) -> str:
+        """namespaceの行列ファイルのパス（namespace名はハッシュにしてファイル名に使える形にする）"""
+        digest = hashlib.sha1(namespace.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, f"vectors_{digest}.{self.dtype}")
+
+    def _namespace(self, namespace: Optional[str], create: bool = False) -> Optional[_NamespaceMatrix]:
+        """namespaceの行列を取得（create指定時は存在しなければ作成）"""
+        key = namespace or ""
+        if key not in self._namespaces and create:
+            self._namespaces[key] = _NamespaceMatrix(self._matrix_path(key), self.dimension, SUPPORTED_DTYPES[self.dtype])
+        return self._namespaces.get(key)
+
+    def _load(self) -> None:
+        """SQLiteに保存したID・メタデータと行列ファイルからインデックスを復元"""
+        rows = self._conn.execute("SELECT namespace, vector_id, row, metadata, sparse FROM vectors ORDER BY namespace, row").fetchall()
+        for namespace, vector_id, row, metadata, sparse in rows:
+            data = self._namespace(namespace, create=True)
+            while data.size <= row:
+                data.ids.append(None)
+                data.metadata.append(None)
+                data.sparse.append(None)
+            data.ids[row] = vector_id
+            data.rows[vector_id] = row
+            data.metadata[row] = json.loads(metadata)
+            data.sparse[row] = {int(index): value for index, value in json.loads(sparse).items()} if sparse else None
+        for data in self._namespaces.values():
+            data.ensure_capacity(data.size)
+            data.free_rows = [row for row, vector_id in enumerate(data.ids) if vector_id is None]
+            data.live[:data.size] = [vector_id is not None for vector_id in data.ids]
+            if data.size:
+                data.norms[:data.size] = self._row_norms(data, np.arange(data.size))
+
+    @staticmethod
+    def _row_norms(data: _NamespaceMatrix, rows: np.ndarray) -> np.ndarray:
+        """行のベクトルのL2ノルムを計算"""
+        return np.linalg.norm(np.asarray(data.matrix[rows], dtype=np.float32), axis=1)
+
+    def upsert(self, vectors: Iterable[Dict[str, Any]], namespace: Optional[str] = None, **kwargs) -> Dict[str, int]:
+        """ベクトルを追加・更新（同じIDは上書き）"""
+        vectors = list(vectors)
+        for vector in vectors:
+            if len(vector["values"]) != self.dimension:
+                raise ValueError(f"ベクトルの次元数（{len(vector['values'])}）がインデックスの次元数（{self.dimension}）と一致しません: {vector['id']}")
+
+        with self._lock:
+            data = self._namespace(namespace, create=True)
+            rows = np.asarray([data.allocate_row(vector["id"]) for vector in vectors], dtype=np.int64)
+            if len(rows):
+                values = np.asarray([vector["values"] for vector in vectors], dtype=np.float32)
+                data.matrix[rows] = values.astype(data.dtype)
+                data.matrix.flush()
+                data.norms[rows] = np.linalg.norm(values, axis=1)
+
+            records = []
+            for row, vector in zip(rows.tolist(), vectors):
+                metadata = dict(vector.get("metadata") or {})
+                sparse_values = vector.get("sparse_values")
+                sparse = dict(zip(sparse_values["indices"], sparse_values["values"])) if sparse_values else None
+                data.metadata[row] = metadata
+                data.sparse[row] = sparse
+                records.append((
+                    namespace or "",
+                    vector["id"],
+                    row,
+                    json.dumps(metadata, ensure_ascii=False),
+                    json.dumps(sparse) if sparse else None
+                ))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vectors (namespace, vector_id, row, metadata, sparse) VALUES (?, ?, ?, ?, ?)",
+                records
+            )
+            self._conn.commit()
+            data.hnsw_dirty = True
+        return {"upserted_count": len(vectors)}
+
+    def query(
+        self,
+        vector: List[float],
+        top_k: int = 10,
+        namespace: Optional[str] = None,
+        filter: Optional[Dict[str, Any]] = None,
+        include_values: bool = False,
+        include_metadata: bool = False,
+        sparse_vector: Optional[Dict[str, List]] = None,
+        **kwargs
+    ) -> LocalQueryResponse:
+        """ベクトルに類似するベクトルを検索（フィルターや疎ベクトルがない場合は近似検索を使用可能）"""
+        with self._lock:
+            data = self._namespace(namespace)
+            if data is None or not data.rows or top_k <= 0:
+                return LocalQueryResponse([], namespace or "")
+
+            query_vector = np.asarray(vector, dtype=np.float32)
+            rows = scores = None
+            if not filter and not sparse_vector:
+                rows, scores = self._search_hnsw(data, query_vector, top_k)
+            if rows is None:
+                rows, scores = self._search_exact(data, query_vector, top_k, filter, sparse_vector)
+
+            matches = [
+                LocalMatch(
+                    id=data.ids[row],
+                    score=float(score),
+                    metadata=dict(data.metadata[row]) if include_metadata else None,
+                    values=data.values(row) if include_values else None
+                )
+                for row, score in zip(rows.tolist(), scores.tolist())
+            ]
+        return LocalQueryResponse(matches, namespace or "")
+
+    def _search_exact(
+        self,
+        data: _NamespaceMatrix,
+        query_vector: np.ndarray,
+        top_k: int,
+        filter: Optional[Dict[str, Any]],
+        sparse_vector: Optional[Dict[str, List]]
+    ) -> tuple:
+        """全件の内積を計算して上位top_k件の行とスコアを取得"""
+        rows = data.live_rows()
+        if filter:
+            rows = rows[np.asarray([matches_filter(data.metadata[row], filter) for row in rows.tolist()], dtype=bool)] if len(rows) else rows
+        if not len(rows):
+            return rows, np.zeros(0, dtype=np.float32)
+
+        scores = np.empty(len(rows), dtype=np.float32)
+        contiguous = rows[-1] - rows[0] + 1 == len(rows)
+        for start in range(0, len(rows), SEARCH_BLOCK_ROWS):
+            block_rows = rows[start:start + SEARCH_BLOCK_ROWS]
+            # 連続した行はスライスで参照し、不要なコピーを避ける
+            block = data.matrix[block_rows[0]:block_rows[-1] + 1] if contiguous else data.matrix[block_rows]
+            scores[start:start + len(block_rows)] = np.asarray(block, dtype=np.float32) @ query_vector
+
+        if self.metric == "cosine":
+            query_norm = float(np.linalg.norm(query_vector)) or 1.0
+            scores /= np.maximum(data.norms[rows], 1e-12) * query_norm
+        if sparse_vector and sparse_vector.get("indices"):
+            query_sparse = dict(zip(sparse_vector["indices"], sparse_vector["values"]))
+            for position, row in enumerate(rows.tolist()):
+                document_sparse = data.sparse[row]
+                if document_sparse:
+                    scores[position] += sum(value * document_sparse.get(index, 0.0) for index, value in query_sparse.items())
+
+        k = min(top_k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        order = top[np.argsort(-scores[top], kind="stable")]
+        return rows[order], scores[order]
+
+    def _search_hnsw(self, data: _NamespaceMatrix, query_vector: np.ndarray, top_k: int) -> tuple:
+        """hnswlibの近似検索で上位top_k件の行とスコアを取得（使用できない場合は (None, None)）"""
+        if not self.use_hnsw or len(data.rows) < self.hnsw_min_vectors:
+            return None, None
+        hnswlib = self._load_hnswlib()
+        if hnswlib is None:
+            return None, None
+
+        if data.hnsw is None or data.hnsw_dirty:
+            # 書き込みがあった後の最初の検索でグラフを作り直す
+            rows = data.live_rows()
+            graph = hnswlib.Index(space="cosine" if self.metric == "cosine" else "ip", dim=self.dimension)
+            graph.init_index(max_elements=max(len(rows), 1), ef_construction=200, M=16)
+            for start in range(0, len(rows), SEARCH_BLOCK_ROWS):
+                block_rows = rows[start:start + SEARCH_BLOCK_ROWS]
+                graph.add_items(np.asarray(data.matrix[block_rows], dtype=np.float32), block_rows)
+            data.hnsw = graph
+            data.hnsw_dirty = False
+            print(f"ローカルインデックスの近似検索用グラフを作成しました（{len(rows)}件）")
+
+        k = min(top_k, len(data.rows))
+        data.hnsw.set_ef(max(50, k * 2))
+        labels, distances = data.hnsw.knn_query(query_vector, k=k)
+        # hnswlibの距離は cosine: 1 - コサイン類似度、ip: 1 - 内積
+        return labels[0].astype(np.int64), (1.0 - distances[0]).astype(np.float32)
+
+    def _load_hnswlib(self):
+        """hnswlibを読み込む（インストールされていない場合はNoneを返し、全件検索を使用する）"""
+        if self._hnswlib is None:
+            try:
+                import hnswlib
+                self._hnswlib = hnswlib
+            except ImportError:
+                print("hnswlibがインストールされていないため、近似検索の代わりに全件検索を使用します")
+                self.use_hnsw = False
+        return self._hnswlib
+
+    def fetch(self, ids: List[str], namespace: Optional[str] = None, **kwargs) -> LocalFetchResponse:
+        """IDを指定してベクトルとメタデータを取得"""
+        vectors = {}
+        with self._lock:
+            data = self._namespace(namespace)
+            if data is not None:
+                for vector_id in ids:
+                    row = data.rows.get(vector_id)
+                    if row is not None:
+                        sparse = data.sparse[row]
+                        sparse_values = {"indices": sorted(sparse), "values": [sparse[index] for index in sorted(sparse)]} if sparse else None
+                        vectors[vector_id] = VectorRecord(vector_id, dict(data.metadata[row]), data.values(row), sparse_values)
+        return LocalFetchResponse(vectors, namespace or "")
+
+    def delete(
+        self,
+        ids: Optional[List[str]] = None,
+        delete_all: bool = False,
+        namespace: Optional[str] = None,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """ID・フィルターの指定、またはnamespaceの全件を削除"""
+        with self._lock:
+            data = self._namespace(namespace)
+            if data is None:
+                return {}
+            if delete_all:
+                target_ids = list(data.rows)
+            elif filter:
+                target_ids = [vector_id for vector_id, row in data.rows.items() if matches_filter(data.metadata[row], filter)]
+            else:
+                target_ids = list(ids or [])
+
+            for vector_id in target_ids:
+                data.release_row(vector_id)
+            if data.matrix is not None:
+                data.matrix.flush()
+            self._conn.executemany(
+                "DELETE FROM vectors WHERE namespace = ? AND vector_id = ?",
+                [(namespace or "", vector_id) for vector_id in target_ids]
+            )
+            self._conn.commit()
+            data.hnsw_dirty = True
+        return {}
+
+    def describe_index_stats(self, **kwargs) -> LocalIndexStats:
+        """次元数・類似度とnamespaceごとのベクトル数を取得"""
+        with self._lock:
+            namespaces = {
+                namespace: NamespaceSummary(len(data.rows))
+                for namespace, data in self._namespaces.items()
+                if data.rows
+            }
+        return LocalIndexStats(self.dimension, self.metric, namespaces)
+
+    def list_paginated(
+        self,
+        namespace: Optional[str] = None,
+        prefix: Optional[str] = None,
+        limit: int = 100,
+        pagination_token: Optional[str] = None,
+        **kwargs
+    ) -> LocalListResponse:
+        """ベクトルIDをID順にページ単位で取得（pagination_tokenは前のページの最後のID）"""
+        with self._lock:
+            data = self._namespace(namespace)
+            ids = sorted(
+                vector_id for vector_id in (data.rows if data else [])
+                if (not prefix or vector_id.startswith(prefix)) and (pagination_token is None or vector_id > pagination_token)
+            )
+        page = ids[:limit]
+        pagination = LocalPagination(page[-1]) if len(ids) > limit else None
+        return LocalListResponse([VectorRecord(vector_id) for vector_id in page], pagination)
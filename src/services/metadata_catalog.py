@@ -0,0 +1,210 @@
+from typing import List, Dict, Any, Optional, Iterable
+import json
+import threading
+import time
+from src.utils.local_state import open_sqlite
+from src.config.settings import (
+    METADATA_CATALOG_ENABLED,
+    METADATA_CATALOG_PATH
+)
+
+# 一覧・集計に使用するため列として保存するフィールド
+CATALOG_COLUMNS = ["filename", "chunk_id", "main_category", "sub_category", "city", "created_date", "upload_date", "source"]
+# 一覧表示に不要な大きなフィールド（カタログには保存しない）
+EXCLUDED_FIELDS = ["search_text", "answer_examples"]
+
+class MetadataCatalog:
+    def __init__(self, path: str = METADATA_CATALOG_PATH):
+        """Pineconeのベクトルのメタデータをローカルに複製するカタログの初期化"""
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = open_sqlite(path)
+        columns = ",\n".join(f"{column} TEXT" for column in CATALOG_COLUMNS)
+        self._conn.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS entries (
+                namespace TEXT NOT NULL,
+                vector_id TEXT NOT NULL,
+                {columns},
+                metadata TEXT NOT NULL,
+                PRIMARY KEY (namespace, vector_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_entries_filename ON entries (namespace, filename);
+            CREATE TABLE IF NOT EXISTS namespaces (
+                namespace TEXT PRIMARY KEY,
+                synced_at REAL NOT NULL
+            );
+            """
+        )
+        self._conn.commit()
+
+    def _make_row(self, namespace: Optional[str], vector_id: str, metadata: Dict[str, Any]) -> tuple:
+        """カタログに保存する行を作成"""
+        stored = {key: value for key, value in metadata.items() if key not in EXCLUDED_FIELDS}
+        return (
+            namespace or "",
+            vector_id,
+            *[str(metadata.get(column, "")) for column in CATALOG_COLUMNS],
+            json.dumps(stored, ensure_ascii=False)
+        )
+
+    def _insert_rows(self, rows: List[tuple]) -> None:
+        """行をまとめて保存（ロックを取得した状態で呼び出す）"""
+        placeholders = ",".join("?" * (len(CATALOG_COLUMNS) + 3))
+        self._conn.executemany(
+            f"INSERT OR REPLACE INTO entries (namespace, vector_id, {', '.join(CATALOG_COLUMNS)}, metadata) VALUES ({placeholders})",
+            rows
+        )
+
+    def record(self, namespace: Optional[str], vectors: List[Dict[str, Any]]) -> None:
+        """アップロードしたベクトルのメタデータを記録"""
+        rows = [self._make_row(namespace, vector["id"], vector.get("metadata", {})) for vector in vectors]
+        with self._lock:
+            self._insert_rows(rows)
+            self._conn.commit()
+
+    def delete(self, namespace: Optional[str], vector_ids: List[str]) -> None:
+        """指定されたベクトルIDの記録を削除"""
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM entries WHERE namespace = ? AND vector_id = ?",
+                [(namespace or "", vector_id) for vector_id in vector_ids]
+            )
+            self._conn.commit()
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        """namespaceの記録を全件削除（クリア後のnamespaceは同期済みとして扱う）"""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE namespace = ?", (namespace or "",))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO namespaces (namespace, synced_at) VALUES (?, ?)",
+                (namespace or "", time.time())
+            )
+            self._conn.commit()
+
+    def replace_namespace(self, namespace: Optional[str], records: Iterable[Any]) -> int:
+        """Pineconeから取得したベクトル（id・metadataを持つオブジェクト）でnamespaceの記録を置き換える"""
+        rows = [self._make_row(namespace, record.id, record.metadata or {}) for record in records]
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE namespace = ?", (namespace or "",))
+            self._insert_rows(rows)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO namespaces (namespace, synced_at) VALUES (?, ?)",
+                (namespace or "", time.time())
+            )
+            self._conn.commit()
+        return len(rows)
+
+    def is_synced(self, namespace: Optional[str]) -> bool:
+        """namespaceがPineconeと同期されたことがあるかを確認"""
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM namespaces WHERE namespace = ?", (namespace or "",)).fetchone()
+        return row is not None
+
+    def synced_at(self) -> Dict[str, float]:
+        """namespaceごとの最終同期時刻を取得"""
+        with self._lock:
+            rows = self._conn.execute("SELECT namespace, synced_at FROM namespaces").fetchall()
+        return {namespace: synced_at for namespace, synced_at in rows}
+
+    def get_many(self, namespace: Optional[str], vector_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """ベクトルIDに対応するメタデータをまとめて取得（記録がないIDは含まれない）"""
+        found = {}
+        with self._lock:
+            for i in range(0, len(vector_ids), 500):
+                id_batch = vector_ids[i:i + 500]
+                placeholders = ",".join("?" * len(id_batch))
+                rows = self._conn.execute(
+                    f"SELECT vector_id, metadata FROM entries WHERE namespace = ? AND vector_id IN ({placeholders})",
+                    [namespace or ""] + id_batch
+                ).fetchall()
+                for vector_id, metadata in rows:
+                    found[vector_id] = json.loads(metadata)
+        return found
+
+    def ids_where(self, namespace: Optional[str], field: str, value: Any) -> List[str]:
+        """メタデータのフィールドが指定された値に一致するベクトルIDを取得"""
+        if field in CATALOG_COLUMNS:
+            condition, params = f"{field} = ?", [str(value)]
+        else:
+            condition, params = "json_extract(metadata, ?) = ?", [f"$.{field}", value]
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT vector_id FROM entries WHERE namespace = ? AND {condition}",
+                [namespace or ""] + params
+            ).fetchall()
+        return [vector_id for (vector_id,) in rows]
+
+    def list_entries(self, namespace: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """記録されたメタデータの一覧を取得（namespace未指定時はすべて）"""
+        query = "SELECT namespace, vector_id, metadata FROM entries"
+        params: List[Any] = []
+        if namespace is not None:
+            query += " WHERE namespace = ?"
+            params.append(namespace)
+        query += " ORDER BY namespace, vector_id"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [
+            {"namespace": row_namespace, "id": vector_id, "metadata": json.loads(metadata)}
+            for row_namespace, vector_id, metadata in rows
+        ]
+
+    def group_by_filename(self, namespace: Optional[str] = None) -> List[Dict[str, Any]]:
+        """ファイルごとのチャンク数と代表的なメタデータを集計"""
+        columns = ", ".join(f"MIN({column}) AS {column}" for column in CATALOG_COLUMNS if column not in ("filename", "chunk_id"))
+        query = f"SELECT filename, COUNT(*) AS chunk_count, {columns} FROM entries"
+        params: List[Any] = []
+        if namespace is not None:
+            query += " WHERE namespace = ?"
+            params.append(namespace)
+        query += " GROUP BY filename ORDER BY filename"
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+            names = [description[0] for description in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def count_by(self, field: str, namespace: Optional[str] = None) -> List[Dict[str, Any]]:
+        """指定されたフィールドの値ごとの件数を集計"""
+        if field not in CATALOG_COLUMNS:
+            raise ValueError(f"集計できないフィールドです: {field}")
+        query = f"SELECT {field}, COUNT(*) FROM entries"
+        params: List[Any] = []
+        if namespace is not None:
+            query += " WHERE namespace = ?"
+            params.append(namespace)
+        query += f" GROUP BY {field} ORDER BY COUNT(*) DESC"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [{field: value, "count": count} for value, count in rows]
+
+    def count(self, namespace: Optional[str] = None) -> int:
+        """記録されたベクトル数を取得"""
+        with self._lock:
+            if namespace is None:
+                return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM entries WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+_shared_catalog: Optional[MetadataCatalog] = None
+_shared_catalog_failed = False
+_shared_catalog_lock = threading.Lock()
+
+def get_metadata_catalog() -> Optional[MetadataCatalog]:
+    """プロセス全体で共有するメタデータカタログを取得（無効または初期化失敗時はNone）"""
+    global _shared_catalog, _shared_catalog_failed
+    if not METADATA_CATALOG_ENABLED or _shared_catalog_failed:
+        return None
+
+    with _shared_catalog_lock:
+        if _shared_catalog is None:
+            try:
+                _shared_catalog = MetadataCatalog()
+            except Exception as e:
+                # カタログが使えない場合はPineconeから直接取得する
+                print(f"メタデータカタログの初期化に失敗しました（Pineconeから直接取得します）: {str(e)}")
+                _shared_catalog_failed = True
+                return None
+        return _shared_catalog
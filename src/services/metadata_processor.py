@@ -5,6 +5,7 @@ from langchain.prompts import ChatPromptTemplate
 from langchain.output_parsers import PydanticOutputParser
 from pydantic import BaseModel, Field
 from src.config.settings import OPENAI_API_KEY
+from src.services.retry_scheduler import get_retry_scheduler
 import json
 
 @dataclass
@@ -19,9 +20,11 @@ class MetadataProcessor:
         if not OPENAI_API_KEY:
             raise ValueError("OPENAI_API_KEY is not set in settings")
         
+        # 再試行は共有の再試行スケジューラーで行う
         self.llm = ChatOpenAI(
             model_name=model_name,
-            openai_api_key=OPENAI_API_KEY
+            openai_api_key=OPENAI_API_KEY,
+            max_retries=0
         )
         
         # 質問タイプごとのメタデータフィールド定義
@@ -76,7 +79,7 @@ class MetadataProcessor:
         ])
         
         chain = prompt | self.llm
-        response = chain.invoke({"text": text})
+        response = get_retry_scheduler().call("openai.chat", chain.invoke, {"text": text}, description="メタデータの抽出")
         
         try:
             # AIMessageからテキストを取得してJSONをパース
@@ -0,0 +1,39 @@
+from typing import List, Dict, Any, Optional, Iterable
+from urllib.parse import quote, unquote
+from src.config.settings import CITY_NAMESPACE_PREFIX
+
+def city_namespace(city: str) -> str:
+    """市区町村のnamespace名を作成（日本語はパーセントエンコードしてASCIIのみにする）"""
+    return f"{CITY_NAMESPACE_PREFIX}{quote(city.strip(), safe='')}"
+
+def namespace_city(namespace: Optional[str]) -> Optional[str]:
+    """namespace名から市区町村名を取得（市区町村のnamespaceでない場合はNone）"""
+    if not namespace or not namespace.startswith(CITY_NAMESPACE_PREFIX):
+        return None
+    return unquote(namespace[len(CITY_NAMESPACE_PREFIX):])
+
+def chunk_city(chunk: Dict[str, Any]) -> str:
+    """チャンクの市区町村を取得（チャンク直下とmetadataのどちらにあってもよい）"""
+    return (chunk.get("city") or chunk.get("metadata", {}).get("city") or "").strip()
+
+def group_chunks_by_city(chunks: Iterable[Dict[str, Any]]) -> Dict[Optional[str], List[Dict[str, Any]]]:
+    """チャンクを登録先のnamespaceごとに分ける（市区町村のないチャンクは既定のnamespace=Noneに残す）"""
+    groups: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    for chunk in chunks:
+        city = chunk_city(chunk)
+        groups.setdefault(city_namespace(city) if city else None, []).append(chunk)
+    return groups
+
+def route_namespaces(city: Optional[str], existing_namespaces: Iterable[str]) -> List[Optional[str]]:
+    """
+    検索するnamespaceを決める
+    市区町村のnamespaceがあれば、そのnamespaceと共通情報の既定のnamespaceのみを検索する
+    市区町村が未指定またはそのnamespaceがない場合は、既定のnamespaceとすべての市区町村のnamespaceを検索する
+    """
+    existing = set(existing_namespaces)
+    city_namespaces = sorted(namespace for namespace in existing if namespace_city(namespace))
+    if not city_namespaces:
+        return [None]
+    if city and city_namespace(city) in existing:
+        return [city_namespace(city), None]
+    return [None] + city_namespaces
@@ -1,388 +1,1141 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Iterable
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pinecone import Pinecone
 from openai import OpenAI
+import os
 import time
+import itertools
+import threading
+import tiktoken
 from src.config.settings import (
     PINECONE_API_KEY,
     PINECONE_INDEX_NAME,
+    VECTOR_BACKEND,
+    LOCAL_INDEX_DIR,
+    LOCAL_INDEX_NAME,
     OPENAI_API_KEY,
     EMBEDDING_MODEL,
+    EMBEDDING_DIMENSION,
+    SUPPORTED_EMBEDDING_DIMENSIONS,
+    EMBEDDING_BATCH_MAX_INPUTS,
+    EMBEDDING_BATCH_MAX_TOKENS,
+    EMBEDDING_MAX_INPUT_TOKENS,
     BATCH_SIZE,
+    UPLOAD_QUEUE_DEPTH,
+    UPLOAD_EMBEDDING_WORKERS,
+    UPLOAD_UPSERT_WORKERS,
+    UPLOAD_MAX_RETRY_ROUNDS,
+    SKIP_UNCHANGED_CHUNKS,
+    CONTENT_HASH_EXCLUDED_FIELDS,
+    IMPORT_BATCH_SIZE,
+    SYNC_KEY_FIELDS,
+    QUERY_FANOUT_WORKERS,
+    HYBRID_SEARCH_ENABLED,
+    GEO_SEARCH_ENABLED,
     DEFAULT_TOP_K,
     SIMILARITY_THRESHOLD
 )
+from src.services.embedding_cache import get_embedding_cache
+from src.services.retry_scheduler import get_retry_scheduler
+from src.services.upload_pipeline import UploadPipeline
+from src.services.upsert_engine import UpsertEngine, UpsertMetrics
+from src.services.ingestion_journal import IngestionJournal, get_ingestion_journal
+from src.services.document_store import get_document_store
+from src.services.vector_enumerator import VectorEnumerator, VectorRecord
+from src.services.metadata_catalog import MetadataCatalog, get_metadata_catalog
+from src.services.index_stats_cache import get_index_stats_cache
+from src.services.query_cache import get_query_cache
+from src.services.sparse_encoder import BM25SparseEncoder, get_sparse_encoder
+from src.services.geo_index import GeoIndex
+from src.services.local_index import LocalIndex
+from src.services.vector_import import iter_batches, validate_record
+from src.services.namespace_router import group_chunks_by_city, namespace_city, route_namespaces
+from src.utils.chunk_ids import make_content_hash
 import json
 import streamlit as st
 
 class PineconeService:
-    def __init__(self):
-        """Pineconeサービスの初期化"""
+    def __init__(self, openai_client: Optional[OpenAI] = None, pinecone_client: Optional[Pinecone] = None):
+        """Pineconeサービスの初期化（クライアントを渡した場合はそれを共有する）"""
         try:
             # OpenAIクライアントの初期化
-            if not OPENAI_API_KEY:
+            if openai_client is None and not OPENAI_API_KEY:
                 raise ValueError("OpenAI APIキーが設定されていません")
-            self.openai_client = OpenAI(api_key=OPENAI_API_KEY)
+            # 再試行は共有の再試行スケジューラーで行うため、クライアント側では再試行しない
+            self.openai_client = openai_client or OpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+            self.retry = get_retry_scheduler()
             
-            # Pineconeの初期化
-            if not PINECONE_API_KEY:
-                raise ValueError("Pinecone APIキーが設定されていません")
-            if not PINECONE_INDEX_NAME:
-                raise ValueError("Pineconeインデックス名が設定されていません")
+            # Pineconeの初期化（ローカルのバックエンドではPineconeに接続しない）
+            if VECTOR_BACKEND == "local":
+                self.pc = None
+                self.index_name = PINECONE_INDEX_NAME or LOCAL_INDEX_NAME
+            else:
+                if pinecone_client is None and not PINECONE_API_KEY:
+                    raise ValueError("Pinecone APIキーが設定されていません")
+                if not PINECONE_INDEX_NAME:
+                    raise ValueError("Pineconeインデックス名が設定されていません")
+                self.pc = pinecone_client or Pinecone(api_key=PINECONE_API_KEY)
+                self.index_name = PINECONE_INDEX_NAME
             
-            self.pc = Pinecone(api_key=PINECONE_API_KEY)
+            # 統計情報はTTLの間キャッシュし、書き込み時に破棄する
+            self.stats_cache = get_index_stats_cache(f"{VECTOR_BACKEND}:{self.index_name}")
             
             # インデックスの存在確認と初期化
             self._initialize_index()
             
             # インデックスの次元数を取得
-            stats = self.index.describe_index_stats()
+            stats = self._describe_index_stats()
             self.dimension = stats.dimension
             print(f"インデックスの次元数: {self.dimension}")
             
+            # 埋め込みの次元数はインデックスに合わせる（設定値と異なる場合は警告）
+            self.embedding_dimension = self.dimension if self.dimension in SUPPORTED_EMBEDDING_DIMENSIONS else EMBEDDING_DIMENSION
+            if self.embedding_dimension != EMBEDDING_DIMENSION:
+                print(f"警告: 設定の次元数（{EMBEDDING_DIMENSION}）とインデックスの次元数（{self.dimension}）が異なるため、{self.embedding_dimension}次元で埋め込みを生成します")
+            
+            # 疎ベクトル（BM25）はdotproductのインデックスでのみ使用できる
+            self.metric = stats.metric
+            self.sparse_encoder: Optional[BM25SparseEncoder] = None
+            if HYBRID_SEARCH_ENABLED:
+                if self.metric == "dotproduct":
+                    self.sparse_encoder = get_sparse_encoder()
+                else:
+                    print(f"インデックスのメトリックが{self.metric}のため、ハイブリッド検索は使用しません（dotproductのインデックスが必要です）")
+            
+            # サイズに応じて分割し並行してアップロードするエンジン
+            self.upsert_engine = UpsertEngine(self.index)
+            
+            # ベクトルIDをページ単位で列挙して並行してfetchする
+            self.vector_enumerator = VectorEnumerator(self.index, self.dimension)
+            
+            # 市区町村ごとのnamespaceに分けて登録した場合は、複数のnamespaceを並行して検索する
+            self.query_executor = ThreadPoolExecutor(max_workers=QUERY_FANOUT_WORKERS, thread_name_prefix="pinecone-query")
+            
+            # 施設の空間インデックスは検索するnamespaceの組み合わせごとに初回利用時に作成し、書き込み時に破棄する
+            self._geo_indexes: Dict[str, GeoIndex] = {}
+            self._geo_lock = threading.Lock()
+            # 書き込みのたびに進める世代番号（作成中に書き込みがあった空間インデックスを保存しないため）
+            self._geo_generation = 0
+            
         except Exception as e:
             raise Exception(f"Pineconeサービスの初期化に失敗しました: {str(e)}")
 
     def _initialize_index(self):
         """インデックスの初期化"""
-        max_retries = 3
-        retry_delay = 2  # seconds
+        if VECTOR_BACKEND == "local":
+            self._initialize_local_index()
+            return
         
-        for attempt in range(max_retries):
-            try:
-                # インデックス名の確認
-                if not PINECONE_INDEX_NAME:
-                    raise ValueError("インデックス名が設定されていません。Streamlit Cloudのシークレットを確認してください。")
-                print(f"使用するインデックス名: {PINECONE_INDEX_NAME}")
-                
-                # インデックスの存在確認
-                existing_indexes = self.pc.list_indexes()
-                existing_index_names = [index["name"] for index in existing_indexes]
-                print(f"既存のインデックス: {existing_index_names}")
-                
-                if PINECONE_INDEX_NAME not in existing_index_names:
-                    raise ValueError(f"インデックス '{PINECONE_INDEX_NAME}' が見つかりません。Streamlit Cloudのシークレットを確認してください。")
-                
-                # 既存のインデックスの設定を確認
-                index = self.pc.Index(PINECONE_INDEX_NAME)
-                stats = index.describe_index_stats()
-                print(f"現在のインデックス設定:")
-                print(f"- 次元数: {stats.dimension}")
-                print(f"- メトリック: {stats.metric}")
-                print(f"- ベクトル数: {stats.total_vector_count}")
-                
-                # 次元数が3072でない場合は警告を表示
-                if stats.dimension != 3072:
-                    print(f"警告: インデックスの次元数が3072と異なります（現在: {stats.dimension}）")
-                    print("新しい埋め込みモデル（text-embedding-3-large）との互換性に問題が発生する可能性があります")
-                
-                # インデックスの取得
-                self.index = index
-                break
-                
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    print(f"インデックスの初期化に失敗しました（試行 {attempt + 1}/{max_retries}）: {str(e)}")
-                    print(f"{retry_delay}秒後に再試行します...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2
-                else:
-                    raise Exception(f"インデックスの初期化に失敗しました（最大試行回数到達）: {str(e)}")
+        try:
+            # インデックス名の確認
+            if not PINECONE_INDEX_NAME:
+                raise ValueError("インデックス名が設定されていません。Streamlit Cloudのシークレットを確認してください。")
+            print(f"使用するインデックス名: {PINECONE_INDEX_NAME}")
+            
+            # インデックスの存在確認
+            existing_indexes = self.retry.call("pinecone.list_indexes", self.pc.list_indexes, description="インデックス一覧の取得")
+            existing_index_names = [index["name"] for index in existing_indexes]
+            print(f"既存のインデックス: {existing_index_names}")
+            
+            if PINECONE_INDEX_NAME not in existing_index_names:
+                raise ValueError(f"インデックス '{PINECONE_INDEX_NAME}' が見つかりません。Streamlit Cloudのシークレットを確認してください。")
+            
+            # 既存のインデックスの設定を確認
+            self.index = self.pc.Index(PINECONE_INDEX_NAME)
+            stats = self._describe_index_stats()
+            print(f"現在のインデックス設定:")
+            print(f"- 次元数: {stats.dimension}")
+            print(f"- メトリック: {stats.metric}")
+            print(f"- ベクトル数: {stats.total_vector_count}")
+            
+            # 次元数が設定値と異なる場合は警告を表示
+            if stats.dimension != EMBEDDING_DIMENSION:
+                print(f"警告: インデックスの次元数が{EMBEDDING_DIMENSION}と異なります（現在: {stats.dimension}）")
+                if stats.dimension not in SUPPORTED_EMBEDDING_DIMENSIONS:
+                    print(f"埋め込みモデル（{EMBEDDING_MODEL}）で生成できる次元数ではないため、互換性に問題が発生する可能性があります")
+            
+        except Exception as e:
+            raise Exception(f"インデックスの初期化に失敗しました: {str(e)}")
+
+    def _initialize_local_index(self):
+        """ローカルのベクトルインデックスの初期化（Pinecone Indexと同じメソッドで操作する）"""
+        try:
+            self.index = LocalIndex(os.path.join(LOCAL_INDEX_DIR, self.index_name), dimension=EMBEDDING_DIMENSION)
+            print(f"ローカルインデックスを使用します: {self.index.directory}")
+            print(f"- 次元数: {self.index.dimension}")
+            print(f"- メトリック: {self.index.metric}")
+            print(f"- 保存形式: {self.index.dtype}")
+        except Exception as e:
+            raise Exception(f"ローカルインデックスの初期化に失敗しました: {str(e)}")
+
+    def get_embedding(self, text: str, dimensions: Optional[int] = None) -> List[float]:
+        """テキストの埋め込みベクトルを取得（キャッシュにあればAPIを呼び出さない）"""
+        dimensions = dimensions or self.embedding_dimension
+        cache = get_embedding_cache()
+        if cache:
+            cached_vector = cache.get(EMBEDDING_MODEL, dimensions, text)
+            if cached_vector is not None:
+                return cached_vector
+        
+        vector = self._request_embedding(text, dimensions)
+        if cache:
+            cache.put(EMBEDDING_MODEL, dimensions, text, vector)
+        return vector
 
-    def get_embedding(self, text: str) -> List[float]:
-        """テキストの埋め込みベクトルを取得"""
-        max_retries = 3
-        retry_delay = 1  # seconds
+    def _request_embedding(self, text: str, dimensions: int) -> List[float]:
+        """APIを呼び出してテキストの埋め込みベクトルを取得"""
+        try:
+            response = self.retry.call(
+                "openai.embeddings",
+                self.openai_client.embeddings.create,
+                model=EMBEDDING_MODEL,
+                input=text,
+                dimensions=dimensions,
+                encoding_format="float",  # 明示的にfloat形式を指定
+                description="埋め込みベクトルの生成"
+            )
+            return response.data[0].embedding
+        except Exception as e:
+            raise Exception(f"埋め込みベクトルの生成に失敗しました: {str(e)}")
+
+    def get_embeddings(self, texts: List[str], dimensions: Optional[int] = None) -> List[Optional[List[float]]]:
+        """複数テキストの埋め込みベクトルをまとめて取得（失敗した要素はNone）"""
+        dimensions = dimensions or self.embedding_dimension
+        cache = get_embedding_cache()
+        if cache:
+            embeddings: List[Optional[List[float]]] = cache.get_many(EMBEDDING_MODEL, dimensions, texts)
+        else:
+            embeddings = [None] * len(texts)
+        
+        # キャッシュにないテキストのみAPIに送信する
+        missing_indices = [i for i, vector in enumerate(embeddings) if vector is None]
+        if len(missing_indices) < len(texts):
+            print(f"  埋め込みキャッシュ: {len(texts) - len(missing_indices)}/{len(texts)}件ヒット")
+        
+        # 同じテキストは1回だけAPIに送信し、結果を共有する
+        indices_by_text: Dict[str, List[int]] = {}
+        for i in missing_indices:
+            indices_by_text.setdefault(texts[i], []).append(i)
+        unique_texts = list(indices_by_text)
+        if len(unique_texts) < len(missing_indices):
+            print(f"  重複テキスト: {len(missing_indices) - len(unique_texts)}件は埋め込みを共有します")
         
-        for attempt in range(max_retries):
+        for request_group in self._plan_embedding_requests(unique_texts):
+            request_texts = [unique_texts[j] for j in request_group]
             try:
-                response = self.openai_client.embeddings.create(
-                    model="text-embedding-3-large",  # 新しいモデルを使用
-                    input=text,
-                    encoding_format="float"  # 明示的にfloat形式を指定
-                )
-                return response.data[0].embedding
+                vectors = self._create_embeddings(request_texts, dimensions)
+                for text, vector in zip(request_texts, vectors):
+                    for i in indices_by_text[text]:
+                        embeddings[i] = vector
+                if cache:
+                    cache.put_many(EMBEDDING_MODEL, dimensions, list(zip(request_texts, vectors)))
             except Exception as e:
-                if attempt < max_retries - 1:
-                    print(f"埋め込みベクトルの生成に失敗しました（試行 {attempt + 1}/{max_retries}）: {str(e)}")
-                    print(f"{retry_delay}秒後に再試行します...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2
-                else:
-                    raise Exception(f"埋め込みベクトルの生成に失敗しました（最大試行回数到達）: {str(e)}")
+                # バッチ全体が失敗した場合は1件ずつ取得し、失敗した要素はNoneのまま返す
+                print(f"  まとめての埋め込みに失敗したため1件ずつ再取得します（{len(request_texts)}件）: {str(e)}")
+                for text in request_texts:
+                    try:
+                        vector = self.get_embedding(text, dimensions)
+                        for i in indices_by_text[text]:
+                            embeddings[i] = vector
+                    except Exception as item_error:
+                        print(f"  テキスト {indices_by_text[text][0] + 1} の埋め込みベクトルの生成に失敗しました: {str(item_error)}")
+        
+        return embeddings
+
+    def _plan_embedding_requests(self, texts: List[str]) -> List[List[int]]:
+        """トークン数と入力数の上限に収まるようにテキストをリクエスト単位に分割"""
+        encoding = self._get_token_encoding()
+        requests = []
+        current_indices = []
+        current_tokens = 0
+        
+        for i, text in enumerate(texts):
+            text_tokens = len(encoding.encode(text))
+            
+            # 上限を超えるテキストは単独で送信する
+            if text_tokens > EMBEDDING_MAX_INPUT_TOKENS:
+                requests.append([i])
+                continue
+            
+            if current_indices and (
+                len(current_indices) >= EMBEDDING_BATCH_MAX_INPUTS
+                or current_tokens + text_tokens > EMBEDDING_BATCH_MAX_TOKENS
+            ):
+                requests.append(current_indices)
+                current_indices = []
+                current_tokens = 0
+            
+            current_indices.append(i)
+            current_tokens += text_tokens
+        
+        if current_indices:
+            requests.append(current_indices)
+        
+        return requests
+
+    def _create_embeddings(self, texts: List[str], dimensions: int) -> List[List[float]]:
+        """1回のAPIリクエストで複数テキストの埋め込みベクトルを取得"""
+        try:
+            response = self.retry.call(
+                "openai.embeddings",
+                self.openai_client.embeddings.create,
+                model=EMBEDDING_MODEL,
+                input=texts,
+                dimensions=dimensions,
+                encoding_format="float",
+                description="埋め込みベクトルの一括生成"
+            )
+        except Exception as e:
+            raise Exception(f"埋め込みベクトルの一括生成に失敗しました: {str(e)}")
+        
+        # レスポンスの順序は保証されないためindexで並べ直す
+        vectors = [None] * len(texts)
+        for item in response.data:
+            vectors[item.index] = item.embedding
+        if any(vector is None for vector in vectors):
+            raise ValueError("一部のテキストの埋め込みベクトルが返されませんでした")
+        return vectors
+
+    def _get_token_encoding(self):
+        """埋め込みモデル用のトークナイザーを取得（初回のみ読み込み）"""
+        if getattr(self, "_token_encoding", None) is None:
+            self._token_encoding = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+        return self._token_encoding
+
+    def _build_search_text(self, chunk: Dict[str, Any]) -> str:
+        """チャンクのテキストと回答例を結合してベクトル化用のテキストを作成"""
+        main_text = chunk["text"]
+        answer_examples = chunk.get("metadata", {}).get("answer_examples", [])
+        
+        # 回答例をテキストに結合（検索時の優先度を向上）
+        combined_text = main_text
+        
+        if answer_examples:
+            # 回答例を文字列に変換（既に文字列の場合はそのまま使用）
+            if isinstance(answer_examples[0], dict):
+                # 辞書形式の場合は自然な形式に変換
+                answers_text = "\n".join([
+                    f"Q: {qa.get('question', '')}\nA: {qa.get('answer', '')}"
+                    for qa in answer_examples
+                ])
+            else:
+                # 文字列の場合はそのまま結合
+                answers_text = "\n".join(answer_examples)
+            
+            # 回答例をメインテキストの前に配置（検索時の優先度を向上）
+            combined_text = f"回答例:\n{answers_text}\n\n{combined_text}"
+        
+        return combined_text
+
+    def _build_metadata(self, chunk: Dict[str, Any], combined_text: str) -> Dict[str, Any]:
+        """アップロード用のメタデータを作成（CSVファイルのメタデータを含める）"""
+        chunk_metadata = chunk.get("metadata", {})
+        metadata = {
+            "text": chunk["text"],
+            "filename": chunk.get("filename", ""),
+            "chunk_id": chunk.get("chunk_id", ""),
+            "main_category": chunk_metadata.get("main_category", ""),
+            "sub_category": chunk_metadata.get("sub_category", ""),
+            "city": chunk_metadata.get("city", ""),
+            "created_date": chunk_metadata.get("created_date", ""),
+            "upload_date": chunk_metadata.get("upload_date", ""),
+            "source": chunk_metadata.get("source", ""),
+            "answer_examples": self._convert_answer_examples_to_strings(chunk_metadata.get("answer_examples", [])),
+            "verified": chunk_metadata.get("verified", False),
+            "timestamp_type": chunk_metadata.get("timestamp_type", "static"),
+            "valid_for": chunk_metadata.get("valid_for", []),
+            "latitude": chunk_metadata.get("latitude") if chunk_metadata.get("latitude") is not None else 0.0,
+            "longitude": chunk_metadata.get("longitude") if chunk_metadata.get("longitude") is not None else 0.0,
+            "address": chunk_metadata.get("address", ""),
+            "property_name": chunk_metadata.get("property_name", ""),
+            # CSVファイルのメタデータ
+            "facility_name": chunk_metadata.get("facility_name", ""),
+            "walking_distance": chunk_metadata.get("walking_distance", 0),
+            "walking_minutes": chunk_metadata.get("walking_minutes", 0),
+            "straight_distance": chunk_metadata.get("straight_distance", 0),
+            # 検索用の結合テキストも保存
+            "search_text": combined_text
+        }
+        if chunk_metadata.get("property_key"):
+            # 物件の同期のキー（都道府県・市区町村・住所・物件名。設定したチャンクのみに含め、他のチャンクの内容のハッシュは変えない）
+            metadata["property_key"] = chunk_metadata["property_key"]
+        # 再アップロード時に内容が変わったかを判定するためのハッシュ
+        metadata["content_hash"] = make_content_hash(metadata, CONTENT_HASH_EXCLUDED_FIELDS)
+        return metadata
+
+    @staticmethod
+    def _dedupe_chunks(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """同じIDのチャンクを1件にまとめる（後に出現したものを優先し、順序は最初の出現位置を維持）"""
+        deduped: Dict[str, Dict[str, Any]] = {}
+        for chunk in chunks:
+            deduped[chunk["id"]] = chunk
+        return list(deduped.values())
+
+    def _existing_content_hashes(self, chunk_ids: List[str], namespace: str = None) -> Dict[str, str]:
+        """登録済みのチャンクの内容のハッシュを取得（カタログが同期済みならローカルから、それ以外はfetchで取得）"""
+        catalog = get_metadata_catalog()
+        if catalog and catalog.is_synced(namespace):
+            entries = catalog.get_many(namespace, chunk_ids)
+        else:
+            entries = {
+                vector_id: record.metadata
+                for vector_id, record in self.vector_enumerator.fetch_many(chunk_ids, namespace=namespace).items()
+            }
+        return {
+            vector_id: metadata["content_hash"]
+            for vector_id, metadata in entries.items()
+            if metadata.get("content_hash")
+        }
 
-    def upload_chunks(self, chunks: List[Dict[str, Any]], namespace: str = None, batch_size: int = BATCH_SIZE) -> None:
-        """チャンクをPineconeにアップロード"""
+    def _filter_unchanged_chunks(self, chunks: List[Dict[str, Any]], namespace: str = None) -> List[Dict[str, Any]]:
+        """登録済みで内容が変わっていないチャンクを除外（取得に失敗した場合はすべてアップロードする）"""
+        try:
+            existing_hashes = self._existing_content_hashes([chunk["id"] for chunk in chunks], namespace)
+        except Exception as e:
+            print(f"登録済みのチャンクを確認できなかったため、すべてアップロードします: {str(e)}")
+            return chunks
+        if not existing_hashes:
+            return chunks
+        return [
+            chunk for chunk in chunks
+            if existing_hashes.get(chunk["id"]) != self._build_metadata(chunk, self._build_search_text(chunk))["content_hash"]
+        ]
+
+    def upload_chunks(
+        self,
+        chunks: List[Dict[str, Any]],
+        namespace: str = None,
+        batch_size: int = BATCH_SIZE,
+        queue_depth: int = UPLOAD_QUEUE_DEPTH,
+        embedding_workers: int = UPLOAD_EMBEDDING_WORKERS,
+        upsert_workers: int = UPLOAD_UPSERT_WORKERS
+    ) -> Dict[str, Any]:
+        """チャンクをPineconeにアップロード（埋め込み生成とアップロードを並行して実行）"""
         if not chunks:
             print("アップロードするチャンクがありません")
-            return
+            return {}
 
         try:
             total_chunks = len(chunks)
             print(f"アップロード開始: 合計{total_chunks}件のチャンク")
             
-            # チャンクをバッチに分割
-            for i in range(0, len(chunks), batch_size):
-                batch = chunks[i:i + batch_size]
-                batch_num = i // batch_size + 1
-                print(f"\nバッチ {batch_num} を処理中... ({len(batch)}件)")
-                
-                # バッチ内の各チャンクの埋め込みベクトルを取得
-                vectors = []
-                retry_chunks = []  # 再試行が必要なチャンク
-                
-                for j, chunk in enumerate(batch, 1):
-                    try:
-                        print(f"  チャンク {j}/{len(batch)} の埋め込みベクトルを生成中...")
-                        
-                        # テキスト内容と回答例を結合してベクトル化
-                        main_text = chunk["text"]
-                        answer_examples = chunk.get("metadata", {}).get("answer_examples", [])
-                        
-                        # 回答例をテキストに結合（検索時の優先度を向上）
-                        combined_text = main_text
-                        
-                        if answer_examples:
-                            # 回答例を文字列に変換（既に文字列の場合はそのまま使用）
-                            if isinstance(answer_examples[0], dict):
-                                # 辞書形式の場合は自然な形式に変換
-                                answers_text = "\n".join([
-                                    f"Q: {qa.get('question', '')}\nA: {qa.get('answer', '')}"
-                                    for qa in answer_examples
-                                ])
-                            else:
-                                # 文字列の場合はそのまま結合
-                                answers_text = "\n".join(answer_examples)
-                            
-                            # 回答例をメインテキストの前に配置（検索時の優先度を向上）
-                            combined_text = f"回答例:\n{answers_text}\n\n{combined_text}"
-                        
-                        vector = self.get_embedding(combined_text)
-                        
-                        # メタデータの設定（CSVファイルのメタデータを含める）
-                        metadata = {
-                            "text": chunk["text"],
-                            "filename": chunk.get("filename", ""),
-                            "chunk_id": chunk.get("chunk_id", ""),
-                            "main_category": chunk.get("metadata", {}).get("main_category", ""),
-                            "sub_category": chunk.get("metadata", {}).get("sub_category", ""),
-                            "city": chunk.get("metadata", {}).get("city", ""),
-                            "created_date": chunk.get("metadata", {}).get("created_date", ""),
-                            "upload_date": chunk.get("metadata", {}).get("upload_date", ""),
-                            "source": chunk.get("metadata", {}).get("source", ""),
-                            "answer_examples": self._convert_answer_examples_to_strings(chunk.get("metadata", {}).get("answer_examples", [])),
-                            "verified": chunk.get("metadata", {}).get("verified", False),
-                            "timestamp_type": chunk.get("metadata", {}).get("timestamp_type", "static"),
-                            "valid_for": chunk.get("metadata", {}).get("valid_for", []),
-                            "latitude": chunk.get("metadata", {}).get("latitude") if chunk.get("metadata", {}).get("latitude") is not None else 0.0,
-                            "longitude": chunk.get("metadata", {}).get("longitude") if chunk.get("metadata", {}).get("longitude") is not None else 0.0,
-                            "address": chunk.get("metadata", {}).get("address", ""),
-                            # CSVファイルのメタデータ
-                            "facility_name": chunk.get("metadata", {}).get("facility_name", ""),
-                            "walking_distance": chunk.get("metadata", {}).get("walking_distance", 0),
-                            "walking_minutes": chunk.get("metadata", {}).get("walking_minutes", 0),
-                            "straight_distance": chunk.get("metadata", {}).get("straight_distance", 0),
-                            # 検索用の結合テキストも保存
-                            "search_text": combined_text
-                        }
-                        
-                        # デバッグ情報の表示
-                        print(f"  チャンク {chunk['id']} のメタデータ:")
-                        print(f"    - 大カテゴリ: {metadata['main_category']}")
-                        print(f"    - 中カテゴリ: {metadata['sub_category']}")
-                        print(f"    - 市区町村: {metadata['city']}")
-                        print(f"    - ソース: {metadata['source']}")
-                        print(f"    - 回答例: {metadata['answer_examples']}")
-                        print(f"    - 検証済み: {metadata['verified']}")
-                        print(f"    - 更新タイプ: {metadata['timestamp_type']}")
-                        print(f"    - 作成年度: {metadata['valid_for']}")
-                        print(f"    - 緯度: {metadata['latitude']}")
-                        print(f"    - 経度: {metadata['longitude']}")
-                        print(f"    - 住所: {metadata['address']}")
-                        
-                        # ベクトル化に使用されたテキストの情報を表示
-                        print(f"  ベクトル化に使用されたテキスト:")
-                        print(f"    - 元のテキスト長: {len(main_text)}文字")
-                        print(f"    - 回答例数: {len(answer_examples)}個")
-                        print(f"    - 結合テキスト長: {len(combined_text)}文字")
-                        print(f"    - 結合テキスト（最初の200文字）: {combined_text[:200]}...")
-                        
-                        # デバッグ情報の表示
-                        print(f"  メタデータ: {json.dumps(metadata, ensure_ascii=False)}")
-                        
-                        vectors.append({
-                            "id": chunk["id"],
-                            "values": vector,
-                            "metadata": metadata
-                        })
-                    except Exception as e:
-                        print(f"  チャンク {chunk['id']} の処理中にエラーが発生しました: {str(e)}")
-                        retry_chunks.append(chunk)
-                        continue
+            # 同じIDのチャンクをまとめ、登録済みで内容が変わっていないチャンクは埋め込みもアップロードも行わない
+            chunks = self._dedupe_chunks(chunks)
+            duplicate_chunks = total_chunks - len(chunks)
+            if duplicate_chunks:
+                print(f"重複したチャンク {duplicate_chunks}件 をまとめました")
+            
+            # ジャーナルを確認し、前回の途中から再開する
+            # ジョブIDは変更の有無で絞り込む前のチャンクから作る（途中まで登録すると絞り込み結果が変わり、前回のジョブを見つけられなくなるため）
+            journal = get_ingestion_journal()
+            job_id = None
+            pending_chunks = chunks
+            if journal and chunks:
+                metadatas = [self._build_metadata(chunk, self._build_search_text(chunk)) for chunk in chunks]
+                job_id = IngestionJournal.make_job_id(chunks, metadatas, namespace)
+                if journal.start(job_id, namespace, len(chunks)):
+                    upserted_ids = journal.upserted_ids(job_id)
+                    pending_chunks = [chunk for chunk in chunks if chunk["id"] not in upserted_ids]
+                    print(f"前回のアップロードを再開します: {len(chunks) - len(pending_chunks)}件はアップロード済みのためスキップします")
+            skipped_chunks = len(chunks) - len(pending_chunks)
+            
+            unchanged_chunks = 0
+            if SKIP_UNCHANGED_CHUNKS and pending_chunks:
+                changed_chunks = self._filter_unchanged_chunks(pending_chunks, namespace)
+                unchanged_chunks = len(pending_chunks) - len(changed_chunks)
+                pending_chunks = changed_chunks
+                if unchanged_chunks:
+                    print(f"内容が変わっていないチャンク {unchanged_chunks}件 をスキップします")
+            
+            upsert_metrics = UpsertMetrics()
+            report = {
+                "total_chunks": total_chunks,
+                "duplicate_chunks": duplicate_chunks,
+                "unchanged_chunks": unchanged_chunks,
+                "skipped_chunks": skipped_chunks,
+                "rounds": []
+            }
+            
+            # 失敗したチャンクは再帰せず、上限回数までラウンドを繰り返して再試行する
+            for round_num in range(1, UPLOAD_MAX_RETRY_ROUNDS + 1):
+                if not pending_chunks:
+                    break
+                if round_num > 1:
+                    print(f"\n失敗したチャンク {len(pending_chunks)}件 を再試行します（{round_num}/{UPLOAD_MAX_RETRY_ROUNDS}回目）...")
+                    # 遮断中に再試行するとすべて即座に失敗するため、遮断が解除されるまで待つ
+                    wait_seconds = self.retry.remaining_seconds("openai.embeddings", "pinecone.upsert")
+                    if wait_seconds > 0:
+                        print(f"連続した失敗により呼び出しを停止しているため、{wait_seconds:.0f}秒待機します...")
+                        time.sleep(wait_seconds)
+
+                # チャンクをバッチに分割
+                batches = [pending_chunks[i:i + batch_size] for i in range(0, len(pending_chunks), batch_size)]
                 
-                if vectors:
-                    max_retries = 3
-                    retry_delay = 2
-                    
-                    for attempt in range(max_retries):
-                        try:
-                            # バッチをアップロード（namespaceを指定）
-                            print(f"  {len(vectors)}件のベクトルをアップロード中...")
-                            self.index.upsert(vectors=vectors, namespace=namespace)
-                            print(f"  バッチ {batch_num} のアップロードが完了しました")
-                            break
-                        except Exception as e:
-                            if attempt < max_retries - 1:
-                                print(f"  バッチ {batch_num} のアップロードに失敗しました（試行 {attempt + 1}/{max_retries}）: {str(e)}")
-                                print(f"  {retry_delay}秒後に再試行します...")
-                                time.sleep(retry_delay)
-                                retry_delay *= 2
-                            else:
-                                raise Exception(f"バッチ {batch_num} のアップロードに失敗しました（最大試行回数到達）: {str(e)}")
+                # 埋め込みワーカーがキューを満たし、アップロードワーカーがキューを消費する
+                pipeline = UploadPipeline(
+                    embed_batch=lambda batch, batch_num: self._embed_batch(batch, batch_num, job_id),
+                    upsert_batch=lambda vectors, batch_num: self._upsert_vectors(vectors, batch_num, namespace, upsert_metrics, job_id),
+                    queue_depth=queue_depth,
+                    embedding_workers=embedding_workers,
+                    upsert_workers=upsert_workers
+                )
+                round_report = pipeline.run(batches)
+                pending_chunks = round_report.pop("failed_chunks")
+                report["rounds"].append(round_report)
                 
-                # 失敗したチャンクを再試行
-                if retry_chunks:
-                    print(f"\n失敗したチャンク {len(retry_chunks)}件 を再試行します...")
-                    self.upload_chunks(retry_chunks, namespace, batch_size)
+                print("\n=== アップロード統計 ===")
+                print(f"合計時間: {round_report['total_seconds']}秒")
+                print(f"埋め込み: {round_report['embedding']['items']}件, {round_report['embedding']['items_per_second']}件/秒")
+                print(f"アップロード: {round_report['upsert']['items']}件, {round_report['upsert']['items_per_second']}件/秒")
+            
+            report["upsert_requests"] = upsert_metrics.to_dict()
+            print(f"アップロードリクエスト: {report['upsert_requests']['requests']}件, "
+                  f"p50 {report['upsert_requests']['latency_p50']}秒, p95 {report['upsert_requests']['latency_p95']}秒")
+            
+            if pending_chunks:
+                raise Exception(
+                    f"{len(pending_chunks)}件のチャンクを{UPLOAD_MAX_RETRY_ROUNDS}回試行してもアップロードできませんでした"
+                    "（同じ内容で再実行すると完了済みのチャンクをスキップして再開します）"
+                )
+            
+            if job_id:
+                journal.finish(job_id)
             
             print("\nアップロード完了")
+            return report
             
         except Exception as e:
             raise Exception(f"チャンクのアップロードに失敗しました: {str(e)}")
+        finally:
+            # 一部でも書き込んだ可能性があるため成否にかかわらず破棄する
+            self._invalidate_read_caches()
 
-    def query(self, query_text: str, namespace: str = None, top_k: int = DEFAULT_TOP_K, similarity_threshold: float = SIMILARITY_THRESHOLD) -> Dict[str, Any]:
-        """クエリに基づいて類似チャンクを検索"""
-        max_retries = 3
-        retry_delay = 1
+    def _embed_batch(self, batch: List[Dict[str, Any]], batch_num: int, job_id: str = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """バッチ内のチャンクをベクトル化し、(アップロード用ベクトル, 失敗したチャンク) を返す"""
+        print(f"\nバッチ {batch_num} を処理中... ({len(batch)}件)")
         
-        # 設定画面で変更された値を取得（引数で渡された値が優先）
-        if similarity_threshold == SIMILARITY_THRESHOLD:  # デフォルト値が使用されている場合
-            similarity_threshold = st.session_state.get("similarity_threshold", SIMILARITY_THRESHOLD)
+        vectors = []
+        retry_chunks = []  # 再試行が必要なチャンク
+        
+        # 前回埋め込み済みのチャンクはジャーナルから復元し、再度ベクトル化しない
+        journal = get_ingestion_journal() if job_id else None
+        if journal:
+            restored = journal.load_embedded(job_id, [chunk["id"] for chunk in batch])
+            if restored:
+                print(f"  {len(restored)}件の埋め込みベクトルをジャーナルから復元しました")
+                for chunk_id, (values, metadata) in restored.items():
+                    vectors.append({"id": chunk_id, "values": values, "metadata": metadata})
+                batch = [chunk for chunk in batch if chunk["id"] not in restored]
+                if not batch:
+                    return vectors, retry_chunks
+        
+        # バッチ内のチャンクの埋め込みベクトルをまとめて取得し、チャンクIDに対応付ける
+        search_texts = [self._build_search_text(chunk) for chunk in batch]
+        print(f"  {len(batch)}件の埋め込みベクトルをまとめて生成中...")
+        embeddings = self.get_embeddings(search_texts)
+        vectors_by_id = {
+            chunk["id"]: vector
+            for chunk, vector in zip(batch, embeddings)
+            if vector is not None
+        }
         
-        for attempt in range(max_retries):
+        for chunk, combined_text in zip(batch, search_texts):
             try:
-                # クエリのベクトル化
-                query_vector = self.get_embedding(query_text)
-                print(f"検索クエリ: {query_text}")
-                print(f"類似度しきい値: {similarity_threshold}")
-                print(f"取得する候補数: {top_k}")
+                vector = vectors_by_id.get(chunk["id"])
+                if vector is None:
+                    raise ValueError("埋め込みベクトルを取得できませんでした")
                 
-                # 検索を実行
-                results = self.index.query(
-                    vector=query_vector,
-                    top_k=top_k,  # 必要な数だけ取得
-                    include_metadata=True,
-                    namespace=namespace  # namespaceを指定
-                )
+                metadata = self._build_metadata(chunk, combined_text)
                 
-                print(f"取得した候補数: {len(results.matches)}")
-                if results.matches:
-                    print("候補のスコア:")
-                    for match in results.matches:
-                        print(f"スコア: {match.score:.3f}")
+                # デバッグ情報の表示
+                print(f"  チャンク {chunk['id']} のメタデータ:")
+                print(f"    - 大カテゴリ: {metadata['main_category']}")
+                print(f"    - 中カテゴリ: {metadata['sub_category']}")
+                print(f"    - 市区町村: {metadata['city']}")
+                print(f"    - ソース: {metadata['source']}")
+                print(f"    - 回答例: {metadata['answer_examples']}")
+                print(f"    - 検証済み: {metadata['verified']}")
+                print(f"    - 更新タイプ: {metadata['timestamp_type']}")
+                print(f"    - 作成年度: {metadata['valid_for']}")
+                print(f"    - 緯度: {metadata['latitude']}")
+                print(f"    - 経度: {metadata['longitude']}")
+                print(f"    - 住所: {metadata['address']}")
                 
-                # 類似度でフィルタリング（しきい値未満は除外）
-                filtered_matches = [
-                    match for match in results.matches
-                    if match.score >= similarity_threshold
-                ]
+                # ベクトル化に使用されたテキストの情報を表示
+                print(f"  ベクトル化に使用されたテキスト:")
+                print(f"    - 元のテキスト長: {len(chunk['text'])}文字")
+                print(f"    - 回答例数: {len(chunk.get('metadata', {}).get('answer_examples', []))}個")
+                print(f"    - 結合テキスト長: {len(combined_text)}文字")
+                print(f"    - 結合テキスト（最初の200文字）: {combined_text[:200]}...")
                 
-                print(f"しきい値({similarity_threshold})以上の候補数: {len(filtered_matches)}")
-                if filtered_matches:
-                    print("採用された候補のスコア:")
-                    for match in filtered_matches:
-                        print(f"スコア: {match.score:.3f}, テキスト: {match.metadata['text'][:100]}...")
-                else:
-                    print("しきい値以上の候補が見つかりませんでした。")
+                # デバッグ情報の表示
+                print(f"  メタデータ: {json.dumps(metadata, ensure_ascii=False)}")
                 
-                return {
-                    "matches": filtered_matches,
-                    "total_matches": len(results.matches),
-                    "filtered_matches": len(filtered_matches)
-                }
+                vectors.append({
+                    "id": chunk["id"],
+                    "values": vector,
+                    "metadata": metadata
+                })
+            except Exception as e:
+                print(f"  チャンク {chunk['id']} の処理中にエラーが発生しました: {str(e)}")
+                retry_chunks.append(chunk)
+                continue
+        
+        if journal:
+            journal.record_embedded(job_id, [vector for vector in vectors if vector["id"] in vectors_by_id])
+        
+        return vectors, retry_chunks
+
+    def _upsert_vectors(self, vectors: List[Dict[str, Any]], batch_num: int, namespace: str = None, metrics: UpsertMetrics = None, job_id: str = None) -> None:
+        """ベクトルのバッチをリクエストサイズに応じて分割し、並行してアップロード"""
+        print(f"  {len(vectors)}件のベクトルをアップロード中...")
+        try:
+            upload_vectors = [dict(vector) for vector in vectors]
+            
+            # テキストなどの大きなフィールドはローカルに保存し、Pineconeには小さなメタデータのみ送る
+            store = get_document_store()
+            if store:
+                store.put_many(namespace, vectors)
+                for vector in upload_vectors:
+                    vector["metadata"] = store.slim_metadata(vector["metadata"])
+            
+            # ハイブリッド検索用にBM25の疎ベクトルを付与する（インポートで疎ベクトルが指定されたものはそのまま使う）
+            encode_vectors = [vector for vector in upload_vectors if not vector.get("sparse_values")]
+            sparse_texts = [vector["metadata"].get("search_text") or vector["metadata"].get("text", "") for vector in vectors if not vector.get("sparse_values")]
+            if self.sparse_encoder and encode_vectors:
+                for vector, sparse_values in zip(encode_vectors, self.sparse_encoder.encode_documents(sparse_texts)):
+                    if sparse_values["indices"]:
+                        vector["sparse_values"] = sparse_values
+            
+            self.upsert_engine.upsert(upload_vectors, namespace=namespace, metrics=metrics)
+            print(f"  バッチ {batch_num} のアップロードが完了しました")
+            
+            # BM25で疎ベクトルを作成した文書でコーパス統計を更新（同じIDは前回の寄与と置き換える）
+            if self.sparse_encoder:
+                if encode_vectors:
+                    self.sparse_encoder.fit(namespace, [vector["id"] for vector in encode_vectors], sparse_texts)
+                # 指定された疎ベクトルで置き換えた文書は、前回BM25で登録した分を差し引く
+                provided_ids = [vector["id"] for vector in vectors if vector.get("sparse_values")]
+                if provided_ids:
+                    self.sparse_encoder.remove(namespace, provided_ids)
+            
+            # 一覧表示用のカタログに記録
+            catalog = get_metadata_catalog()
+            if catalog:
+                catalog.record(namespace, vectors)
+            
+            # アップロード済みとして記録（再実行時にスキップする）
+            journal = get_ingestion_journal() if job_id else None
+            if journal:
+                journal.record_upserted(job_id, [vector["id"] for vector in vectors])
+        except Exception as e:
+            raise Exception(f"バッチ {batch_num} のアップロードに失敗しました: {str(e)}")
+
+    def sync_chunks(
+        self,
+        chunks: List[Dict[str, Any]],
+        namespace: str = None,
+        key_field: str = None,
+        legacy_id_prefixes: List[str] = None
+    ) -> Dict[str, Any]:
+        """
+        ファイル名（propertyでは物件のキー）単位でチャンクを置き換える
+        新規・変更されたチャンクのみアップロードし、同じキーで今回含まれなかった古いチャンクを削除する
+        legacy_id_prefixesを指定した場合は、キーを持たない古いチャンクのうちIDの接頭辞が一致するものも削除する
+        """
+        if not chunks:
+            print("同期するチャンクがありません")
+            return {}
+        key_field = key_field or SYNC_KEY_FIELDS.get(namespace or "", "filename")
+        keys = self._sync_keys(chunks, key_field)
+        current_ids = {chunk["id"] for chunk in chunks}
+        
+        # 先に新しい内容をアップロードし、検索できない期間が生じないようにしてから古いチャンクを削除する
+        report = self.upload_chunks(chunks, namespace=namespace)
+        report["deleted_chunks"] = self._delete_stale_chunks(key_field, keys, {namespace: current_ids})
+        if legacy_id_prefixes:
+            report["deleted_chunks"] += self._delete_legacy_chunks(key_field, legacy_id_prefixes, namespace, current_ids)
+        return report
+
+    def _sync_keys(self, chunks: List[Dict[str, Any]], key_field: str) -> set:
+        """チャンクから同期のキーを集める（キーのないチャンクがあればエラー）"""
+        keys = set()
+        for chunk in chunks:
+            key = chunk.get(key_field) or chunk.get("metadata", {}).get(key_field)
+            if not key:
+                raise ValueError(f"チャンク {chunk['id']} に同期のキー（{key_field}）が設定されていません")
+            keys.add(key)
+        return keys
+
+    def _delete_stale_chunks(self, key_field: str, keys: set, current_ids: Dict[Optional[str], set]) -> int:
+        """各namespaceで同期のキーが一致し、今回そのnamespaceに登録しなかったチャンクを削除（削除件数を返す）"""
+        try:
+            deleted = 0
+            for namespace, namespace_ids in current_ids.items():
+                stale_ids = []
+                for key in sorted(keys):
+                    stale_ids.extend(vector_id for vector_id in self._ids_for_key(key_field, key, namespace) if vector_id not in namespace_ids)
+                if stale_ids:
+                    print(f"{key_field}が一致する古いチャンク {len(stale_ids)}件 を削除します（namespace: '{namespace or ''}'）")
+                    self.delete_vectors(stale_ids, namespace)
+                    deleted += len(stale_ids)
+            return deleted
+        except Exception as e:
+            raise Exception(f"古いチャンクの削除に失敗しました: {str(e)}")
+
+    def _delete_legacy_chunks(self, key_field: str, id_prefixes: List[str], namespace: str, current_ids: set) -> int:
+        """同期のキーを持たない（キーを保存する前に登録した）チャンクのうち、IDの接頭辞が一致し今回登録しなかったものを削除"""
+        try:
+            legacy_ids = [
+                record.id
+                for prefix in id_prefixes
+                for record in self.iter_vectors(namespace=namespace, prefix=prefix, hydrate=False)
+                if record.id.startswith(prefix) and record.id not in current_ids and not record.metadata.get(key_field)
+            ]
+            if legacy_ids:
+                print(f"{key_field}を持たない古いチャンク {len(legacy_ids)}件 を削除します（namespace: '{namespace or ''}'）")
+                self.delete_vectors(legacy_ids, namespace)
+            return len(legacy_ids)
+        except Exception as e:
+            raise Exception(f"古いチャンクの削除に失敗しました: {str(e)}")
+
+    def upload_chunks_by_city(self, chunks: List[Dict[str, Any]], sync: bool = False, key_field: str = None) -> Dict[str, Any]:
+        """
+        市区町村が設定されたチャンクは市区町村ごとのnamespaceに、それ以外は既定のnamespaceに登録
+        syncでは既定と市区町村ごとのすべてのnamespaceから、同じキーで今回そのnamespaceに登録しなかった古いチャンクを削除する
+        （市区町村が変わった、または市区町村のnamespaceへ移ったファイルの古いコピーも残さない）
+        """
+        report = {
+            "total_chunks": 0,
+            "duplicate_chunks": 0,
+            "unchanged_chunks": 0,
+            "skipped_chunks": 0,
+            "deleted_chunks": 0,
+            "rounds": [],
+            "namespaces": {}
+        }
+        groups = group_chunks_by_city(chunks)
+        if sync:
+            key_field = key_field or SYNC_KEY_FIELDS.get("", "filename")
+            keys = self._sync_keys(chunks, key_field)
+        
+        # 先にすべてのnamespaceへ新しい内容をアップロードしてから古いチャンクを削除する
+        for namespace, group in groups.items():
+            print(f"\nnamespace '{namespace or ''}'（{namespace_city(namespace) or '共通'}）に{len(group)}件のチャンクを登録します")
+            group_report = self.upload_chunks(group, namespace=namespace)
+            report["namespaces"][namespace or ""] = len(group)
+            for key in ("total_chunks", "duplicate_chunks", "unchanged_chunks", "skipped_chunks"):
+                report[key] += group_report.get(key, 0)
+            report["rounds"].extend(group_report.get("rounds", []))
+        
+        if sync:
+            # 既定のnamespaceとすべての市区町村のnamespaceを対象にする
+            current_ids = {namespace: set() for namespace in route_namespaces(None, (self._describe_index_stats().namespaces or {}).keys())}
+            for namespace, group in groups.items():
+                current_ids[namespace] = {chunk["id"] for chunk in group}
+            report["deleted_chunks"] = self._delete_stale_chunks(key_field, keys, current_ids)
+        return report
+
+    def _ids_for_key(self, key_field: str, key: str, namespace: str = None) -> List[str]:
+        """
+        同期のキーが一致する登録済みのベクトルIDを取得
+        未同期のカタログはlist_paginatedで全件を取り込んでから検索する（件数の上限がある検索による取得は使わない）
+        """
+        catalog = self.get_catalog([namespace or ""])
+        if catalog:
+            return catalog.ids_where(namespace, key_field, key)
+        return [record.id for record in self.iter_vectors(namespace=namespace) if record.metadata.get(key_field) == key]
+
+    def delete_vectors(self, vector_ids: List[str], namespace: str = None) -> int:
+        """IDを指定してベクトルを削除（上限件数ごとに分割して並行して送信し、ローカルの記録も削除）"""
+        try:
+            deleted = self.upsert_engine.delete(vector_ids, namespace=namespace)
+            store = get_document_store()
+            if store:
+                store.delete(namespace, vector_ids)
+            catalog = get_metadata_catalog()
+            if catalog:
+                catalog.delete(namespace, vector_ids)
+            if self.sparse_encoder:
+                self.sparse_encoder.remove(namespace, vector_ids)
+            return deleted
+        except Exception as e:
+            raise Exception(f"ベクトルの削除に失敗しました: {str(e)}")
+        finally:
+            self._invalidate_read_caches()
+
+    def import_vectors(
+        self,
+        records: Iterable[Dict[str, Any]],
+        namespace: str = None,
+        batch_size: int = IMPORT_BATCH_SIZE,
+        skip_invalid: bool = False
+    ) -> Dict[str, Any]:
+        """事前に計算したベクトルを埋め込みを行わずにアップロード（次元数を検証し、バッチ単位で順次処理）"""
+        upsert_metrics = UpsertMetrics()
+        report = {"imported": 0, "invalid": 0, "errors": []}
+        started_at = time.perf_counter()
+        
+        try:
+            for batch_num, batch in enumerate(iter_batches(records, batch_size), start=1):
+                vectors = []
+                for record in batch:
+                    error = validate_record(record, self.dimension)
+                    if error is None:
+                        vectors.append(record)
+                        continue
+                    if not skip_invalid:
+                        raise ValueError(error)
+                    report["invalid"] += 1
+                    if len(report["errors"]) < 10:
+                        report["errors"].append(error)
                 
+                if vectors:
+                    self._upsert_vectors(vectors, batch_num, namespace, upsert_metrics)
+                    report["imported"] += len(vectors)
+                    print(f"  {report['imported']}件 インポート済み")
+            
+            elapsed = time.perf_counter() - started_at
+            report["total_seconds"] = round(elapsed, 2)
+            report["vectors_per_second"] = round(report["imported"] / elapsed, 1) if elapsed > 0 else 0.0
+            report["upsert_requests"] = upsert_metrics.to_dict()
+            print(f"インポート完了: {report['imported']}件（無効 {report['invalid']}件）, {report['total_seconds']}秒, {report['vectors_per_second']}件/秒")
+            return report
+            
+        except Exception as e:
+            raise Exception(f"ベクトルのインポートに失敗しました: {str(e)}")
+        finally:
+            self._invalidate_read_caches()
+
+    @staticmethod
+    def build_filter(city: str = None, main_category: str = None, sub_category: str = None, verified_only: bool = False) -> Optional[Dict[str, Any]]:
+        """Pineconeのメタデータフィルターを作成（条件がない場合はNone）"""
+        conditions = []
+        if city:
+            # 市区町村が設定されていない共通の情報も対象に含める
+            conditions.append({"city": {"$in": [city, ""]}})
+        if main_category:
+            conditions.append({"main_category": {"$eq": main_category}})
+        if sub_category:
+            conditions.append({"sub_category": {"$eq": sub_category}})
+        if verified_only:
+            conditions.append({"verified": {"$eq": True}})
+        
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    def query(
+        self,
+        query_text: str,
+        namespace: str = None,
+        top_k: int = DEFAULT_TOP_K,
+        similarity_threshold: float = SIMILARITY_THRESHOLD,
+        filter: Optional[Dict[str, Any]] = None,
+        alpha: Optional[float] = None,
+        city: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        クエリに基づいて類似チャンクを検索（filterはPineconeのメタデータフィルターとして送信）
+        alphaを指定するとBM25の疎ベクトルと組み合わせたハイブリッド検索を行う（密ベクトルの重み）
+        namespaceを指定しない場合は、cityの市区町村のnamespaceと共通情報のnamespaceを検索する（ない場合はすべてを並行して検索）
+        """
+        # 設定画面で変更された値を取得（引数で渡された値が優先）
+        if similarity_threshold == SIMILARITY_THRESHOLD:  # デフォルト値が使用されている場合
+            similarity_threshold = st.session_state.get("similarity_threshold", SIMILARITY_THRESHOLD)
+        
+        try:
+            # クエリのベクトル化
+            query_vector = self.get_embedding(query_text)
+            print(f"検索クエリ: {query_text}")
+            print(f"類似度しきい値: {similarity_threshold}")
+            print(f"取得する候補数: {top_k}")
+            if filter:
+                print(f"メタデータフィルター: {json.dumps(filter, ensure_ascii=False)}")
+            
+            # ハイブリッド検索では密ベクトルと疎ベクトルをalphaで重み付けする
+            sparse_vector = None
+            if alpha is not None and self.sparse_encoder:
+                query_vector, sparse_vector = self._hybrid_scale(query_vector, self.sparse_encoder.encode_query(query_text), alpha)
+                print(f"ハイブリッド検索: alpha={alpha}, 疎ベクトルの語数={len(sparse_vector['indices']) if sparse_vector else 0}")
+            
+            # 市区町村ごとのnamespaceがある場合は、問い合わせるnamespaceを絞り込む
+            namespaces = [namespace] if namespace else self.route_query_namespaces(city)
+            if len(namespaces) > 1:
+                print(f"検索するnamespace: {', '.join(namespace_city(target) or '共通' for target in namespaces)}")
+            scored_matches = self._query_namespaces(namespaces, query_vector, top_k, filter, sparse_vector)
+            matches = [match for _, match in scored_matches]
+            
+            print(f"取得した候補数: {len(matches)}")
+            if matches:
+                print("候補のスコア:")
+                for match in matches:
+                    print(f"スコア: {match.score:.3f}")
+            
+            # 類似度でフィルタリング（しきい値未満は除外）し、採用された候補のみテキストを補完する
+            filtered_matches = self._filter_matches(scored_matches, namespaces, similarity_threshold)
+            
+            print(f"しきい値({similarity_threshold})以上の候補数: {len(filtered_matches)}")
+            if filtered_matches:
+                print("採用された候補のスコア:")
+                for match in filtered_matches:
+                    print(f"スコア: {match.score:.3f}, テキスト: {match.metadata['text'][:100]}...")
+            else:
+                print("しきい値以上の候補が見つかりませんでした。")
+            
+            return {
+                "matches": filtered_matches,
+                "total_matches": len(matches),
+                "filtered_matches": len(filtered_matches)
+            }
+            
+        except Exception as e:
+            raise Exception(f"検索クエリの実行に失敗しました: {str(e)}")
+
+    def query_many(
+        self,
+        query_texts: List[str],
+        query_vectors: Optional[List[Optional[List[float]]]] = None,
+        namespace: str = None,
+        top_k: int = DEFAULT_TOP_K,
+        similarity_thresholds: Optional[List[float]] = None,
+        filter: Optional[Dict[str, Any]] = None,
+        city: Optional[str] = None
+    ) -> Iterator[Tuple[int, Optional[Dict[str, Any]]]]:
+        """
+        複数のクエリを並行して検索し、完了したクエリから (クエリの番号, queryと同じ形式の結果) を返す
+        埋め込みは1回のリクエストにまとめ（query_vectorsを渡した場合はそれを使用）、各namespaceへの問い合わせを並行して行う
+        検索に失敗したクエリの結果はNone（画面の設定は参照しないため、しきい値は呼び出し側で決めて渡す）
+        """
+        if not query_texts:
+            return
+        similarity_thresholds = similarity_thresholds or [SIMILARITY_THRESHOLD] * len(query_texts)
+        if query_vectors is None:
+            query_vectors = self.get_embeddings(query_texts)
+        namespaces = [namespace] if namespace else self.route_query_namespaces(city)
+        
+        # クエリとnamespaceの組み合わせごとに1件の問い合わせをスレッドプールに投入する
+        futures = {}
+        for i, query_vector in enumerate(query_vectors):
+            if query_vector is None:
+                print(f"クエリ {i + 1} の埋め込みベクトルを生成できなかったため検索しません: {query_texts[i]}")
+                yield i, None
+                continue
+            for target in namespaces:
+                future = self.query_executor.submit(self._query_namespace, target, query_vector, top_k, filter, None)
+                futures[future] = (i, target)
+        
+        results_by_query: Dict[int, Dict[Optional[str], Optional[List[Any]]]] = {}
+        for future in as_completed(futures):
+            i, target = futures[future]
+            try:
+                results_by_query.setdefault(i, {})[target] = future.result()
             except Exception as e:
-                if attempt < max_retries - 1:
-                    print(f"検索クエリの実行に失敗しました（試行 {attempt + 1}/{max_retries}）: {str(e)}")
-                    print(f"{retry_delay}秒後に再試行します...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2
-                else:
-                    raise Exception(f"検索クエリの実行に失敗しました（最大試行回数到達）: {str(e)}")
+                # 一部のnamespaceが失敗しても、残りの結果で回答できるようにする
+                print(f"クエリ {i + 1} のnamespace '{target or ''}' の検索に失敗しました: {str(e)}")
+                results_by_query.setdefault(i, {})[target] = None
+            
+            # クエリのすべてのnamespaceがそろったら統合して返す
+            query_results = results_by_query[i]
+            if len(query_results) < len(namespaces):
+                continue
+            if all(matches is None for matches in query_results.values()):
+                yield i, None
+                continue
+            scored_matches = self._merge_scored_matches(query_results, top_k)
+            filtered_matches = self._filter_matches(scored_matches, namespaces, similarity_thresholds[i])
+            yield i, {
+                "matches": filtered_matches,
+                "total_matches": len(scored_matches),
+                "filtered_matches": len(filtered_matches)
+            }
 
-    def get_index_stats(self, namespace: str = None) -> Dict[str, Any]:
-        """インデックスの統計情報を取得"""
-        max_retries = 3
-        retry_delay = 1
+    def _filter_matches(self, scored_matches: List[Tuple[Optional[str], Any]], namespaces: List[Optional[str]], similarity_threshold: float) -> List[Any]:
+        """しきい値以上の候補を取り出し、取得元のnamespaceを記録してテキストをローカルから補完する"""
+        filtered_scored_matches = [
+            (match_namespace, match) for match_namespace, match in scored_matches
+            if match.score >= similarity_threshold
+        ]
+        filtered_matches = []
+        for match_namespace, match in filtered_scored_matches:
+            # 候補のベクトルを後からfetchできるように、取得元のnamespaceを記録する
+            match.namespace = match_namespace
+            filtered_matches.append(match)
         
-        for attempt in range(max_retries):
+        store = get_document_store()
+        if store:
+            for target in namespaces:
+                store.hydrate(target, [match for match_namespace, match in filtered_scored_matches if match_namespace == target])
+        return filtered_matches
+
+    def route_query_namespaces(self, city: Optional[str] = None) -> List[Optional[str]]:
+        """既定のnamespaceへの検索で問い合わせるnamespaceを取得（市区町村ごとのnamespaceがなければ既定のみ）"""
+        try:
+            namespaces = self._describe_index_stats().namespaces or {}
+        except Exception as e:
+            print(f"namespaceの一覧を取得できなかったため既定のnamespaceのみ検索します: {str(e)}")
+            return [None]
+        return route_namespaces(city, namespaces.keys())
+
+    def _query_namespace(
+        self,
+        namespace: Optional[str],
+        query_vector: List[float],
+        top_k: int,
+        filter: Optional[Dict[str, Any]],
+        sparse_vector: Optional[Dict[str, List]]
+    ) -> List[Any]:
+        """1つのnamespaceを検索（同じ条件の検索結果がキャッシュにあればPineconeに問い合わせない）"""
+        query_cache = get_query_cache()
+        cache_key = query_cache.make_key(namespace, top_k, query_vector, filter, sparse_vector) if query_cache else None
+        # 検索中の書き込みで古い結果を新しい世代として保存しないように、検索前の世代番号を控える
+        matches, generation = query_cache.lookup(cache_key) if query_cache else (None, None)
+        if matches is not None:
+            print(f"検索結果キャッシュにヒットしました（namespace: '{namespace or ''}'）")
+            return matches
+        
+        results = self.retry.call(
+            "pinecone.query",
+            self.index.query,
+            vector=query_vector,
+            top_k=top_k,  # 必要な数だけ取得
+            include_metadata=True,
+            namespace=namespace,  # namespaceを指定
+            filter=filter,  # 絞り込みはPinecone側で行う
+            sparse_vector=sparse_vector,
+            description="検索クエリの実行"
+        )
+        matches = results.matches
+        if query_cache:
+            query_cache.put(cache_key, matches, generation)
+        return matches
+
+    def _query_namespaces(
+        self,
+        namespaces: List[Optional[str]],
+        query_vector: List[float],
+        top_k: int,
+        filter: Optional[Dict[str, Any]],
+        sparse_vector: Optional[Dict[str, List]]
+    ) -> List[Tuple[Optional[str], Any]]:
+        """複数のnamespaceを並行して検索し、スコアの高い順にtop_k件の (namespace, 候補) を返す"""
+        if len(namespaces) == 1:
+            return [(namespaces[0], match) for match in self._query_namespace(namespaces[0], query_vector, top_k, filter, sparse_vector)]
+        
+        futures = {
+            target: self.query_executor.submit(self._query_namespace, target, query_vector, top_k, filter, sparse_vector)
+            for target in namespaces
+        }
+        results: Dict[Optional[str], Optional[List[Any]]] = {}
+        errors = []
+        for target, future in futures.items():
             try:
-                stats = self.index.describe_index_stats()
-                # 辞書形式で返す
-                return {
-                    "total_vector_count": stats.total_vector_count,
-                    "namespaces": stats.namespaces,
-                    "dimension": stats.dimension,
-                    "index_fullness": stats.index_fullness,
-                    "metric": stats.metric
-                }
+                results[target] = future.result()
             except Exception as e:
-                if attempt < max_retries - 1:
-                    print(f"統計情報の取得に失敗しました（試行 {attempt + 1}/{max_retries}）: {str(e)}")
-                    print(f"{retry_delay}秒後に再試行します...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2
-                else:
-                    raise Exception(f"統計情報の取得に失敗しました（最大試行回数到達）: {str(e)}")
+                # 一部のnamespaceが失敗しても、残りの結果で回答できるようにする
+                print(f"namespace '{target or ''}' の検索に失敗しました: {str(e)}")
+                results[target] = None
+                errors.append(e)
+        if len(errors) == len(namespaces):
+            raise errors[0]
+        return self._merge_scored_matches(results, top_k)
+
+    @staticmethod
+    def _merge_scored_matches(results: Dict[Optional[str], Optional[List[Any]]], top_k: int) -> List[Tuple[Optional[str], Any]]:
+        """namespaceごとの検索結果を統合し、スコアの高い順にtop_k件の (namespace, 候補) を返す（失敗したnamespaceはNone）"""
+        scored_matches = [
+            (target, match)
+            for target, matches in results.items() if matches
+            for match in matches
+        ]
+        scored_matches.sort(key=lambda item: item[1].score, reverse=True)
+        return scored_matches[:top_k]
+
+    @staticmethod
+    def _hybrid_scale(dense: List[float], sparse: Dict[str, List], alpha: float) -> Tuple[List[float], Optional[Dict[str, List]]]:
+        """密ベクトルをalpha倍、疎ベクトルを(1 - alpha)倍して重み付け（疎ベクトルが空の場合はNone）"""
+        alpha = min(1.0, max(0.0, alpha))
+        scaled_dense = [value * alpha for value in dense]
+        if not sparse["indices"]:
+            return scaled_dense, None
+        return scaled_dense, {"indices": sparse["indices"], "values": [value * (1 - alpha) for value in sparse["values"]]}
+
+    def _describe_index_stats(self, force_refresh: bool = False):
+        """インデックスの統計情報を取得（TTL内はキャッシュを使用）"""
+        return self.stats_cache.get(
+            lambda: self.retry.call("pinecone.describe_index_stats", self.index.describe_index_stats, description="統計情報の取得"),
+            force=force_refresh
+        )
+
+    def invalidate_stats_cache(self) -> None:
+        """書き込み後に統計情報のキャッシュを破棄"""
+        self.stats_cache.invalidate()
+
+    def _invalidate_read_caches(self) -> None:
+        """インデックスへの書き込み後に統計情報と検索結果のキャッシュを無効にする"""
+        self.invalidate_stats_cache()
+        query_cache = get_query_cache()
+        if query_cache:
+            query_cache.bump_generation()
+        with self._geo_lock:
+            self._geo_indexes.clear()
+            self._geo_generation += 1
+
+    def get_stats_cache_info(self) -> Dict[str, Any]:
+        """統計情報キャッシュの経過時間とTTLを取得"""
+        return self.stats_cache.info()
+
+    def get_index_stats(self, namespace: str = None, force_refresh: bool = False) -> Dict[str, Any]:
+        """インデックスの統計情報を取得"""
+        try:
+            stats = self._describe_index_stats(force_refresh)
+            # 辞書形式で返す
+            return {
+                "total_vector_count": stats.total_vector_count,
+                "namespaces": stats.namespaces,
+                "dimension": stats.dimension,
+                "index_fullness": stats.index_fullness,
+                "metric": stats.metric
+            }
+        except Exception as e:
+            raise Exception(f"統計情報の取得に失敗しました: {str(e)}")
 
     def clear_index(self, namespace: str = None) -> None:
         """インデックスをクリア"""
         try:
             self.index.delete(delete_all=True, namespace=namespace)
+            self._invalidate_read_caches()
+            store = get_document_store()
+            if store:
+                store.clear(namespace)
+            catalog = get_metadata_catalog()
+            if catalog:
+                catalog.clear(namespace)
+            if self.sparse_encoder:
+                self.sparse_encoder.clear(namespace)
             print(f"インデックスをクリアしました（namespace: {namespace if namespace else 'default'}）")
         except Exception as e:
             raise Exception(f"インデックスのクリアに失敗しました: {str(e)}")
 
     def get_index_data(self) -> List[Dict]:
         """インデックスのデータを取得"""
+        return list(self.iter_index_data())
+
+    def iter_index_data(self) -> Iterator[Dict]:
+        """全namespaceのベクトルのメタデータを順次取得"""
         try:
             # インデックスの統計情報を取得
-            stats = self.index.describe_index_stats()
+            stats = self._describe_index_stats()
             
-            # インデックスが空の場合は空のリストを返す
+            # インデックスが空の場合は何も返さない
             if stats.total_vector_count == 0:
-                return []
+                return
             
-            # 全ベクトルのIDを取得
-            all_vectors = []
             for namespace in stats.namespaces:
-                # ダミーベクトルを作成（全要素が0のベクトル）
-                dummy_vector = [0.0] * self.dimension
-                
-                # クエリを使用してベクトルIDを取得
-                results = self.index.query(
-                    vector=dummy_vector,
-                    top_k=10000,  # 十分大きな数を指定
-                    include_metadata=True,
-                    namespace=namespace
-                )
-                
-                if results.matches:
-                    # 取得したIDを使用してベクトルを取得
-                    vector_ids = [match.id for match in results.matches]
-                    fetch_results = self.index.fetch(
-                        ids=vector_ids,
-                        namespace=namespace
-                    )
-                    if fetch_results.vectors:
-                        all_vectors.extend(fetch_results.vectors.values())
-            
-            # メタデータを抽出
-            data = []
-            for vector in all_vectors:
-                if 'metadata' in vector:
+                for vector in self.iter_vectors(namespace=namespace, hydrate=False):
                     metadata = vector.metadata
                     # 必要なメタデータを抽出
-                    item = {
+                    yield {
                         'filename': metadata.get('filename', ''),
                         'chunk_id': metadata.get('chunk_id', ''),
                         'main_category': metadata.get('main_category', ''),
@@ -392,16 +1145,13 @@ class PineconeService:
                         'upload_date': metadata.get('upload_date', ''),
                         'source': metadata.get('source', '')
                     }
-                    data.append(item)
-            
-            return data
         except Exception as e:
             raise Exception(f"インデックスデータの取得に失敗しました: {str(e)}")
 
     def get_stats(self, namespace: str = None) -> dict:
         """指定されたnamespaceの統計情報を取得"""
         try:
-            stats = self.index.describe_index_stats()
+            stats = self._describe_index_stats()
             if namespace:
                 return stats.namespaces.get(namespace, {})
             return stats
@@ -409,43 +1159,91 @@ class PineconeService:
             raise Exception(f"統計情報の取得に失敗しました: {str(e)}")
 
     def list_vectors(self, namespace: str = None, limit: int = 1000) -> list:
-        """指定されたnamespaceのベクトルを取得"""
+        """指定されたnamespaceのベクトルを取得（最大limit件）"""
         try:
-            # インデックスの統計情報を取得
-            stats = self.index.describe_index_stats()
-            
-            # 指定されたnamespaceが存在しない場合は空のリストを返す
-            if namespace and namespace not in stats.namespaces:
-                return []
-            
-            # ダミーベクトルを作成（全要素が0のベクトル）
-            dummy_vector = [0.0] * self.dimension
-            
-            # クエリを使用してベクトルIDを取得
-            results = self.index.query(
-                vector=dummy_vector,
-                top_k=limit,  # 指定された制限数を使用
-                include_metadata=True,
-                namespace=namespace
-            )
-            
-            if not results.matches:
-                return []
-            
-            # 取得したIDを使用してベクトルを取得
-            vector_ids = [match.id for match in results.matches]
-            fetch_results = self.index.fetch(
-                ids=vector_ids,
-                namespace=namespace
-            )
-            
-            # 結果を制限
-            vectors = list(fetch_results.vectors.values())[:limit] if fetch_results.vectors else []
-            
-            return vectors
+            return list(itertools.islice(self.iter_vectors(namespace=namespace), limit))
         except Exception as e:
             raise Exception(f"ベクトルの取得に失敗しました: {str(e)}")
 
+    def iter_vectors(
+        self,
+        namespace: str = None,
+        prefix: str = None,
+        include_values: bool = False,
+        hydrate: bool = True
+    ) -> Iterator[VectorRecord]:
+        """指定されたnamespaceのベクトルをページ単位で列挙しながら順次返す（件数の上限なし）"""
+        store = get_document_store() if hydrate else None
+        for page in self.vector_enumerator.iter_pages(namespace=namespace, prefix=prefix, include_values=include_values):
+            if store:
+                store.hydrate(namespace, page)
+            yield from page
+
+    def reconcile_catalog(self, namespaces: List[str] = None) -> Dict[str, int]:
+        """Pineconeの内容でローカルのメタデータカタログを作り直し、namespaceごとの件数を返す"""
+        catalog = get_metadata_catalog()
+        if not catalog:
+            return {}
+        try:
+            if namespaces is None:
+                namespaces = list(self._describe_index_stats(force_refresh=True).namespaces.keys())
+            counts = {}
+            for namespace in namespaces:
+                counts[namespace] = catalog.replace_namespace(namespace, self.iter_vectors(namespace=namespace))
+                print(f"メタデータカタログを同期しました（namespace: {namespace or 'default'}, {counts[namespace]}件）")
+            return counts
+        except Exception as e:
+            raise Exception(f"メタデータカタログの同期に失敗しました: {str(e)}")
+
+    def get_catalog(self, namespaces: List[str] = None) -> Optional[MetadataCatalog]:
+        """ローカルのメタデータカタログを取得（一度も同期していないnamespaceはPineconeから取り込む）"""
+        catalog = get_metadata_catalog()
+        if not catalog:
+            return None
+        if namespaces is None:
+            namespaces = list(self._describe_index_stats().namespaces.keys())
+        unsynced = [namespace for namespace in namespaces if not catalog.is_synced(namespace)]
+        if unsynced:
+            self.reconcile_catalog(unsynced)
+        return catalog
+
+    def get_geo_index(self, namespace: str = None, city: Optional[str] = None) -> Optional[GeoIndex]:
+        """施設の位置情報から作成した空間インデックスを取得（namespace未指定時はcityの検索対象のnamespaceをまとめる。無効または作成失敗時はNone）"""
+        if not GEO_SEARCH_ENABLED:
+            return None
+        # 検索と同じく、既定のnamespaceの指定時は市区町村ごとのnamespaceも対象にする
+        namespaces = [namespace] if namespace else self.route_query_namespaces(city)
+        keys = [target or "" for target in namespaces]
+        cache_key = "\n".join(keys)
+        with self._geo_lock:
+            if cache_key in self._geo_indexes:
+                return self._geo_indexes[cache_key]
+            generation = self._geo_generation
+        # カタログの同期はPineconeへの問い合わせを伴うため、ロックの外で作成してキャッシュの無効化を待たせない
+        try:
+            # ローカルのメタデータカタログがあればPineconeへの問い合わせなしで作成する
+            catalog = self.get_catalog(keys)
+            if catalog:
+                entries = itertools.chain.from_iterable(catalog.list_entries(key) for key in keys)
+            else:
+                entries = (
+                    {"id": record.id, "metadata": record.metadata}
+                    for target in namespaces
+                    for record in self.iter_vectors(namespace=target)
+                )
+            geo_index = GeoIndex.build(entries)
+            print(f"空間インデックスを作成しました（namespace: {', '.join(key or 'default' for key in keys)}, {len(geo_index)}件）")
+        except Exception as e:
+            print(f"空間インデックスの作成に失敗しました: {str(e)}")
+            return None
+        with self._geo_lock:
+            # 同時に作成済みのものがあればそれを使い、作成中に書き込みがあれば次回に作り直す
+            if cache_key in self._geo_indexes:
+                return self._geo_indexes[cache_key]
+            if generation == self._geo_generation:
+                self._geo_indexes[cache_key] = geo_index
+        return geo_index
+
     def get_by_id(self, vector_id: str, namespace: str = None) -> Dict[str, Any]:
         """指定されたIDのベクトルを取得"""
         try:
@@ -457,6 +1255,9 @@ class PineconeService:
                 
             # 最初のベクトルを取得
             vector = result.vectors[vector_id]
+            store = get_document_store()
+            if store:
+                store.hydrate(namespace, [vector])
             
             # 結果を整形
             return {
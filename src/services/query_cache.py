@@ -0,0 +1,199 @@
+from typing import List, Dict, Any, Optional, Tuple
+from collections import OrderedDict
+import copy
+import hashlib
+import json
+import threading
+import time
+from src.utils.local_state import open_sqlite, encode_vector
+from src.config.settings import (
+    QUERY_CACHE_ENABLED,
+    QUERY_CACHE_MAX_ENTRIES,
+    QUERY_CACHE_TTL,
+    QUERY_CACHE_PERSIST,
+    QUERY_CACHE_PATH
+)
+
+class CachedMatch:
+    """キャッシュから復元した検索結果（Pineconeのmatchと同じくid・score・metadataを持つ）"""
+
+    def __init__(self, id: str, score: float, metadata: Optional[Dict[str, Any]] = None):
+        self.id = id
+        self.score = score
+        self.metadata = metadata if metadata is not None else {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "score": self.score, "metadata": self.metadata}
+
+class QueryResultCache:
+    def __init__(
+        self,
+        max_entries: int = QUERY_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = QUERY_CACHE_TTL,
+        path: Optional[str] = None
+    ):
+        """検索結果キャッシュの初期化（pathを指定した場合はSQLiteにも保存してプロセス間で共有）"""
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        self._conn = None
+        if path:
+            self._conn = open_sqlite(path)
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    generation INTEGER NOT NULL,
+                    matches TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS generation (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    value INTEGER NOT NULL
+                );
+                INSERT OR IGNORE INTO generation (id, value) VALUES (0, 0);
+                """
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(
+        namespace: Optional[str],
+        top_k: int,
+        query_vector: List[float],
+        filter: Optional[Dict[str, Any]] = None,
+        sparse_vector: Optional[Dict[str, List]] = None
+    ) -> str:
+        """namespace・top_k・フィルター・クエリベクトル（疎ベクトルを含む）のハッシュからキャッシュキーを作成"""
+        vector_hash = hashlib.sha256(encode_vector(query_vector)).hexdigest()
+        filter_json = json.dumps(filter or {}, sort_keys=True, ensure_ascii=False)
+        sparse_json = json.dumps(sparse_vector or {}, sort_keys=True)
+        source = f"{namespace or ''}\0{top_k}\0{filter_json}\0{vector_hash}\0{sparse_json}"
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+    def current_generation(self) -> int:
+        """書き込みごとに増える世代番号を取得（ディスク共有時は他プロセスの更新も反映）"""
+        if self._conn is not None:
+            self._generation = self._conn.execute("SELECT value FROM generation WHERE id = 0").fetchone()[0]
+        return self._generation
+
+    def bump_generation(self) -> int:
+        """インデックスへの書き込み後に世代番号を進め、以前の結果を無効にする"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.execute("UPDATE generation SET value = value + 1 WHERE id = 0")
+                self._conn.execute("DELETE FROM results")
+                self._conn.commit()
+            else:
+                self._generation += 1
+            self._entries.clear()
+            return self.current_generation()
+
+    def get(self, key: str) -> Optional[List[CachedMatch]]:
+        """キャッシュから検索結果を取得（世代が古いか期限切れの場合はNone）"""
+        return self.lookup(key)[0]
+
+    def lookup(self, key: str) -> Tuple[Optional[List[CachedMatch]], int]:
+        """
+        キャッシュから (検索結果, 現在の世代番号) を取得（世代が古いか期限切れの場合、検索結果はNone）
+        見つからなかった場合は、返した世代番号を検索後のputに渡す
+        """
+        with self._lock:
+            generation = self.current_generation()
+            entry = self._entries.get(key)
+            if entry is None and self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT generation, matches, created_at FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row:
+                    entry = (row[0], json.loads(row[1]), row[2])
+                    self._entries[key] = entry
+
+            if entry is None or entry[0] != generation or self._is_expired(entry[2]):
+                self.misses += 1
+                if entry is not None:
+                    self._entries.pop(key, None)
+                return None, generation
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            # 呼び出し側が属性を追加・変更しても影響しないように複製して返す
+            return [
+                CachedMatch(match["id"], match["score"], copy.deepcopy(match["metadata"]))
+                for match in entry[1]
+            ], generation
+
+    def put(self, key: str, matches: List[Any], generation: Optional[int] = None) -> None:
+        """
+        検索結果（id・score・metadataを持つオブジェクト）を保存
+        generationには検索を始める前の世代番号を渡す（検索中に書き込みがあり世代が進んだ場合は保存しない）
+        """
+        serialized = [
+            {"id": match.id, "score": match.score, "metadata": copy.deepcopy(dict(match.metadata or {}))}
+            for match in matches
+        ]
+        now = time.time()
+        with self._lock:
+            current_generation = self.current_generation()
+            if generation is not None and generation != current_generation:
+                return
+            generation = current_generation
+            self._entries[key] = (generation, serialized, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO results (key, generation, matches, created_at) VALUES (?, ?, ?, ?)",
+                    (key, generation, json.dumps(serialized, ensure_ascii=False), now)
+                )
+                self._conn.execute(
+                    "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+                self._conn.commit()
+
+    def _is_expired(self, created_at: float) -> bool:
+        """TTLを過ぎたかを確認（他のインスタンスからの書き込みに備える）"""
+        return self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds
+
+    def stats(self) -> Dict[str, Any]:
+        """キャッシュのヒット率と件数を取得"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "generation": self.current_generation(),
+                "persistent": self._conn is not None
+            }
+
+_shared_cache: Optional[QueryResultCache] = None
+_shared_cache_failed = False
+_shared_cache_lock = threading.Lock()
+
+def get_query_cache() -> Optional[QueryResultCache]:
+    """プロセス全体で共有する検索結果キャッシュを取得（無効または初期化失敗時はNone）"""
+    global _shared_cache, _shared_cache_failed
+    if not QUERY_CACHE_ENABLED or _shared_cache_failed:
+        return None
+
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            try:
+                _shared_cache = QueryResultCache(path=QUERY_CACHE_PATH if QUERY_CACHE_PERSIST else None)
+            except Exception as e:
+                # キャッシュが使えなくても検索自体は行えるようにする
+                print(f"検索結果キャッシュの初期化に失敗しました（キャッシュなしで続行します）: {str(e)}")
+                _shared_cache_failed = True
+                return None
+        return _shared_cache
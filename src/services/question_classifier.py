@@ -4,6 +4,7 @@ from langchain.prompts import ChatPromptTemplate
 from langchain.output_parsers import PydanticOutputParser
 from pydantic import BaseModel, Field
 from src.config.settings import OPENAI_API_KEY
+from src.services.retry_scheduler import get_retry_scheduler
 
 class QuestionType(BaseModel):
     """質問タイプを表すモデル"""
@@ -24,9 +25,11 @@ class QuestionClassifier:
         if not OPENAI_API_KEY:
             raise ValueError("OPENAI_API_KEY is not set in settings")
         
+        # 再試行は共有の再試行スケジューラーで行う
         self.llm = ChatOpenAI(
             model_name=model_name,
-            openai_api_key=OPENAI_API_KEY
+            openai_api_key=OPENAI_API_KEY,
+            max_retries=0
         )
         self.parser = PydanticOutputParser(pydantic_object=QuestionType)
         
@@ -59,10 +62,10 @@ class QuestionClassifier:
     def classify(self, question: str) -> QuestionType:
         """質問のタイプを判別する"""
         chain = self.prompt | self.llm | self.parser
-        return chain.invoke({
+        return get_retry_scheduler().call("openai.chat", chain.invoke, {
             "question": question,
             "format_instructions": self.parser.get_format_instructions()
-        })
+        }, description="質問タイプの判別")
 
     def get_question_type(self, question: str) -> Optional[str]:
         """質問タイプを取得（確信度が0.7以上の場合のみ）"""
@@ -3,6 +3,7 @@ from dataclasses import dataclass
 from langchain.prompts import ChatPromptTemplate
 from openai import OpenAI
 from src.config.settings import OPENAI_API_KEY
+from src.services.retry_scheduler import get_retry_scheduler
 import streamlit as st
 
 @dataclass
@@ -75,7 +76,9 @@ class AnswerExampleGenerator:
         """回答例生成サービスの初期化"""
         if not OPENAI_API_KEY:
             raise ValueError("OpenAI APIキーが設定されていません")
-        self.openai_client = OpenAI(api_key=OPENAI_API_KEY)
+        # 再試行は共有の再試行スケジューラーで行うため、クライアント側では再試行しない
+        self.openai_client = OpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+        self.retry = get_retry_scheduler()
 
     def generate_answer_examples(self, text: str, category: str = "", subcategory: str = "", max_answers: int = 3) -> List[Dict[str, str]]:
         """テキスト内容に基づいて回答例を生成"""
@@ -112,7 +115,10 @@ class AnswerExampleGenerator:
 回答: 近隣には○○小学校、○○中学校があり、教育環境が整っています。
 """
 
-            response = self.openai_client.chat.completions.create(
+            response = self.retry.call(
+                "openai.chat",
+                self.openai_client.chat.completions.create,
+                description="回答例の生成",
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": "あなたは質問・回答例生成の専門家です。テキスト内容に基づいて適切な質問・回答例を生成してください。"},
@@ -197,7 +203,10 @@ class AnswerExampleGenerator:
 
 改善された質問・回答例を生成してください:"""
 
-            response = self.openai_client.chat.completions.create(
+            response = self.retry.call(
+                "openai.chat",
+                self.openai_client.chat.completions.create,
+                description="回答例の改善",
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": "あなたは質問・回答例改善の専門家です。既存の質問・回答例を分析して、より良い質問・回答例を提案してください。"},
@@ -0,0 +1,257 @@
+from typing import Any, Callable, Dict, Optional
+from email.utils import parsedate_to_datetime
+import random
+import threading
+import time
+from src.config.settings import (
+    RETRY_MAX_ATTEMPTS,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+    RETRY_AFTER_MAX_SECONDS,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_SECONDS
+)
+
+# 再試行する HTTP ステータス（タイムアウト・レート制限。500以上のサーバーエラーも再試行する）
+RETRYABLE_STATUS_CODES = {408, 429}
+# ステータスのない例外のうち、接続の失敗やタイムアウトとして再試行する例外
+TRANSPORT_ERRORS = (ConnectionError, TimeoutError)
+# 同じく再試行するクライアントライブラリの通信エラーのクラス名（openai・httpx・urllib3は任意の依存のため名前で判定する）
+TRANSPORT_ERROR_NAMES = {
+    "APIConnectionError", "APITimeoutError",
+    "TransportError", "TimeoutException", "NetworkError",
+    "MaxRetryError", "NewConnectionError", "ConnectTimeoutError", "ReadTimeoutError", "ProtocolError"
+}
+
+class CircuitOpenError(Exception):
+    """依存先が連続して失敗しているため、呼び出さずに失敗させたことを示す例外"""
+
+def get_status_code(error: Exception) -> Optional[int]:
+    """例外からHTTPステータスを取得（OpenAIはstatus_code、Pineconeはstatusに保持している）"""
+    for attribute in ("status_code", "status"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """例外の応答ヘッダーから待機秒数を取得（retry-after-ms・retry-afterの秒数または日時）"""
+    headers = getattr(error, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+
+    try:
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms is not None:
+            return float(retry_after_ms) / 1000
+        retry_after = headers.get("retry-after")
+        if retry_after is None:
+            return None
+        try:
+            return float(retry_after)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except Exception:
+        return None
+
+def is_transport_error(error: Exception) -> bool:
+    """接続の失敗やタイムアウトなど、応答を受け取れなかった通信エラーかを判定"""
+    if isinstance(error, TRANSPORT_ERRORS):
+        return True
+    return any(cls.__name__ in TRANSPORT_ERROR_NAMES for cls in type(error).__mro__)
+
+def is_retryable(error: Exception) -> bool:
+    """再試行で回復する可能性がある例外かを判定（ステータスがない例外は通信エラーのみ再試行する）"""
+    if isinstance(error, CircuitOpenError):
+        return False
+    status_code = get_status_code(error)
+    if status_code is None:
+        return is_transport_error(error)
+    return status_code in RETRYABLE_STATUS_CODES or status_code >= 500
+
+class CircuitBreaker:
+    """連続した失敗が上限に達すると一定時間呼び出しを止め、その後1件だけ試行して回復を確認する"""
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """closed（通常）・open（遮断中）・half_open（回復の確認中）"""
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_seconds:
+            return "open"
+        return "half_open"
+
+    def remaining_seconds(self) -> float:
+        """遮断が解除されるまでの秒数"""
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+    def allow(self) -> bool:
+        """呼び出してよいかを判定（half_openでは同時に1件のみ許可）"""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            if self._trial_in_progress or self.consecutive_failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_progress = False
+
+    def release(self) -> None:
+        """失敗として数えずに回復確認の試行を終える（レート制限などで結果が分からなかった場合）"""
+        with self._lock:
+            self._trial_in_progress = False
+
+def is_backpressure(error: Exception) -> bool:
+    """レート制限（429またはRetry-Afterの指定あり）による失敗かを判定（依存先の障害ではなく待機すれば回復する）"""
+    return get_status_code(error) == 429 or get_retry_after(error) is not None
+
+class RetryScheduler:
+    """OpenAI・Pineconeの呼び出しを、ゆらぎを加えた待機で再試行し、エンドポイントごとのサーキットブレーカーで保護する"""
+
+    def __init__(
+        self,
+        max_attempts: int = RETRY_MAX_ATTEMPTS,
+        base_delay: float = RETRY_BASE_DELAY,
+        max_delay: float = RETRY_MAX_DELAY,
+        retry_after_max: float = RETRY_AFTER_MAX_SECONDS,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_seconds: float = CIRCUIT_RESET_SECONDS,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_after_max = retry_after_max
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._sleep = sleep
+        self._random = random.Random()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._metrics: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _breaker(self, endpoint: str) -> CircuitBreaker:
+        with self._lock:
+            if endpoint not in self._breakers:
+                self._breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.reset_seconds)
+                self._metrics[endpoint] = {
+                    "calls": 0, "successes": 0, "failures": 0, "retries": 0, "rejected": 0, "sleep_seconds": 0.0
+                }
+            return self._breakers[endpoint]
+
+    def _record(self, endpoint: str, **increments: float) -> None:
+        with self._lock:
+            metrics = self._metrics[endpoint]
+            for key, value in increments.items():
+                metrics[key] += value
+
+    def next_delay(self, previous_delay: float) -> float:
+        """decorrelated jitter: 前回の待機時間の3倍までの範囲から無作為に選ぶ（上限あり）"""
+        with self._lock:
+            return min(self.max_delay, self._random.uniform(self.base_delay, max(self.base_delay, previous_delay * 3)))
+
+    def call(self, endpoint: str, fn: Callable[..., Any], *args, description: str = None, max_attempts: int = None, **kwargs) -> Any:
+        """fnを呼び出し、再試行可能な失敗は待機して再試行（最終的に失敗した場合は元の例外を送出）"""
+        breaker = self._breaker(endpoint)
+        description = description or endpoint
+        max_attempts = max_attempts or self.max_attempts
+        delay = self.base_delay
+
+        for attempt in range(1, max_attempts + 1):
+            if not breaker.allow():
+                self._record(endpoint, rejected=1)
+                raise CircuitOpenError(
+                    f"{endpoint} の呼び出しが連続して失敗したため一時的に停止しています（あと{breaker.remaining_seconds():.0f}秒）"
+                )
+
+            self._record(endpoint, calls=1)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                retryable = is_retryable(e)
+                if retryable and is_backpressure(e):
+                    # レート制限は指定された時間待てば回復するため、遮断の判定に含めない
+                    breaker.release()
+                elif retryable:
+                    breaker.record_failure()
+                else:
+                    # 入力の誤りやプログラムの不具合は依存先の障害ではないため遮断の判定に含めない
+                    # （依存先の回復を確認できたわけでもないため、連続失敗の回数はそのまま残す）
+                    breaker.release()
+                # 遮断された場合は待機しても呼び出せないため、すぐに失敗させる
+                if not retryable or attempt == max_attempts or breaker.state == "open":
+                    self._record(endpoint, failures=1)
+                    raise
+
+                retry_after = get_retry_after(e)
+                if retry_after is not None:
+                    delay = min(self.retry_after_max, retry_after)
+                else:
+                    delay = self.next_delay(delay)
+                self._record(endpoint, retries=1, sleep_seconds=delay)
+                print(f"{description}に失敗しました（試行 {attempt}/{max_attempts}）: {str(e)}")
+                print(f"{delay:.1f}秒後に再試行します...")
+                self._sleep(delay)
+            else:
+                breaker.record_success()
+                self._record(endpoint, successes=1)
+                return result
+
+    def remaining_seconds(self, *endpoints: str) -> float:
+        """指定したエンドポイントの遮断がすべて解除されるまでの秒数（遮断されていなければ0）"""
+        with self._lock:
+            breakers = [self._breakers[endpoint] for endpoint in endpoints if endpoint in self._breakers]
+        return max((breaker.remaining_seconds() for breaker in breakers), default=0.0)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """エンドポイントごとの呼び出し・再試行・待機時間とサーキットの状態を取得"""
+        with self._lock:
+            snapshot = {endpoint: dict(metrics) for endpoint, metrics in self._metrics.items()}
+            breakers = dict(self._breakers)
+        for endpoint, metrics in snapshot.items():
+            metrics["sleep_seconds"] = round(metrics["sleep_seconds"], 2)
+            metrics["circuit"] = breakers[endpoint].state
+        return snapshot
+
+_shared_scheduler: Optional[RetryScheduler] = None
+_shared_scheduler_lock = threading.Lock()
+
+def get_retry_scheduler() -> RetryScheduler:
+    """プロセス全体で共有する再試行スケジューラーを取得（サーキットの状態と集計を全呼び出しで共有する）"""
+    global _shared_scheduler
+    with _shared_scheduler_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = RetryScheduler()
+        return _shared_scheduler
@@ -0,0 +1,55 @@
+from typing import List, Optional
+import threading
+import streamlit as st
+from src.services.pinecone_service import PineconeService
+from src.services.langchain_service import ChatResources, LangChainService
+
+class ServiceContainer:
+    """Streamlitの再実行やセッションをまたいで共有する重いクライアントを保持"""
+
+    def __init__(self):
+        self.warnings: List[str] = []
+        self.callback_manager = self._create_callback_manager()
+        self._pinecone_service: Optional[PineconeService] = None
+        self._chat_resources: Optional[ChatResources] = None
+        self._lock = threading.Lock()
+
+    def _create_callback_manager(self):
+        """LangSmithのトレーサーを初期化（失敗した場合はNone）"""
+        try:
+            from langsmith import Client
+            from langchain.callbacks.tracers import LangChainTracer
+            from langchain.callbacks.manager import CallbackManager
+            Client()
+            return CallbackManager([LangChainTracer()])
+        except Exception as e:
+            self.warnings.append(f"LangSmithの初期化に失敗しました: {str(e)}")
+            return None
+
+    def get_pinecone_service(self) -> PineconeService:
+        """共有のPineconeサービスを取得（失敗した場合は次回の呼び出しで再試行する）"""
+        with self._lock:
+            if self._pinecone_service is None:
+                self._pinecone_service = PineconeService()
+            return self._pinecone_service
+
+    def get_chat_resources(self) -> ChatResources:
+        """共有のチャット用リソースを取得"""
+        pinecone_service = self.get_pinecone_service()
+        with self._lock:
+            if self._chat_resources is None:
+                self._chat_resources = ChatResources(
+                    callback_manager=self.callback_manager,
+                    pinecone_service=pinecone_service,
+                    openai_client=pinecone_service.openai_client
+                )
+            return self._chat_resources
+
+    def create_langchain_service(self) -> LangChainService:
+        """セッションごとのLangChainサービスを作成（クライアントは共有リソースを使用）"""
+        return LangChainService(resources=self.get_chat_resources())
+
+@st.cache_resource(show_spinner=False)
+def get_service_container() -> ServiceContainer:
+    """プロセス全体で共有するサービスコンテナを取得"""
+    return ServiceContainer()
@@ -0,0 +1,231 @@
+from typing import List, Dict, Any, Optional, Tuple
+from collections import Counter
+import hashlib
+import json
+import math
+import threading
+from src.utils.local_state import open_sqlite
+from src.utils.text_processing import JapaneseTextProcessor
+from src.config.settings import (
+    HYBRID_SEARCH_ENABLED,
+    BM25_STATS_PATH,
+    BM25_K1,
+    BM25_B,
+    KEYWORD_PROPER_NOUN_RATIO
+)
+
+class BM25SparseEncoder:
+    def __init__(self, path: str = BM25_STATS_PATH, k1: float = BM25_K1, b: float = BM25_B):
+        """Janomeで分かち書きしたBM25形式の疎ベクトルを作成するエンコーダーの初期化（コーパス統計はSQLiteに保存）"""
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.processor = JapaneseTextProcessor()
+        self._lock = threading.Lock()
+        self._conn = open_sqlite(path)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS corpus (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                n_docs INTEGER NOT NULL,
+                total_length INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO corpus (id, n_docs, total_length) VALUES (0, 0, 0);
+            CREATE TABLE IF NOT EXISTS document_frequency (
+                term_id INTEGER PRIMARY KEY,
+                df INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS document_terms (
+                namespace TEXT NOT NULL,
+                vector_id TEXT NOT NULL,
+                length INTEGER NOT NULL,
+                term_ids TEXT NOT NULL,
+                PRIMARY KEY (namespace, vector_id)
+            );
+            """
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def term_id(term: str) -> int:
+        """語を疎ベクトルのインデックス（32ビット整数）に変換"""
+        return int.from_bytes(hashlib.md5(term.encode("utf-8")).digest()[:4], "big")
+
+    def _term_counts(self, text: str) -> Counter:
+        """テキスト中の語IDごとの出現回数を取得"""
+        return Counter(self.term_id(term) for term in self.processor.extract_terms(text))
+
+    def _corpus_stats(self) -> Tuple[int, float]:
+        """登録済みの文書数と平均文書長を取得"""
+        with self._lock:
+            n_docs, total_length = self._conn.execute("SELECT n_docs, total_length FROM corpus WHERE id = 0").fetchone()
+        return n_docs, (total_length / n_docs if n_docs else 0.0)
+
+    @staticmethod
+    def _normalize(weights: Dict[int, float]) -> Dict[str, List]:
+        """重みをL2正規化してPineconeの疎ベクトル形式に変換"""
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        if norm == 0:
+            return {"indices": [], "values": []}
+        indices = sorted(weights)
+        return {"indices": indices, "values": [weights[index] / norm for index in indices]}
+
+    def encode_documents(self, texts: List[str]) -> List[Dict[str, List]]:
+        """文書側の疎ベクトルを作成（語の出現回数を文書長で正規化したBM25のTF成分）"""
+        counts_list = [self._term_counts(text) for text in texts]
+        _, avgdl = self._corpus_stats()
+        if avgdl == 0:
+            # 最初のアップロードではバッチ内の平均文書長を使用する
+            lengths = [sum(counts.values()) for counts in counts_list]
+            avgdl = (sum(lengths) / len(lengths)) if lengths and sum(lengths) else 1.0
+
+        sparse_vectors = []
+        for counts in counts_list:
+            doc_length = sum(counts.values())
+            length_norm = self.k1 * (1 - self.b + self.b * doc_length / avgdl)
+            weights = {
+                term_id: tf * (self.k1 + 1) / (tf + length_norm)
+                for term_id, tf in counts.items()
+            }
+            sparse_vectors.append(self._normalize(weights))
+        return sparse_vectors
+
+    def encode_query(self, text: str) -> Dict[str, List]:
+        """クエリ側の疎ベクトルを作成（語ごとのIDF）"""
+        term_ids = list(self._term_counts(text))
+        if not term_ids:
+            return {"indices": [], "values": []}
+
+        n_docs, _ = self._corpus_stats()
+        with self._lock:
+            placeholders = ",".join("?" * len(term_ids))
+            rows = self._conn.execute(
+                f"SELECT term_id, df FROM document_frequency WHERE term_id IN ({placeholders})",
+                term_ids
+            ).fetchall()
+        document_frequency = dict(rows)
+
+        weights = {}
+        for term_id in term_ids:
+            df = document_frequency.get(term_id, 0)
+            weights[term_id] = math.log((n_docs - df + 0.5) / (df + 0.5) + 1) if n_docs else 1.0
+        return self._normalize(weights)
+
+    def _remove_documents(self, namespace: Optional[str], vector_ids: List[str]) -> int:
+        """登録済みの文書の寄与をコーパス統計から差し引く（ロックを取得して呼び出す、差し引いた件数を返す）"""
+        rows = []
+        for i in range(0, len(vector_ids), 500):
+            id_batch = vector_ids[i:i + 500]
+            placeholders = ",".join("?" * len(id_batch))
+            rows.extend(self._conn.execute(
+                f"SELECT vector_id, length, term_ids FROM document_terms WHERE namespace = ? AND vector_id IN ({placeholders})",
+                [namespace or ""] + id_batch
+            ).fetchall())
+        if not rows:
+            return 0
+
+        document_frequency = Counter()
+        for _, _, term_ids in rows:
+            document_frequency.update(json.loads(term_ids))
+        self._conn.execute(
+            "UPDATE corpus SET n_docs = MAX(0, n_docs - ?), total_length = MAX(0, total_length - ?) WHERE id = 0",
+            (len(rows), sum(length for _, length, _ in rows))
+        )
+        self._conn.executemany(
+            "UPDATE document_frequency SET df = df - ? WHERE term_id = ?",
+            [(count, term_id) for term_id, count in document_frequency.items()]
+        )
+        self._conn.execute("DELETE FROM document_frequency WHERE df <= 0")
+        self._conn.executemany(
+            "DELETE FROM document_terms WHERE namespace = ? AND vector_id = ?",
+            [(namespace or "", vector_id) for vector_id, _, _ in rows]
+        )
+        return len(rows)
+
+    def fit(self, namespace: Optional[str], vector_ids: List[str], texts: List[str]) -> None:
+        """
+        アップロードした文書でコーパス統計（文書数・文書長・語の文書頻度）を更新
+        同じIDの文書が登録済みの場合は前回の寄与を差し引いてから加える（更新しても統計がずれない）
+        """
+        documents = {vector_id: self._term_counts(text) for vector_id, text in zip(vector_ids, texts)}
+        document_frequency = Counter()
+        for counts in documents.values():
+            document_frequency.update(counts.keys())
+
+        with self._lock:
+            self._remove_documents(namespace, list(documents))
+            self._conn.execute(
+                "UPDATE corpus SET n_docs = n_docs + ?, total_length = total_length + ? WHERE id = 0",
+                (len(documents), sum(sum(counts.values()) for counts in documents.values()))
+            )
+            self._conn.executemany(
+                "INSERT INTO document_frequency (term_id, df) VALUES (?, ?) "
+                "ON CONFLICT (term_id) DO UPDATE SET df = df + excluded.df",
+                list(document_frequency.items())
+            )
+            self._conn.executemany(
+                "INSERT INTO document_terms (namespace, vector_id, length, term_ids) VALUES (?, ?, ?, ?)",
+                [
+                    (namespace or "", vector_id, sum(counts.values()), json.dumps(sorted(counts)))
+                    for vector_id, counts in documents.items()
+                ]
+            )
+            self._conn.commit()
+
+    def remove(self, namespace: Optional[str], vector_ids: List[str]) -> None:
+        """削除した文書の寄与をコーパス統計から差し引く"""
+        with self._lock:
+            self._remove_documents(namespace, vector_ids)
+            self._conn.commit()
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        """namespaceの文書の寄与をコーパス統計から差し引く（文書が残っていなければ統計を初期化）"""
+        with self._lock:
+            vector_ids = [row[0] for row in self._conn.execute(
+                "SELECT vector_id FROM document_terms WHERE namespace = ?", (namespace or "",)
+            ).fetchall()]
+            self._remove_documents(namespace, vector_ids)
+            self._conn.commit()
+            remaining = self._conn.execute("SELECT COUNT(*) FROM document_terms").fetchone()[0]
+        if not remaining:
+            # 文書ごとの記録を持たない古い統計も残さない
+            self.reset()
+
+    def reset(self) -> None:
+        """コーパス統計を初期化（インデックスを全件クリアした場合など）"""
+        with self._lock:
+            self._conn.execute("UPDATE corpus SET n_docs = 0, total_length = 0 WHERE id = 0")
+            self._conn.execute("DELETE FROM document_frequency")
+            self._conn.execute("DELETE FROM document_terms")
+            self._conn.commit()
+
+    def is_keyword_heavy(self, text: str) -> bool:
+        """
+        施設名・駅名を含む、または固有名詞が語の大半を占めるキーワード中心の質問かを判定
+        「川越市で子育てしやすい環境について教えて」のように市区町村名を含むだけの質問は含めない
+        """
+        if self.processor.count_named_facilities(text) > 0:
+            return True
+        terms = self.processor.extract_terms(text)
+        return bool(terms) and self.processor.count_proper_nouns(text) / len(terms) >= KEYWORD_PROPER_NOUN_RATIO
+
+_shared_encoder: Optional[BM25SparseEncoder] = None
+_shared_encoder_failed = False
+_shared_encoder_lock = threading.Lock()
+
+def get_sparse_encoder() -> Optional[BM25SparseEncoder]:
+    """プロセス全体で共有する疎ベクトルエンコーダーを取得（無効または初期化失敗時はNone）"""
+    global _shared_encoder, _shared_encoder_failed
+    if not HYBRID_SEARCH_ENABLED or _shared_encoder_failed:
+        return None
+
+    with _shared_encoder_lock:
+        if _shared_encoder is None:
+            try:
+                _shared_encoder = BM25SparseEncoder()
+            except Exception as e:
+                # エンコーダーが使えない場合は密ベクトルのみで検索する
+                print(f"疎ベクトルエンコーダーの初期化に失敗しました（密ベクトルのみで続行します）: {str(e)}")
+                _shared_encoder_failed = True
+                return None
+        return _shared_encoder
@@ -0,0 +1,150 @@
+from typing import List, Dict, Any, Callable, Tuple, Optional
+import queue
+import threading
+import time
+
+class StageStats:
+    """パイプラインの各ステージの処理量と処理時間を集計"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def record(self, items: int, started_at: float, finished_at: float) -> None:
+        """1バッチ分の処理結果を記録"""
+        with self._lock:
+            self.items += items
+            self.batches += 1
+            self.busy_seconds += finished_at - started_at
+            if self.started_at is None or started_at < self.started_at:
+                self.started_at = started_at
+            if self.finished_at is None or finished_at > self.finished_at:
+                self.finished_at = finished_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        """集計結果を辞書形式で取得"""
+        wall_seconds = (self.finished_at - self.started_at) if self.started_at is not None else 0.0
+        return {
+            "items": self.items,
+            "batches": self.batches,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "wall_seconds": round(wall_seconds, 3),
+            "items_per_second": round(self.items / wall_seconds, 2) if wall_seconds > 0 else 0.0
+        }
+
+class UploadPipeline:
+    """埋め込み生成とアップロードを並行して行うプロデューサー・コンシューマー型のパイプライン"""
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[Dict[str, Any]], int], Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]],
+        upsert_batch: Callable[[List[Dict[str, Any]], int], None],
+        queue_depth: int = 4,
+        embedding_workers: int = 2,
+        upsert_workers: int = 2
+    ):
+        """
+        embed_batch: (チャンクのバッチ, バッチ番号) を受け取り (ベクトルのリスト, 失敗したチャンクのリスト) を返す
+        upsert_batch: (ベクトルのリスト, バッチ番号) を受け取りアップロードする
+        """
+        self.embed_batch = embed_batch
+        self.upsert_batch = upsert_batch
+        self.queue_depth = max(1, queue_depth)
+        self.embedding_workers = max(1, embedding_workers)
+        self.upsert_workers = max(1, upsert_workers)
+
+    def run(self, batches: List[List[Dict[str, Any]]]) -> Dict[str, Any]:
+        """バッチを処理して各ステージの統計情報と失敗したチャンクを返す"""
+        input_queue: "queue.Queue" = queue.Queue()
+        for batch_num, batch in enumerate(batches, 1):
+            input_queue.put((batch_num, batch))
+
+        # 埋め込み済みのバッチを保持するキュー（上限を設けてメモリ使用量を抑える）
+        upsert_queue: "queue.Queue" = queue.Queue(maxsize=self.queue_depth)
+        stop_event = threading.Event()
+        errors: List[Exception] = []
+        failed_chunks: List[Dict[str, Any]] = []
+        results_lock = threading.Lock()
+        embedding_stats = StageStats("embedding")
+        upsert_stats = StageStats("upsert")
+        started_at = time.perf_counter()
+
+        def embedding_worker():
+            while not stop_event.is_set():
+                try:
+                    batch_num, batch = input_queue.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    stage_start = time.perf_counter()
+                    vectors, batch_failures = self.embed_batch(batch, batch_num)
+                    embedding_stats.record(len(batch), stage_start, time.perf_counter())
+                    with results_lock:
+                        failed_chunks.extend(batch_failures)
+                    if vectors:
+                        self._put_until_stopped(upsert_queue, (batch_num, vectors), stop_event)
+                except Exception as e:
+                    with results_lock:
+                        errors.append(e)
+                    stop_event.set()
+
+        def upsert_worker():
+            while True:
+                item = upsert_queue.get()
+                if item is None:
+                    return
+                # エラー発生後は残りのバッチを読み捨ててプロデューサーの待機を解除する
+                if stop_event.is_set():
+                    continue
+                batch_num, vectors = item
+                try:
+                    stage_start = time.perf_counter()
+                    self.upsert_batch(vectors, batch_num)
+                    upsert_stats.record(len(vectors), stage_start, time.perf_counter())
+                except Exception as e:
+                    with results_lock:
+                        errors.append(e)
+                    stop_event.set()
+
+        producers = [
+            threading.Thread(target=embedding_worker, name=f"embedding-worker-{i}", daemon=True)
+            for i in range(self.embedding_workers)
+        ]
+        consumers = [
+            threading.Thread(target=upsert_worker, name=f"upsert-worker-{i}", daemon=True)
+            for i in range(self.upsert_workers)
+        ]
+        for thread in producers + consumers:
+            thread.start()
+
+        for thread in producers:
+            thread.join()
+        for _ in consumers:
+            upsert_queue.put(None)
+        for thread in consumers:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
+        return {
+            "total_seconds": round(time.perf_counter() - started_at, 3),
+            "embedding": embedding_stats.to_dict(),
+            "upsert": upsert_stats.to_dict(),
+            "failed_chunks": failed_chunks
+        }
+
+    @staticmethod
+    def _put_until_stopped(target_queue: "queue.Queue", item: Any, stop_event: threading.Event) -> None:
+        """キューに空きができるまで待機（エラーで停止した場合は破棄）"""
+        while not stop_event.is_set():
+            try:
+                target_queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
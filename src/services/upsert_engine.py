@@ -0,0 +1,183 @@
+from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+import json
+import threading
+import time
+from src.config.settings import (
+    UPSERT_MAX_REQUEST_BYTES,
+    UPSERT_MAX_VECTORS_PER_REQUEST,
+    UPSERT_MAX_WORKERS,
+    DELETE_BATCH_SIZE
+)
+from src.services.retry_scheduler import RetryScheduler, get_retry_scheduler
+
+# JSONにシリアライズした際の浮動小数点数1つあたりのおおよそのバイト数（"-0.0123456789012345," 程度）
+FLOAT_JSON_BYTES = 22
+# 疎ベクトルのインデックス1つあたりのおおよそのバイト数（32ビット整数 "4294967295," 程度）
+SPARSE_INDEX_JSON_BYTES = 11
+# id・values・metadataのキーや括弧などの固定オーバーヘッド
+VECTOR_OVERHEAD_BYTES = 64
+
+class UpsertMetrics:
+    """アップロードリクエストごとのレイテンシと失敗を集計"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.vectors = 0
+        self.bytes = 0
+        self.failures: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def record_success(self, vector_count: int, payload_bytes: int, latency: float) -> None:
+        """成功したリクエストを記録"""
+        with self._lock:
+            self.latencies.append(latency)
+            self.vectors += vector_count
+            self.bytes += payload_bytes
+
+    def record_failure(self, vector_ids: List[str], error: Exception) -> None:
+        """失敗したリクエストを記録"""
+        with self._lock:
+            self.failures.append({
+                "vector_count": len(vector_ids),
+                "first_id": vector_ids[0] if vector_ids else "",
+                "error": str(error)
+            })
+
+    def to_dict(self) -> Dict[str, Any]:
+        """集計結果を辞書形式で取得"""
+        with self._lock:
+            latencies = sorted(self.latencies)
+            return {
+                "requests": len(latencies),
+                "vectors": self.vectors,
+                "megabytes": round(self.bytes / 1_000_000, 2),
+                "latency_p50": round(self._percentile(latencies, 0.5), 3),
+                "latency_p95": round(self._percentile(latencies, 0.95), 3),
+                "latency_max": round(latencies[-1], 3) if latencies else 0.0,
+                "failed_requests": len(self.failures),
+                "failures": list(self.failures)
+            }
+
+    @staticmethod
+    def _percentile(sorted_values: List[float], ratio: float) -> float:
+        """ソート済みの値からパーセンタイルを取得"""
+        if not sorted_values:
+            return 0.0
+        position = min(len(sorted_values) - 1, int(round(ratio * (len(sorted_values) - 1))))
+        return sorted_values[position]
+
+class UpsertEngine:
+    """シリアライズ後のサイズでベクトルを分割し、並行してPineconeにアップロード"""
+
+    def __init__(
+        self,
+        index,
+        max_request_bytes: int = UPSERT_MAX_REQUEST_BYTES,
+        max_vectors_per_request: int = UPSERT_MAX_VECTORS_PER_REQUEST,
+        max_workers: int = UPSERT_MAX_WORKERS,
+        retry: Optional[RetryScheduler] = None
+    ):
+        """アップロードエンジンの初期化"""
+        self.index = index
+        self.retry = retry or get_retry_scheduler()
+        self.max_request_bytes = max_request_bytes
+        self.max_vectors_per_request = max_vectors_per_request
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pinecone-upsert")
+
+    @staticmethod
+    def estimate_vector_bytes(vector: Dict[str, Any]) -> int:
+        """ベクトル1件をリクエストに含めた場合のおおよそのバイト数を計算"""
+        metadata_bytes = len(json.dumps(vector.get("metadata", {}), ensure_ascii=False).encode("utf-8"))
+        id_bytes = len(str(vector.get("id", "")).encode("utf-8"))
+        # 疎ベクトルはインデックス（整数）と値の組で送信される
+        sparse_bytes = len(vector.get("sparse_values", {}).get("indices", [])) * (SPARSE_INDEX_JSON_BYTES + FLOAT_JSON_BYTES)
+        return len(vector.get("values", [])) * FLOAT_JSON_BYTES + sparse_bytes + metadata_bytes + id_bytes + VECTOR_OVERHEAD_BYTES
+
+    def split_by_size(self, vectors: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """リクエストサイズと件数の上限に収まるようにベクトルを分割"""
+        requests = []
+        current_request = []
+        current_bytes = 0
+
+        for vector in vectors:
+            vector_bytes = self.estimate_vector_bytes(vector)
+            if current_request and (
+                current_bytes + vector_bytes > self.max_request_bytes
+                or len(current_request) >= self.max_vectors_per_request
+            ):
+                requests.append(current_request)
+                current_request = []
+                current_bytes = 0
+            current_request.append(vector)
+            current_bytes += vector_bytes
+
+        if current_request:
+            requests.append(current_request)
+
+        return requests
+
+    def upsert(self, vectors: List[Dict[str, Any]], namespace: str = None, metrics: Optional[UpsertMetrics] = None) -> Dict[str, Any]:
+        """ベクトルをサイズで分割し、スレッドプールで並行してアップロード"""
+        metrics = metrics or UpsertMetrics()
+        requests = self.split_by_size(vectors)
+        if len(requests) > 1:
+            print(f"  {len(vectors)}件のベクトルを{len(requests)}件のリクエストに分割してアップロードします")
+
+        futures = [
+            self.executor.submit(self.send, request_vectors, namespace, metrics)
+            for request_vectors in requests
+        ]
+        errors = []
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(e)
+
+        if errors:
+            raise Exception(f"{len(errors)}/{len(requests)}件のアップロードリクエストが失敗しました: {str(errors[0])}")
+
+        return metrics.to_dict()
+
+    def delete(self, ids: List[str], namespace: str = None, batch_size: int = DELETE_BATCH_SIZE) -> int:
+        """IDを上限件数ごとに分割し、スレッドプールで並行して削除"""
+        batches = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+        futures = [self.executor.submit(self.send_delete, batch, namespace) for batch in batches]
+        errors = []
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(e)
+
+        if errors:
+            raise Exception(f"{len(errors)}/{len(batches)}件の削除リクエストが失敗しました: {str(errors[0])}")
+
+        return len(ids)
+
+    def send_delete(self, ids: List[str], namespace: str = None) -> None:
+        """1リクエスト分のIDを削除（失敗時は共有の再試行スケジューラーで再試行）"""
+        try:
+            self.retry.call("pinecone.delete", self.index.delete, ids=ids, namespace=namespace, description=f"{len(ids)}件の削除")
+        except Exception as e:
+            raise Exception(f"{len(ids)}件の削除に失敗しました: {str(e)}")
+
+    def send(self, vectors: List[Dict[str, Any]], namespace: str = None, metrics: Optional[UpsertMetrics] = None) -> None:
+        """1リクエスト分のベクトルをアップロード（失敗時は共有の再試行スケジューラーで再試行）"""
+        payload_bytes = sum(self.estimate_vector_bytes(vector) for vector in vectors)
+
+        def upsert() -> float:
+            # 再試行の待機時間を含めないよう、成功した試行のみの所要時間を返す
+            started_at = time.perf_counter()
+            self.index.upsert(vectors=vectors, namespace=namespace)
+            return time.perf_counter() - started_at
+
+        try:
+            seconds = self.retry.call("pinecone.upsert", upsert, description=f"{len(vectors)}件のアップロード")
+        except Exception as e:
+            if metrics:
+                metrics.record_failure([vector["id"] for vector in vectors], e)
+            raise Exception(f"{len(vectors)}件のアップロードに失敗しました: {str(e)}")
+        if metrics:
+            metrics.record_success(len(vectors), payload_bytes, seconds)
@@ -0,0 +1,156 @@
+from typing import List, Dict, Any, Iterator, Optional
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from src.config.settings import (
+    LIST_PAGE_SIZE,
+    LIST_FETCH_WORKERS
+)
+from src.services.retry_scheduler import RetryScheduler, get_retry_scheduler, get_status_code
+
+# list_paginatedが使えない場合に、ゼロベクトルのqueryで取得できる最大件数
+QUERY_FALLBACK_LIMIT = 10000
+# IDの列挙に対応していないインデックス（ポッド型）がlist_paginatedに返すHTTPステータス
+LIST_UNSUPPORTED_STATUS_CODES = {400, 404, 405, 501}
+
+class VectorRecord:
+    """列挙したベクトル（Pineconeのfetch結果と同じくid・values・metadata・sparse_valuesを属性と添字で参照できる）"""
+
+    def __init__(
+        self,
+        id: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        values: Optional[List[float]] = None,
+        sparse_values: Optional[Dict[str, List]] = None
+    ):
+        self.id = id
+        self.metadata = metadata if metadata is not None else {}
+        self.values = values
+        self.sparse_values = sparse_values
+
+    def __getitem__(self, key: str) -> Any:
+        return getattr(self, key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in ("id", "metadata", "values", "sparse_values") and getattr(self, key) is not None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default) if key in self else default
+
+def to_sparse_dict(sparse_values: Any) -> Optional[Dict[str, List]]:
+    """Pineconeの疎ベクトル（SparseValuesまたは辞書）を {"indices", "values"} の辞書に変換（空の場合はNone）"""
+    if not sparse_values:
+        return None
+    if isinstance(sparse_values, dict):
+        indices, values = sparse_values.get("indices"), sparse_values.get("values")
+    else:
+        indices, values = getattr(sparse_values, "indices", None), getattr(sparse_values, "values", None)
+    if not indices:
+        return None
+    return {"indices": list(indices), "values": list(values)}
+
+class VectorEnumerator:
+    """インデックスのベクトルIDをページ単位で列挙し、並行してfetchした結果を順次返す"""
+
+    def __init__(
+        self,
+        index,
+        dimension: int,
+        page_size: int = LIST_PAGE_SIZE,
+        max_workers: int = LIST_FETCH_WORKERS,
+        retry: Optional[RetryScheduler] = None
+    ):
+        """列挙処理の初期化"""
+        self.index = index
+        self.retry = retry or get_retry_scheduler()
+        self.dimension = dimension
+        self.page_size = page_size
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pinecone-fetch")
+
+    def iter_ids(self, namespace: str = None, prefix: str = None) -> Iterator[List[str]]:
+        """ベクトルIDをページ単位で列挙"""
+        list_paginated = getattr(self.index, "list_paginated", None)
+        if list_paginated is None:
+            yield from self._iter_ids_by_query(namespace, prefix)
+            return
+
+        pagination_token = None
+        while True:
+            kwargs = {"namespace": namespace or "", "limit": self.page_size}
+            if prefix:
+                kwargs["prefix"] = prefix
+            if pagination_token:
+                kwargs["pagination_token"] = pagination_token
+            try:
+                response = self.retry.call("pinecone.list", list_paginated, description="ベクトルIDの列挙", **kwargs)
+            except Exception as e:
+                # ポッド型インデックスではIDの列挙に対応していないため従来の方法で取得する
+                if pagination_token is None and get_status_code(e) in LIST_UNSUPPORTED_STATUS_CODES:
+                    print(f"IDの列挙に対応していないため、検索による取得に切り替えます: {str(e)}")
+                    yield from self._iter_ids_by_query(namespace, prefix)
+                    return
+                raise
+
+            ids = [item.id for item in (response.vectors or [])]
+            if ids:
+                yield ids
+            pagination_token = response.pagination.next if response.pagination else None
+            if not pagination_token:
+                return
+
+    def _iter_ids_by_query(self, namespace: str = None, prefix: str = None) -> Iterator[List[str]]:
+        """ゼロベクトルの検索でIDを取得（list_paginatedが使えない場合の代替。最大10,000件）"""
+        results = self.retry.call(
+            "pinecone.query",
+            self.index.query,
+            description="検索によるベクトルIDの取得",
+            vector=[0.0] * self.dimension,
+            top_k=QUERY_FALLBACK_LIMIT,
+            include_values=False,
+            include_metadata=False,
+            namespace=namespace
+        )
+        ids = [match.id for match in results.matches if not prefix or match.id.startswith(prefix)]
+        if len(results.matches) >= QUERY_FALLBACK_LIMIT:
+            print(f"警告: 検索で取得できる上限（{QUERY_FALLBACK_LIMIT}件）に達したため、一部のベクトルが列挙されていない可能性があります")
+        for i in range(0, len(ids), self.page_size):
+            yield ids[i:i + self.page_size]
+
+    def iter_pages(self, namespace: str = None, prefix: str = None, include_values: bool = False) -> Iterator[List[VectorRecord]]:
+        """IDのページごとにfetchを並行して実行し、列挙順にページ単位でベクトルを返す"""
+        pending = deque()
+        for ids in self.iter_ids(namespace, prefix):
+            pending.append(self.executor.submit(self._fetch, ids, namespace, include_values))
+            # 同時に実行するfetchの数を制限してメモリ使用量を抑える
+            while len(pending) >= self.max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def iter_vectors(self, namespace: str = None, prefix: str = None, include_values: bool = False) -> Iterator[VectorRecord]:
+        """列挙したベクトルを1件ずつ返す"""
+        for page in self.iter_pages(namespace, prefix, include_values):
+            yield from page
+
+    def fetch_many(self, ids: List[str], namespace: str = None, include_values: bool = False) -> Dict[str, VectorRecord]:
+        """指定されたIDのベクトルをページ単位に分けて並行してfetch（存在しないIDは含まれない）"""
+        pages = [ids[i:i + self.page_size] for i in range(0, len(ids), self.page_size)]
+        futures = [self.executor.submit(self._fetch, page, namespace, include_values) for page in pages]
+        return {record.id: record for future in futures for record in future.result()}
+
+    def _fetch(self, ids: List[str], namespace: str = None, include_values: bool = False) -> List[VectorRecord]:
+        """1ページ分のベクトルを取得（不要な場合はvalues・sparse_valuesを破棄してメモリを節約）"""
+        response = self.retry.call("pinecone.fetch", self.index.fetch, ids=ids, namespace=namespace, description=f"{len(ids)}件のfetch")
+        fetched = response.vectors or {}
+        records = []
+        for vector_id in ids:
+            vector = fetched.get(vector_id)
+            if vector is None:
+                continue
+            records.append(VectorRecord(
+                id=vector.id,
+                metadata=dict(vector.metadata or {}),
+                values=list(vector.values) if include_values else None,
+                sparse_values=to_sparse_dict(getattr(vector, "sparse_values", None)) if include_values else None
+            ))
+        return records
@@ -0,0 +1,112 @@
+"""
+事前に計算した埋め込みベクトル（Parquet/JSONL）の読み込みと書き出し
+
+1レコードは id・values・metadata（任意でsparse_values）を持つ。
+metadata列がない場合は、id・values・sparse_values以外の列をメタデータとして扱う。
+"""
+from typing import List, Dict, Any, Iterator, Iterable, Optional
+import gzip
+import json
+import os
+from src.config.settings import IMPORT_BATCH_SIZE
+
+# メタデータ以外として扱う列
+RESERVED_FIELDS = ("id", "values", "metadata", "sparse_values")
+JSONL_EXTENSIONS = (".jsonl", ".ndjson", ".jsonl.gz", ".ndjson.gz")
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+
+def _open_text(path: str, mode: str = "rt"):
+    """テキストファイルを開く（.gzの場合は展開しながら読み書き）"""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+def normalize_record(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """読み込んだ1行をアップロード用のベクトル形式に変換"""
+    metadata = raw.get("metadata")
+    if isinstance(metadata, str):
+        metadata = json.loads(metadata) if metadata else {}
+    if metadata is None:
+        metadata = {key: value for key, value in raw.items() if key not in RESERVED_FIELDS and value is not None}
+
+    record = {"id": raw.get("id"), "values": raw.get("values"), "metadata": metadata}
+    sparse_values = raw.get("sparse_values")
+    if isinstance(sparse_values, str):
+        sparse_values = json.loads(sparse_values) if sparse_values else None
+    if sparse_values and sparse_values.get("indices"):
+        record["sparse_values"] = {"indices": list(sparse_values["indices"]), "values": list(sparse_values["values"])}
+    return record
+
+def iter_jsonl_records(path: str) -> Iterator[Dict[str, Any]]:
+    """JSONLファイルを1行ずつ読み込んでレコードを返す"""
+    with _open_text(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield normalize_record(json.loads(line))
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path} の{line_number}行目をJSONとして読み込めませんでした: {str(e)}")
+
+def iter_parquet_records(path: str, batch_rows: int = IMPORT_BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+    """Parquetファイルを行グループ単位で読み込んでレコードを返す（pyarrowが必要）"""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquetファイルの読み込みにはpyarrowが必要です（pip install pyarrow）")
+
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=batch_rows):
+        for row in batch.to_pylist():
+            yield normalize_record(row)
+
+def iter_records(path: str, batch_rows: int = IMPORT_BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+    """拡張子に応じてParquetまたはJSONLのレコードを順次返す"""
+    lower_path = path.lower()
+    if lower_path.endswith(PARQUET_EXTENSIONS):
+        return iter_parquet_records(path, batch_rows)
+    if lower_path.endswith(JSONL_EXTENSIONS):
+        return iter_jsonl_records(path)
+    raise ValueError(f"対応していないファイル形式です（{', '.join(PARQUET_EXTENSIONS + JSONL_EXTENSIONS)}）: {path}")
+
+def iter_batches(records: Iterable[Dict[str, Any]], batch_size: int = IMPORT_BATCH_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """レコードを一定件数ごとのバッチにまとめる（一度に保持するのは1バッチ分のみ）"""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def validate_record(record: Dict[str, Any], dimension: int) -> Optional[str]:
+    """レコードを検証し、問題があればその内容を返す（問題がなければNone）"""
+    if not record.get("id") or not isinstance(record["id"], str):
+        return "idがない、または文字列ではありません"
+    values = record.get("values")
+    if not values:
+        return f"ベクトル {record['id']} にvaluesがありません"
+    if len(values) != dimension:
+        return f"ベクトル {record['id']} の次元数（{len(values)}）がインデックスの次元数（{dimension}）と一致しません"
+    if not isinstance(record.get("metadata"), dict):
+        return f"ベクトル {record['id']} のmetadataが辞書形式ではありません"
+    return None
+
+def write_jsonl(records: Iterable[Any], path: str) -> int:
+    """ベクトル（id・values・metadata、任意でsparse_valuesを持つオブジェクト）をJSONLファイルに書き出し、件数を返す"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    count = 0
+    with _open_text(path, "wt") as f:
+        for record in records:
+            row = {"id": record.id, "values": list(record.values), "metadata": dict(record.metadata or {})}
+            sparse_values = getattr(record, "sparse_values", None)
+            if sparse_values:
+                # ハイブリッド検索用の疎ベクトルもインポート時に復元できるように書き出す
+                row["sparse_values"] = {"indices": list(sparse_values["indices"]), "values": list(sparse_values["values"])}
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            count += 1
+    return count
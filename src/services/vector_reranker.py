@@ -0,0 +1,123 @@
+from typing import List, Dict, Any, Optional
+import numpy as np
+from src.config.settings import EMBEDDING_MODEL, RERANK_QUERY_WEIGHT, RERANK_MMR_LAMBDA
+from src.services.candidate_vector_store import get_candidate_vector_store
+from src.services.embedding_cache import get_embedding_cache
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """行ごとに長さ1に正規化（長さ0の行はそのまま）"""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+def mmr_order(candidates: np.ndarray, relevance: np.ndarray, mmr_lambda: float = RERANK_MMR_LAMBDA) -> List[int]:
+    """
+    MMR（Maximal Marginal Relevance）で候補の順序を決める
+    既に選んだ候補と似ているほど順位を下げ、関連度が高く内容の重複しない候補を上位に並べる（candidatesは正規化済み）
+    """
+    count = len(relevance)
+    if count == 0:
+        return []
+    similarities = candidates @ candidates.T
+    # 選んだ候補それぞれとの類似度の最大値（最初は誰とも似ていない）
+    max_similarity = np.full(count, -np.inf)
+    remaining = np.ones(count, dtype=bool)
+    order = []
+    for _ in range(count):
+        redundancy = np.where(np.isfinite(max_similarity), max_similarity, 0.0)
+        scores = np.where(remaining, mmr_lambda * relevance - (1 - mmr_lambda) * redundancy, -np.inf)
+        selected = int(np.argmax(scores))
+        order.append(selected)
+        remaining[selected] = False
+        max_similarity = np.maximum(max_similarity, similarities[selected])
+    return order
+
+class VectorReranker:
+    """検索候補のベクトルを元の質問とクエリバリエーションの重心に対してローカルで再評価し、MMRで並べ替える"""
+
+    def __init__(self, pinecone_service, query_weight: float = RERANK_QUERY_WEIGHT, mmr_lambda: float = RERANK_MMR_LAMBDA):
+        self.pinecone_service = pinecone_service
+        self.query_weight = query_weight
+        self.mmr_lambda = mmr_lambda
+
+    def candidate_vectors(self, matches: List[Any]) -> Dict[str, np.ndarray]:
+        """
+        候補のベクトルを取得（候補ベクトルストア → 埋め込みキャッシュ → Pineconeからのfetchの順に探す）
+        ストアにない候補は取得後にストアへ保存し、次回以降はネットワークを使わない
+        """
+        dimension = self.pinecone_service.embedding_dimension
+        store = get_candidate_vector_store(dimension)
+        if not store:
+            return {}
+
+        vectors = store.get_many([(match.id, match.metadata.get("content_hash", "")) for match in matches])
+        missing = [match for match in matches if match.id not in vectors]
+        fetched = []
+
+        # アップロード時に埋め込んだ検索用テキストがキャッシュに残っていれば使う
+        cache = get_embedding_cache()
+        if cache and missing:
+            texts = [match.metadata.get("search_text") or match.metadata.get("text", "") for match in missing]
+            for match, vector in zip(missing, cache.get_many(EMBEDDING_MODEL, dimension, texts)):
+                if vector is not None:
+                    fetched.append((match.id, match.metadata.get("content_hash", ""), vector))
+            found_ids = {vector_id for vector_id, _, _ in fetched}
+            missing = [match for match in missing if match.id not in found_ids]
+
+        # 残りはnamespaceごとにまとめてfetchする
+        if missing and self.pinecone_service.dimension == dimension:
+            ids_by_namespace: Dict[Optional[str], List[Any]] = {}
+            for match in missing:
+                ids_by_namespace.setdefault(getattr(match, "namespace", None), []).append(match)
+            for namespace, namespace_matches in ids_by_namespace.items():
+                try:
+                    records = self.pinecone_service.vector_enumerator.fetch_many(
+                        [match.id for match in namespace_matches], namespace=namespace, include_values=True
+                    )
+                except Exception as e:
+                    print(f"候補ベクトルの取得に失敗しました（namespace: '{namespace or ''}'）: {str(e)}")
+                    continue
+                for match in namespace_matches:
+                    record = records.get(match.id)
+                    if record is not None and record.values:
+                        fetched.append((match.id, match.metadata.get("content_hash", ""), record.values))
+
+        if fetched:
+            store.put_many(fetched)
+            for vector_id, _, vector in fetched:
+                vectors[vector_id] = np.asarray(vector, dtype=np.float32)
+        return vectors
+
+    def rerank(self, matches: List[Any], query_vectors: List[List[float]]) -> Optional[List[Any]]:
+        """
+        候補を再評価してMMRの順に並べ替える（query_vectorsの先頭は元の質問、以降はクエリバリエーション）
+        再評価したスコアはadjusted_scoreに設定し、ベクトルを取得できなかった候補はPineconeのスコアのまま末尾に並べる
+        """
+        if not matches or not query_vectors:
+            return None
+
+        vectors = self.candidate_vectors(matches)
+        scored = [match for match in matches if match.id in vectors]
+        if not scored:
+            return None
+
+        candidates = normalize_rows(np.stack([vectors[match.id] for match in scored]))
+        queries = normalize_rows(np.asarray(query_vectors, dtype=np.float32))
+        centroid = normalize_rows(queries.mean(axis=0))
+
+        # 元の質問との類似度とバリエーションの重心との類似度を重み付けして関連度とする
+        relevance = self.query_weight * (candidates @ queries[0]) + (1 - self.query_weight) * (candidates @ centroid)
+        order = mmr_order(candidates, relevance, self.mmr_lambda)
+
+        reranked = []
+        for rank, position in enumerate(order):
+            match = scored[position]
+            match.adjusted_score = float(relevance[position])
+            match.rerank_position = rank
+            reranked.append(match)
+
+        unscored = [match for match in matches if match.id not in vectors]
+        for match in unscored:
+            match.adjusted_score = match.score
+        unscored.sort(key=lambda x: x.adjusted_score, reverse=True)
+        print(f"再ランキング: {len(scored)}件（ベクトルを取得できなかった候補 {len(unscored)}件）")
+        return reranked + unscored
@@ -0,0 +1,3 @@
+"""
+Command-line tools for index maintenance
+""" 
\ No newline at end of file
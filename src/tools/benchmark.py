@@ -0,0 +1,329 @@
+"""
+OpenAI・Pineconeの代替サーバーを使って、アップロードと検索・応答生成の性能を計測するベンチマーク
+
+使用例:
+    python -m src.tools.benchmark --documents 1000 --queries 50 --chat-requests 20
+    python -m src.tools.benchmark --openai-latency-ms 200 --openai-jitter-ms 50 --openai-error-rate 0.05 --output report.json
+    python -m src.tools.benchmark --baseline report.json --tolerance 0.2
+"""
+from typing import List, Dict, Any, Optional, Callable
+import argparse
+import contextlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+# 設定モジュールは読み込み時に環境変数を参照するため、srcのモジュールは環境変数を設定した後に読み込む
+BENCHMARK_INDEX_NAME = "benchmark"
+
+CITIES = {
+    "札幌市": (43.0621, 141.3544),
+    "仙台市": (38.2682, 140.8694),
+    "千代田区": (35.6940, 139.7536),
+    "横浜市": (35.4437, 139.6380),
+    "名古屋市": (35.1815, 136.9066),
+    "京都市": (35.0116, 135.7681),
+    "大阪市": (34.6937, 135.5023),
+    "神戸市": (34.6901, 135.1955),
+    "広島市": (34.3853, 132.4553),
+    "福岡市": (33.5902, 130.4017)
+}
+CATEGORIES = [
+    ("生活", "スーパー"),
+    ("生活", "コンビニ"),
+    ("医療", "病院"),
+    ("医療", "薬局"),
+    ("教育", "小学校"),
+    ("教育", "図書館"),
+    ("交通", "駅"),
+    ("公園", "公園")
+]
+NAME_PREFIXES = ["さくら", "みどり", "ひかり", "あおば", "こもれび", "なでしこ", "はなみずき", "すずらん"]
+FEATURES = [
+    "駐車場があります",
+    "土日も営業しています",
+    "最寄り駅から徒歩5分です",
+    "バリアフリーに対応しています",
+    "24時間利用できます",
+    "子ども連れでも利用しやすいです"
+]
+QUERY_FEATURES = ["駐車場がある", "土日も営業している", "駅から近い", "バリアフリーに対応している", "24時間利用できる"]
+QUERY_TEMPLATES = [
+    "{city}で一番近い{sub_category}はどこですか？",
+    "{name}の営業時間を教えてください",
+    "{city}の{main_category}に関する施設について知りたいです",
+    "{feature}{sub_category}はありますか？"
+]
+
+def build_corpus(documents: int, seed: int) -> List[Dict[str, Any]]:
+    """施設情報の合成データ（日本語）をアップロード用のチャンク形式で作成"""
+    rng = random.Random(seed)
+    chunks = []
+    for i in range(documents):
+        city, (latitude, longitude) = rng.choice(list(CITIES.items()))
+        main_category, sub_category = rng.choice(CATEGORIES)
+        name = f"{rng.choice(NAME_PREFIXES)}{sub_category}{city[:2]}{i}号"
+        opening, closing = rng.randint(6, 10), rng.randint(18, 23)
+        features = "。".join(rng.sample(FEATURES, 2))
+        text = (
+            f"{name}は{city}にある{main_category}の{sub_category}です。"
+            f"営業時間は{opening}時から{closing}時までです。{features}。"
+        )
+        chunks.append({
+            "id": f"benchmark_{i:06d}",
+            "text": text,
+            "filename": "benchmark.txt",
+            "chunk_id": str(i),
+            "metadata": {
+                "main_category": main_category,
+                "sub_category": sub_category,
+                "city": city,
+                "facility_name": name,
+                "latitude": round(latitude + rng.uniform(-0.05, 0.05), 6),
+                "longitude": round(longitude + rng.uniform(-0.05, 0.05), 6),
+                "source": "benchmark"
+            }
+        })
+    return chunks
+
+def build_queries(chunks: List[Dict[str, Any]], count: int, seed: int) -> List[str]:
+    """合成データの施設名・市区町村・カテゴリから質問文を作成"""
+    rng = random.Random(seed + 1)
+    queries = []
+    for _ in range(count):
+        metadata = rng.choice(chunks)["metadata"]
+        queries.append(rng.choice(QUERY_TEMPLATES).format(
+            city=metadata["city"],
+            name=metadata["facility_name"],
+            main_category=metadata["main_category"],
+            sub_category=metadata["sub_category"],
+            feature=rng.choice(QUERY_FEATURES)
+        ))
+    return queries
+
+def _percentile(sorted_values: List[float], ratio: float) -> float:
+    """ソート済みの値からパーセンタイルを取得"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(ratio * (len(sorted_values) - 1))))]
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    """レイテンシのパーセンタイル（ミリ秒）とスループットを集計"""
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "p50_ms": round(_percentile(values, 0.5) * 1000, 1),
+        "p95_ms": round(_percentile(values, 0.95) * 1000, 1),
+        "p99_ms": round(_percentile(values, 0.99) * 1000, 1),
+        "mean_ms": round(sum(values) / len(values) * 1000, 1) if values else 0.0,
+        "max_ms": round(values[-1] * 1000, 1) if values else 0.0,
+        "throughput_per_second": round(len(values) / elapsed, 2) if elapsed > 0 else 0.0
+    }
+
+def measure(name: str, items: List[str], run: Callable[[str], bool], quiet: bool) -> Dict[str, Any]:
+    """itemsを順に実行してレイテンシを計測（runは成功時にTrueを返す）"""
+    latencies = []
+    errors = 0
+    started_at = time.perf_counter()
+    for i, item in enumerate(items, 1):
+        call_started_at = time.perf_counter()
+        try:
+            with _maybe_silence(quiet):
+                succeeded = run(item)
+        except Exception as e:
+            print(f"  {name} {i}件目でエラーが発生しました: {str(e)}")
+            succeeded = False
+        latencies.append(time.perf_counter() - call_started_at)
+        if not succeeded:
+            errors += 1
+    return summarize(latencies, errors, time.perf_counter() - started_at)
+
+@contextlib.contextmanager
+def _maybe_silence(quiet: bool):
+    """quiet指定時はサービスのデバッグ出力を捨てる（計測への影響を抑えるため）"""
+    if not quiet:
+        yield
+        return
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+def configure_environment(args: argparse.Namespace, state_dir: str) -> None:
+    """実際のAPIキーや.envの設定を使わないように、代替サーバー用の環境変数を設定"""
+    os.environ.update({
+        "OPENAI_API_KEY": "sk-benchmark",
+        "PINECONE_API_KEY": "benchmark",
+        "PINECONE_INDEX_NAME": BENCHMARK_INDEX_NAME,
+        "PINECONE_ASSISTANT_NAME": BENCHMARK_INDEX_NAME,
+        "VECTOR_BACKEND": "pinecone",
+        "EMBEDDING_DIMENSION": str(args.dimension),
+        "PINECHAT_STATE_DIR": state_dir,
+        "LANGCHAIN_TRACING_V2": "false"
+    })
+    if args.no_caches:
+        os.environ.update({"EMBEDDING_CACHE_ENABLED": "false", "QUERY_CACHE_ENABLED": "false"})
+
+def run_benchmark(args: argparse.Namespace, state_dir: str) -> Dict[str, Any]:
+    """代替サーバーを起動し、アップロード・マルチステップ検索・応答生成を計測"""
+    from src.tools.fake_services import FaultProfile, CallStats, FakeOpenAIServer, FakePineconeIndex, FakePineconeClient, install_fake_tokenizer
+
+    install_fake_tokenizer()
+
+    openai_stats = CallStats()
+    pinecone_stats = CallStats()
+    openai_server = FakeOpenAIServer(
+        FaultProfile(args.openai_latency_ms, args.openai_jitter_ms, args.openai_error_rate, seed=args.seed),
+        openai_stats
+    ).start()
+    # OpenAIクライアント（LangChainを含む）はbase_urlが未指定の場合に環境変数を参照する
+    os.environ["OPENAI_BASE_URL"] = openai_server.base_url
+    os.environ["OPENAI_API_BASE"] = openai_server.base_url
+
+    try:
+        from src.services.pinecone_service import PineconeService
+        from src.services.langchain_service import ChatResources, LangChainService
+
+        index = FakePineconeIndex(
+            os.path.join(state_dir, "fake_pinecone"),
+            dimension=args.dimension,
+            metric=args.metric,
+            profile=FaultProfile(args.pinecone_latency_ms, args.pinecone_jitter_ms, args.pinecone_error_rate, seed=args.seed + 1),
+            stats=pinecone_stats
+        )
+        with _maybe_silence(args.quiet):
+            service = PineconeService(pinecone_client=FakePineconeClient(BENCHMARK_INDEX_NAME, index))
+
+        chunks = build_corpus(args.documents, args.seed)
+        queries = build_queries(chunks, max(args.queries, args.chat_requests), args.seed)
+        report: Dict[str, Any] = {
+            "config": {
+                key: value for key, value in vars(args).items()
+                if key not in ("output", "baseline", "quiet")
+            }
+        }
+
+        print(f"アップロード: {len(chunks)}件のチャンク")
+        started_at = time.perf_counter()
+        with _maybe_silence(args.quiet):
+            upload_report = service.upload_chunks(chunks, batch_size=args.batch_size)
+        elapsed = time.perf_counter() - started_at
+        upsert_requests = dict(upload_report.get("upsert_requests", {}))
+        upsert_requests.pop("failures", None)
+        report["ingestion"] = {
+            "chunks": len(chunks),
+            "seconds": round(elapsed, 3),
+            "chunks_per_second": round(len(chunks) / elapsed, 2) if elapsed > 0 else 0.0,
+            "failed_chunks": len(upload_report.get("failed_chunks", [])),
+            "upsert_requests": upsert_requests
+        }
+
+        resources = ChatResources(pinecone_service=service, openai_client=service.openai_client)
+        search_queries = queries[:args.queries]
+        print(f"マルチステップ検索: {len(search_queries)}件")
+        report["search"] = measure(
+            "検索",
+            search_queries,
+            lambda query: resources.advanced_search.multi_step_search(query) is not None,
+            args.quiet
+        )
+
+        chat_queries = queries[:args.chat_requests]
+        print(f"応答生成: {len(chat_queries)}件")
+        langchain_service = LangChainService(resources=resources)
+        report["chat"] = measure(
+            "応答生成",
+            chat_queries,
+            lambda query: not langchain_service.get_response(query)[1].get("エラー", False),
+            args.quiet
+        )
+
+        report["calls"] = {"openai": openai_stats.to_dict(), "pinecone": pinecone_stats.to_dict()}
+        return report
+    finally:
+        openai_server.stop()
+
+def compare_with_baseline(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """基準の結果と比較し、許容範囲を超えて悪化した指標を返す"""
+    regressions = []
+    for stage in ("search", "chat"):
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            current = report.get(stage, {}).get(metric, 0.0)
+            previous = baseline.get(stage, {}).get(metric, 0.0)
+            if previous and current > previous * (1 + tolerance):
+                regressions.append(f"{stage}.{metric}: {previous} → {current}")
+    current = report.get("ingestion", {}).get("chunks_per_second", 0.0)
+    previous = baseline.get("ingestion", {}).get("chunks_per_second", 0.0)
+    if previous and current < previous * (1 - tolerance):
+        regressions.append(f"ingestion.chunks_per_second: {previous} → {current}")
+    return regressions
+
+def print_report(report: Dict[str, Any]) -> None:
+    """計測結果を表形式で表示"""
+    ingestion = report["ingestion"]
+    print("\n=== ベンチマーク結果 ===")
+    print(f"アップロード: {ingestion['chunks']}件, {ingestion['seconds']}秒, {ingestion['chunks_per_second']}件/秒"
+          f"（失敗 {ingestion['failed_chunks']}件）")
+    print(f"{'':10}{'件数':>6}{'エラー':>6}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'件/秒':>8}")
+    for stage in ("search", "chat"):
+        row = report[stage]
+        print(f"{stage:10}{row['requests']:>6}{row['errors']:>6}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['throughput_per_second']:>8}")
+    print("\n呼び出し回数:")
+    for service_name, operations in report["calls"].items():
+        for operation, counts in operations.items():
+            print(f"  {service_name}.{operation}: {counts['calls']}回（エラー {counts['errors']}回, 処理件数 {counts['items']}件）")
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description="代替サーバーを使ってアップロード・検索・応答生成の性能を計測します")
+    parser.add_argument("--documents", type=int, default=500, help="アップロードする合成チャンク数")
+    parser.add_argument("--queries", type=int, default=30, help="マルチステップ検索を実行する回数")
+    parser.add_argument("--chat-requests", type=int, default=10, help="応答生成を実行する回数")
+    parser.add_argument("--batch-size", type=int, default=100, help="アップロードのバッチサイズ")
+    parser.add_argument("--dimension", type=int, default=256, choices=[3072, 1024, 512, 256], help="埋め込みの次元数")
+    parser.add_argument("--metric", default="cosine", choices=["cosine", "dotproduct"], help="代替インデックスのメトリック（dotproductでハイブリッド検索）")
+    parser.add_argument("--openai-latency-ms", type=float, default=50.0, help="OpenAI APIの平均遅延（ミリ秒）")
+    parser.add_argument("--openai-jitter-ms", type=float, default=10.0, help="OpenAI APIの遅延のゆらぎ（標準偏差、ミリ秒）")
+    parser.add_argument("--openai-error-rate", type=float, default=0.0, help="OpenAI APIがレート制限エラー（429）を返す割合")
+    parser.add_argument("--pinecone-latency-ms", type=float, default=20.0, help="Pineconeの平均遅延（ミリ秒）")
+    parser.add_argument("--pinecone-jitter-ms", type=float, default=5.0, help="Pineconeの遅延のゆらぎ（標準偏差、ミリ秒）")
+    parser.add_argument("--pinecone-error-rate", type=float, default=0.0, help="Pineconeがレート制限エラー（429）を返す割合")
+    parser.add_argument("--no-caches", action="store_true", help="埋め込みキャッシュと検索結果キャッシュを無効にする")
+    parser.add_argument("--seed", type=int, default=0, help="合成データと遅延の乱数シード")
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    parser.add_argument("--baseline", help="比較する基準の結果（JSONファイル）")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="基準からの悪化を許容する割合")
+    parser.add_argument("--verbose", dest="quiet", action="store_false", help="サービスのデバッグ出力を表示する")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """ベンチマークを実行し、結果の表示・保存・基準との比較を行う"""
+    args = parse_args(argv)
+    state_dir = tempfile.mkdtemp(prefix="pinechat-benchmark-")
+    configure_environment(args, state_dir)
+    try:
+        report = run_benchmark(args, state_dir)
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print(f"\n結果を保存しました: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            regressions = compare_with_baseline(report, json.load(file), args.tolerance)
+        if regressions:
+            print(f"\n基準から{int(args.tolerance * 100)}%以上悪化した指標があります:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\n基準からの悪化はありません")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+ベンチマーク用のOpenAI・Pineconeの代替サーバー（レイテンシ・ゆらぎ・レート制限エラーを再現）
+
+OpenAIはローカルのHTTPサーバーとして起動し、OpenAIクライアントのbase_urlを向けて使用する。
+PineconeはLocalIndexにレイテンシとエラーを加えたインデックスをPineconeServiceに渡して使用する。
+トークナイザーはtiktokenの語彙ファイルをダウンロードしないように代替のものに置き換える。
+"""
+from typing import List, Dict, Any, Optional
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import base64
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from src.services.local_index import LocalIndex
+
+# キーワードとして扱う文字列（漢字・カタカナ・英数字の連続）
+KEYWORD_PATTERN = re.compile(r"[一-龥々ァ-ヶーA-Za-z0-9]{2,}")
+
+class FaultProfile:
+    """呼び出しごとの遅延（平均とゆらぎ）とレート制限エラーの発生率"""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> tuple:
+        """(遅延秒数, エラーにするか) を抽選"""
+        with self._lock:
+            delay_ms = max(0.0, self._random.gauss(self.latency_ms, self.jitter_ms)) if self.jitter_ms else self.latency_ms
+            fail = self._random.random() < self.error_rate
+        return delay_ms / 1000, fail
+
+class CallStats:
+    """操作ごとの呼び出し回数・注入したエラー数・処理件数を集計"""
+
+    def __init__(self):
+        self.calls: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.items: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation: str, items: int = 1, error: bool = False) -> None:
+        """呼び出しを記録"""
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+            if error:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+            else:
+                self.items[operation] = self.items.get(operation, 0) + items
+
+    def to_dict(self) -> Dict[str, Dict[str, int]]:
+        """集計結果を辞書形式で取得"""
+        with self._lock:
+            return {
+                operation: {
+                    "calls": calls,
+                    "errors": self.errors.get(operation, 0),
+                    "items": self.items.get(operation, 0)
+                }
+                for operation, calls in sorted(self.calls.items())
+            }
+
+def fake_embedding(text: str, dimensions: int) -> List[float]:
+    """文字バイグラムをハッシュして作る決定的な埋め込み（似た文字列ほど類似度が高くなる）"""
+    values = [0.0] * dimensions
+    characters = text.strip()
+    grams = [characters[i:i + 2] for i in range(max(1, len(characters) - 1))]
+    for gram in grams:
+        hashed = zlib.crc32(gram.encode("utf-8"))
+        values[hashed % dimensions] += 1.0 if hashed & 0x80000000 else -1.0
+    norm = math.sqrt(sum(value * value for value in values)) or 1.0
+    return [value / norm for value in values]
+
+class FakeEncoding:
+    """tiktokenの代替のトークナイザー（1文字を1トークンとして数え、語彙ファイルのダウンロードが不要）"""
+
+    name = "fake"
+
+    def encode(self, text: str, **kwargs) -> List[int]:
+        """テキストをトークンIDの列に変換"""
+        return [ord(character) for character in text]
+
+    def decode(self, tokens: List[int]) -> str:
+        """トークンIDの列をテキストに戻す"""
+        return "".join(chr(token) for token in tokens)
+
+def install_fake_tokenizer() -> None:
+    """tiktokenのトークナイザーの取得を代替のトークナイザーに置き換える（オフラインで実行するため）"""
+    import tiktoken
+
+    encoding = FakeEncoding()
+    tiktoken.encoding_for_model = lambda model_name: encoding
+    tiktoken.get_encoding = lambda encoding_name: encoding
+
+def _fake_chat_content(messages: List[Dict[str, Any]], json_mode: bool) -> str:
+    """チャットの応答本文を作成（JSONモードではキーワードとクエリバリエーションを返す）"""
+    user_message = next((message.get("content", "") for message in reversed(messages) if message.get("role") == "user"), "")
+    if isinstance(user_message, list):
+        user_message = " ".join(part.get("text", "") for part in user_message if isinstance(part, dict))
+    question = user_message.split("質問:", 1)[-1].split("\n", 1)[0].strip() or user_message[:100]
+    keywords = KEYWORD_PATTERN.findall(question)[:5]
+    if json_mode:
+        return json.dumps({
+            "keywords": keywords,
+            "variations": [f"{keyword}について教えてください" for keyword in keywords[:3]]
+        }, ensure_ascii=False)
+    return f"ご質問の「{question[:50]}」について、参照文脈の情報をもとに回答します。（ベンチマーク用の応答）"
+
+class FakeOpenAIServer:
+    """埋め込みとチャット補完のAPIを返すローカルHTTPサーバー"""
+
+    def __init__(self, profile: FaultProfile, stats: Optional[CallStats] = None, host: str = "127.0.0.1", port: int = 0):
+        """サーバーの初期化（port=0の場合は空いているポートを使用）"""
+        self.profile = profile
+        self.stats = stats or CallStats()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        """OpenAIクライアントに指定するbase_url"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        """バックグラウンドのスレッドでサーバーを起動"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """サーバーを停止"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                return
+
+            def _send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+                payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if self.path.endswith("/embeddings"):
+                    operation = "embeddings"
+                elif self.path.endswith("/chat/completions"):
+                    operation = "chat.completions"
+                else:
+                    self._send_json(404, {"error": {"message": f"未対応のパスです: {self.path}", "type": "invalid_request_error"}})
+                    return
+
+                delay, fail = server.profile.sample()
+                time.sleep(delay)
+                if fail:
+                    server.stats.record(operation, error=True)
+                    self._send_json(
+                        429,
+                        {"error": {"message": "Rate limit reached (fake)", "type": "requests", "param": None, "code": "rate_limit_exceeded"}},
+                        {"retry-after-ms": "100"}
+                    )
+                    return
+
+                if operation == "embeddings":
+                    self._send_json(200, server._embeddings_response(request))
+                else:
+                    self._send_json(200, server._chat_response(request))
+
+        return Handler
+
+    def _embeddings_response(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """埋め込みAPIの応答を作成"""
+        inputs = request.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        dimensions = int(request.get("dimensions") or 3072)
+        data = []
+        for i, text in enumerate(inputs):
+            # トークンIDで渡された場合は文字列に戻さずIDの並びをそのまま使う
+            vector = fake_embedding(text if isinstance(text, str) else " ".join(map(str, text)), dimensions)
+            if request.get("encoding_format") == "base64":
+                vector = base64.b64encode(array("f", vector).tobytes()).decode("ascii")
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        tokens = sum(len(text) for text in inputs)
+        self.stats.record("embeddings", items=len(inputs))
+        return {
+            "object": "list",
+            "data": data,
+            "model": request.get("model", ""),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        }
+
+    def _chat_response(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """チャット補完APIの応答を作成"""
+        messages = request.get("messages", [])
+        json_mode = (request.get("response_format") or {}).get("type") == "json_object"
+        content = _fake_chat_content(messages, json_mode)
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in messages)
+        self.stats.record("chat.completions")
+        return {
+            "id": f"chatcmpl-fake-{int(time.time() * 1000)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", ""),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content), "total_tokens": prompt_tokens + len(content)}
+        }
+
+class FakeRateLimitError(Exception):
+    """Pineconeのレート制限エラー（429）の代替"""
+
+    def __init__(self, message: str):
+        super().__init__(message)
+        # Pineconeの例外と同じくstatusにHTTPステータスを保持する
+        self.status = 429
+
+class FakePineconeIndex(LocalIndex):
+    """LocalIndexの各操作に遅延とレート制限エラーを加えたPinecone Indexの代替"""
+
+    def __init__(self, directory: str, dimension: int, metric: str, profile: FaultProfile, stats: Optional[CallStats] = None):
+        super().__init__(directory, dimension, metric=metric, dtype="float32", use_hnsw=False)
+        self.profile = profile
+        self.stats = stats or CallStats()
+
+    def _simulate(self, operation: str, items: int = 1) -> None:
+        """遅延を加え、抽選に当たった場合はレート制限エラーを送出"""
+        delay, fail = self.profile.sample()
+        time.sleep(delay)
+        self.stats.record(operation, items=items, error=fail)
+        if fail:
+            raise FakeRateLimitError(f"(429) Too Many Requests: {operation} (fake)")
+
+    def upsert(self, vectors, namespace=None, **kwargs):
+        vectors = list(vectors)
+        self._simulate("upsert", len(vectors))
+        return super().upsert(vectors, namespace=namespace, **kwargs)
+
+    def query(self, *args, **kwargs):
+        self._simulate("query")
+        return super().query(*args, **kwargs)
+
+    def fetch(self, ids, namespace=None, **kwargs):
+        self._simulate("fetch", len(ids))
+        return super().fetch(ids, namespace=namespace, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        self._simulate("delete")
+        return super().delete(*args, **kwargs)
+
+    def describe_index_stats(self, **kwargs):
+        self._simulate("describe_index_stats")
+        return super().describe_index_stats(**kwargs)
+
+    def list_paginated(self, *args, **kwargs):
+        self._simulate("list")
+        return super().list_paginated(*args, **kwargs)
+
+class FakePineconeClient:
+    """list_indexesとIndexのみを持つPineconeクライアントの代替"""
+
+    def __init__(self, index_name: str, index: FakePineconeIndex):
+        self.index_name = index_name
+        self.index = index
+
+    def list_indexes(self) -> List[Dict[str, Any]]:
+        return [{"name": self.index_name}]
+
+    def Index(self, name: str) -> FakePineconeIndex:
+        if name != self.index_name:
+            raise ValueError(f"インデックス '{name}' が見つかりません")
+        return self.index
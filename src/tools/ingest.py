@@ -0,0 +1,204 @@
+"""
+ディレクトリ内のテキスト・CSVファイルをブラウザを使わずに一括登録するツール（チャンク分割は複数プロセスで並列実行）
+
+使用例:
+    python -m src.tools.ingest data/ --city 川越市 --source 市報
+    python -m src.tools.ingest data/facilities --namespace facilities --workers 8
+    python -m src.tools.ingest data/ --dry-run
+    python -m src.tools.ingest data/kawagoe --city 川越市 --city-namespaces
+"""
+from typing import List, Dict, Any, Optional
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import argparse
+import os
+import time
+from src.config.settings import CHUNK_SIZE, CITY_NAMESPACES_ENABLED
+from src.utils.chunking import decode_text, read_facility_csv, build_csv_chunks, advanced_manual_chunk_split
+from src.utils.text_processing import JapaneseTextProcessor
+
+INGEST_EXTENSIONS = (".txt", ".csv")
+
+# ワーカープロセスごとに1回だけ作成する形態素解析器（辞書の読み込みに時間がかかるため）
+_text_processor: Optional[JapaneseTextProcessor] = None
+
+def _get_text_processor() -> JapaneseTextProcessor:
+    global _text_processor
+    if _text_processor is None:
+        _text_processor = JapaneseTextProcessor()
+    return _text_processor
+
+def find_files(root: str, recursive: bool = True) -> List[str]:
+    """ディレクトリ内の登録対象のファイルを列挙（ファイルを指定した場合はそのファイルのみ）"""
+    if os.path.isfile(root):
+        return [root]
+    paths = []
+    for directory, subdirectories, filenames in os.walk(root):
+        subdirectories.sort()
+        paths.extend(
+            os.path.join(directory, filename)
+            for filename in sorted(filenames)
+            if filename.lower().endswith(INGEST_EXTENSIONS)
+        )
+        if not recursive:
+            break
+    return paths
+
+def chunk_file(path: str, root: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """1ファイルを読み込んでチャンクに分割（プロセスプールのワーカーで実行）"""
+    started_at = time.perf_counter()
+    base = root if os.path.isdir(root) else os.path.dirname(root)
+    filename = os.path.relpath(path, base).replace(os.sep, "/")
+    with open(path, "rb") as f:
+        content = f.read()
+
+    errors = []
+    if path.lower().endswith(".csv"):
+        chunks = build_csv_chunks(
+            read_facility_csv(content),
+            filename,
+            on_error=lambda index, e: errors.append(f"行 {index + 1}: {str(e)}")
+        )
+    else:
+        text = decode_text(content)
+        separators = [sep.strip() for sep in options["separators"].split("\n") if sep.strip()]
+        # autoではセパレータを含むファイルのみ手動分割し、それ以外は文単位で分割する
+        if options["mode"] == "manual" or (options["mode"] == "auto" and any(sep in text for sep in separators)):
+            chunks = advanced_manual_chunk_split(text, options["separators"], filename)
+        else:
+            chunks = _get_text_processor().process_text_file(text, filename, options["chunk_size"])
+
+    for chunk in chunks:
+        chunk["filename"] = filename
+        chunk["chunk_id"] = chunk["id"]
+        metadata = chunk.setdefault("metadata", {})
+        for key, value in options["metadata"].items():
+            if value:
+                metadata.setdefault(key, value)
+
+    return {
+        "filename": filename,
+        "chunks": chunks,
+        "errors": errors,
+        "seconds": time.perf_counter() - started_at
+    }
+
+def upload(service, chunks: List[Dict[str, Any]], namespace: Optional[str], totals: Dict[str, Any], sync: bool = False, by_city: bool = False) -> None:
+    """チャンクを埋め込み・アップロードの処理に渡し、結果を集計（syncではファイル単位で古いチャンクを削除、by_cityでは市区町村ごとのnamespaceに登録）"""
+    started_at = time.perf_counter()
+    if by_city:
+        report = service.upload_chunks_by_city(chunks, sync=sync, key_field="filename")
+    elif sync:
+        report = service.sync_chunks(chunks, namespace=namespace, key_field="filename")
+    else:
+        report = service.upload_chunks(chunks, namespace=namespace)
+    totals["upload_seconds"] += time.perf_counter() - started_at
+    totals["uploaded_chunks"] += sum(round_report["upsert"]["items"] for round_report in report.get("rounds", []))
+    totals["unchanged_chunks"] += report.get("unchanged_chunks", 0)
+    totals["duplicate_chunks"] += report.get("duplicate_chunks", 0)
+    totals["deleted_chunks"] += report.get("deleted_chunks", 0)
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """ファイルを並列にチャンク分割し、一定件数ごとにアップロード"""
+    paths = find_files(args.path, recursive=not args.no_recursive)
+    if not paths:
+        print(f"{args.path} に登録対象のファイル（{', '.join(INGEST_EXTENSIONS)}）がありません")
+        return {}
+
+    service = None
+    if not args.dry_run:
+        from src.services.pinecone_service import PineconeService
+        service = PineconeService()
+
+    now = datetime.now()
+    options = {
+        "mode": args.mode,
+        "separators": args.separators.replace("\\n", "\n"),
+        "chunk_size": args.chunk_size,
+        "metadata": {
+            "city": args.city,
+            "source": args.source,
+            "created_date": now.date().isoformat(),
+            "upload_date": now.isoformat()
+        }
+    }
+    totals = {
+        "files": len(paths),
+        "failed_files": 0,
+        "chunks": 0,
+        "chunking_cpu_seconds": 0.0,
+        "upload_seconds": 0.0,
+        "uploaded_chunks": 0,
+        "unchanged_chunks": 0,
+        "duplicate_chunks": 0,
+        "deleted_chunks": 0
+    }
+    print(f"{len(paths)}件のファイルを{args.workers}プロセスでチャンク分割します")
+
+    started_at = time.perf_counter()
+    pending: List[Dict[str, Any]] = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(chunk_file, path, args.path, options): path for path in paths}
+        # 分割が終わったファイルから順にアップロードし、残りのファイルの分割と並行させる
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                totals["failed_files"] += 1
+                print(f"  {futures[future]} の分割に失敗しました: {str(e)}")
+                continue
+            totals["chunks"] += len(result["chunks"])
+            totals["chunking_cpu_seconds"] += result["seconds"]
+            print(f"  {result['filename']}: {len(result['chunks'])}チャンク（{result['seconds']:.2f}秒）")
+            for error in result["errors"]:
+                print(f"    {error}")
+
+            pending.extend(result["chunks"])
+            if service and len(pending) >= args.upload_batch:
+                upload(service, pending, args.namespace, totals, args.sync, args.city_namespaces)
+                pending = []
+
+    if service and pending:
+        upload(service, pending, args.namespace, totals, args.sync, args.city_namespaces)
+    totals["total_seconds"] = time.perf_counter() - started_at
+    print_summary(totals, args.dry_run)
+    return totals
+
+def print_summary(totals: Dict[str, Any], dry_run: bool) -> None:
+    """処理件数とスループットを表示"""
+    total_seconds = totals["total_seconds"] or 1e-9
+    print("\n=== 一括登録の結果 ===")
+    print(f"ファイル: {totals['files']}件（失敗 {totals['failed_files']}件）")
+    print(f"チャンク: {totals['chunks']}件, {totals['chunks'] / total_seconds:.1f}件/秒（分割のCPU時間 合計{totals['chunking_cpu_seconds']:.2f}秒）")
+    if not dry_run:
+        upload_seconds = totals["upload_seconds"] or 1e-9
+        print(f"アップロード: {totals['uploaded_chunks']}件, {totals['uploaded_chunks'] / upload_seconds:.1f}件/秒"
+              f"（変更なし {totals['unchanged_chunks']}件, 重複 {totals['duplicate_chunks']}件, 削除 {totals['deleted_chunks']}件）")
+    print(f"合計時間: {totals['total_seconds']:.2f}秒")
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description="ディレクトリ内のテキスト・CSVファイルをチャンク分割して一括登録します")
+    parser.add_argument("path", help="登録するディレクトリまたはファイル")
+    parser.add_argument("--namespace", help="登録先のnamespace")
+    parser.add_argument("--city", default="", help="テキストのチャンクに設定する市区町村")
+    parser.add_argument("--source", default="", help="テキストのチャンクに設定する情報源")
+    parser.add_argument("--mode", choices=["auto", "manual", "sentence"], default="auto",
+                        help="テキストの分割方法（auto: セパレータを含むファイルのみ手動分割 / manual: セパレータで分割 / sentence: 文単位で分割）")
+    parser.add_argument("--separators", default="---", help="手動分割のセパレータ（複数の場合は\\nで区切る）")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="文単位で分割する際の1チャンクあたりの文字数")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="チャンク分割に使用するプロセス数")
+    parser.add_argument("--upload-batch", type=int, default=1000, help="まとめてアップロードするチャンク数")
+    parser.add_argument("--sync", action="store_true", help="ファイルごとに登録済みのチャンクを置き換え、含まれなくなったチャンクを削除する")
+    parser.add_argument("--city-namespaces", action="store_true", default=CITY_NAMESPACES_ENABLED,
+                        help="市区町村が設定されたチャンクを市区町村ごとのnamespaceに登録する（--namespaceより優先）")
+    parser.add_argument("--no-recursive", action="store_true", help="サブディレクトリを対象にしない")
+    parser.add_argument("--dry-run", action="store_true", help="チャンク分割のみ行い、アップロードしない")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """一括登録を実行"""
+    run(parse_args(argv))
+
+if __name__ == "__main__":
+    main()
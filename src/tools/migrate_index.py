@@ -0,0 +1,240 @@
+"""
+埋め込みの次元数を削減した新しいインデックスへ既存ベクトルを移行するツール
+
+使用例:
+    python -m src.tools.migrate_index --target-index pinechat-1024 --dimension 1024 --mode truncate --create
+    python -m src.tools.migrate_index --target-index pinechat-1024 --dimension 1024 --compare-only --queries queries.txt
+"""
+from typing import List, Dict, Any, Optional, Iterator
+import argparse
+import math
+import time
+from pinecone import ServerlessSpec
+from src.config.settings import (
+    EMBEDDING_MODEL,
+    SUPPORTED_EMBEDDING_DIMENSIONS,
+    DEFAULT_TOP_K
+)
+from src.services.pinecone_service import PineconeService
+from src.services.upsert_engine import UpsertEngine, UpsertMetrics
+from src.services.document_store import get_document_store
+
+def truncate_and_normalize(values: List[float], dimension: int) -> List[float]:
+    """ベクトルの先頭から指定次元数を切り出し、L2ノルムが1になるように正規化"""
+    truncated = list(values[:dimension])
+    norm = math.sqrt(sum(value * value for value in truncated))
+    if norm == 0:
+        return truncated
+    return [value / norm for value in truncated]
+
+def iter_source_batches(service: PineconeService, namespace: Optional[str], batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """移行元インデックスのベクトルをバッチ単位で順次取得"""
+    batch = []
+    for vector in service.iter_vectors(namespace=namespace, include_values=True):
+        source_vector = {"id": vector.id, "values": vector.values, "metadata": vector.metadata}
+        if vector.sparse_values:
+            source_vector["sparse_values"] = vector.sparse_values
+        batch.append(source_vector)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def build_target_vectors(
+    service: PineconeService,
+    source_vectors: List[Dict[str, Any]],
+    dimension: int,
+    mode: str
+) -> List[Dict[str, Any]]:
+    """移行先の次元数に合わせたベクトルを作成（truncate: 切り詰めて再正規化、reembed: 再埋め込み。疎ベクトルはそのまま引き継ぐ）"""
+    if mode == "truncate":
+        return [
+            _with_sparse_values(vector, {"id": vector["id"], "values": truncate_and_normalize(vector["values"], dimension), "metadata": vector["metadata"]})
+            for vector in source_vectors
+        ]
+
+    # アップロード時と同じ方法でベクトル化用のテキストを再構成する
+    texts = [
+        service._build_search_text({
+            "text": vector["metadata"].get("text", ""),
+            "metadata": {"answer_examples": vector["metadata"].get("answer_examples", [])}
+        })
+        for vector in source_vectors
+    ]
+    embeddings = service.get_embeddings(texts, dimensions=dimension)
+    target_vectors = []
+    for vector, embedding in zip(source_vectors, embeddings):
+        if embedding is None:
+            print(f"  ベクトル {vector['id']} の再埋め込みに失敗したためスキップします")
+            continue
+        target_vectors.append(_with_sparse_values(vector, {"id": vector["id"], "values": embedding, "metadata": vector["metadata"]}))
+    return target_vectors
+
+def _with_sparse_values(source_vector: Dict[str, Any], target_vector: Dict[str, Any]) -> Dict[str, Any]:
+    """移行元の疎ベクトル（BM25）を移行先のベクトルに付ける（密ベクトルの次元数に依存しないため変換しない）"""
+    if source_vector.get("sparse_values"):
+        target_vector["sparse_values"] = source_vector["sparse_values"]
+    return target_vector
+
+def ensure_target_index(service: PineconeService, args: argparse.Namespace):
+    """移行先インデックスを取得（--create指定時は存在しなければ作成）"""
+    existing_index_names = [index["name"] for index in service.pc.list_indexes()]
+    if args.target_index not in existing_index_names:
+        if not args.create:
+            raise ValueError(f"インデックス '{args.target_index}' が見つかりません（作成する場合は --create を指定してください）")
+        print(f"インデックス '{args.target_index}' を作成します（{args.dimension}次元, {args.metric}）")
+        service.pc.create_index(
+            name=args.target_index,
+            dimension=args.dimension,
+            metric=args.metric,
+            spec=ServerlessSpec(cloud=args.cloud, region=args.region)
+        )
+        while not service.pc.describe_index(args.target_index).status["ready"]:
+            time.sleep(1)
+
+    target_index = service.pc.Index(args.target_index)
+    target_dimension = target_index.describe_index_stats().dimension
+    if target_dimension != args.dimension:
+        raise ValueError(f"移行先インデックスの次元数（{target_dimension}）が指定された次元数（{args.dimension}）と異なります")
+    return target_index
+
+def migrate(service: PineconeService, target_index, args: argparse.Namespace) -> None:
+    """namespaceごとにベクトルを移行"""
+    namespaces = args.namespaces or list(service.index.describe_index_stats().namespaces.keys())
+    engine = UpsertEngine(target_index)
+
+    for namespace in namespaces:
+        print(f"namespace '{namespace}' のベクトルを移行します")
+        metrics = UpsertMetrics()
+        migrated = 0
+        for batch in iter_source_batches(service, namespace or None, args.batch_size):
+            target_vectors = build_target_vectors(service, batch, args.dimension, args.mode)
+            store = get_document_store()
+            if store:
+                # 移行元で補完したテキストは移行先のPineconeには保存しない
+                for vector in target_vectors:
+                    vector["metadata"] = store.slim_metadata(vector["metadata"])
+            engine.upsert(target_vectors, namespace=namespace or None, metrics=metrics)
+            migrated += len(batch)
+            print(f"  {migrated}件 完了")
+
+        stats = metrics.to_dict()
+        print(f"  アップロード: {stats['vectors']}件 / {stats['requests']}リクエスト / {stats['megabytes']}MB")
+
+def load_queries(args: argparse.Namespace, service: PineconeService) -> List[str]:
+    """比較に使用するクエリを取得（ファイル指定がない場合は移行元のテキストから抽出）"""
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+
+    namespaces = args.namespaces or list(service.index.describe_index_stats().namespaces.keys())
+    queries = []
+    for namespace in namespaces:
+        for vector in service.list_vectors(namespace=namespace or None, limit=args.sample):
+            text = (vector.metadata or {}).get("text", "")
+            if text:
+                queries.append(text[:200])
+            if len(queries) >= args.sample:
+                return queries
+    return queries
+
+def compare(service: PineconeService, target_index, args: argparse.Namespace) -> Dict[str, Any]:
+    """移行元と移行先で同じクエリを検索し、レイテンシとrecall@kを比較"""
+    queries = load_queries(args, service)
+    if not queries:
+        print("比較に使用するクエリがありません")
+        return {}
+
+    namespaces = args.namespaces or [None]
+    source_latencies = []
+    target_latencies = []
+    recalls = []
+
+    # 埋め込みの生成時間を含めないように、先にまとめてベクトル化しておく
+    source_embeddings = service.get_embeddings(queries)
+    target_embeddings = service.get_embeddings(queries, dimensions=args.dimension)
+
+    for query, source_vector, target_vector in zip(queries, source_embeddings, target_embeddings):
+        if source_vector is None or target_vector is None:
+            continue
+        for namespace in namespaces:
+            started_at = time.perf_counter()
+            source_results = service.index.query(vector=source_vector, top_k=args.top_k, namespace=namespace or None)
+            source_latencies.append(time.perf_counter() - started_at)
+
+            started_at = time.perf_counter()
+            target_results = target_index.query(vector=target_vector, top_k=args.top_k, namespace=namespace or None)
+            target_latencies.append(time.perf_counter() - started_at)
+
+            # 移行元の上位k件を正解とみなしてrecall@kを計算
+            source_ids = {match.id for match in source_results.matches}
+            target_ids = {match.id for match in target_results.matches}
+            if source_ids:
+                recalls.append(len(source_ids & target_ids) / len(source_ids))
+
+    report = {
+        "queries": len(queries),
+        "top_k": args.top_k,
+        "source": {"dimension": service.dimension, **_latency_summary(source_latencies)},
+        "target": {"dimension": args.dimension, **_latency_summary(target_latencies)},
+        "recall_at_k": round(sum(recalls) / len(recalls), 4) if recalls else 0.0
+    }
+
+    print("\n=== 比較結果 ===")
+    print(f"クエリ数: {report['queries']}, top_k: {report['top_k']}")
+    print(f"{'':8}{'次元数':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'平均(ms)':>10}")
+    for label in ("source", "target"):
+        row = report[label]
+        print(f"{label:8}{row['dimension']:>8}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['mean_ms']:>10}")
+    print(f"recall@{args.top_k}: {report['recall_at_k']}")
+    return report
+
+def _latency_summary(latencies: List[float]) -> Dict[str, float]:
+    """レイテンシの中央値・95パーセンタイル・平均をミリ秒で取得"""
+    if not latencies:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "mean_ms": 0.0}
+    values = sorted(latencies)
+    p50 = values[int(round(0.5 * (len(values) - 1)))]
+    p95 = values[int(round(0.95 * (len(values) - 1)))]
+    return {
+        "p50_ms": round(p50 * 1000, 1),
+        "p95_ms": round(p95 * 1000, 1),
+        "mean_ms": round(sum(values) / len(values) * 1000, 1)
+    }
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description=f"{EMBEDDING_MODEL}の次元数を削減したインデックスへ移行します")
+    parser.add_argument("--target-index", required=True, help="移行先のインデックス名")
+    parser.add_argument("--dimension", type=int, required=True, choices=SUPPORTED_EMBEDDING_DIMENSIONS, help="移行先の次元数")
+    parser.add_argument("--mode", choices=["truncate", "reembed"], default="truncate",
+                        help="truncate: 既存ベクトルを切り詰めて再正規化 / reembed: テキストを再埋め込み")
+    parser.add_argument("--namespaces", nargs="*", help="移行するnamespace（省略時はすべて）")
+    parser.add_argument("--batch-size", type=int, default=100, help="1回に処理するベクトル数")
+    parser.add_argument("--create", action="store_true", help="移行先インデックスが存在しない場合に作成する")
+    parser.add_argument("--metric", default="cosine", help="作成するインデックスのメトリック")
+    parser.add_argument("--cloud", default="aws", help="作成するインデックスのクラウド")
+    parser.add_argument("--region", default="us-east-1", help="作成するインデックスのリージョン")
+    parser.add_argument("--compare-only", action="store_true", help="移行を行わずに比較のみ実行する")
+    parser.add_argument("--skip-compare", action="store_true", help="移行後の比較を行わない")
+    parser.add_argument("--queries", help="比較に使用するクエリ（1行1クエリのテキストファイル）")
+    parser.add_argument("--sample", type=int, default=50, help="クエリファイルがない場合に移行元から抽出するクエリ数")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K, help="recall@kの計算に使用する件数")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """移行と比較を実行"""
+    args = parse_args(argv)
+    service = PineconeService()
+    if args.mode == "truncate" and args.dimension > service.dimension:
+        raise ValueError(f"truncateモードでは移行元の次元数（{service.dimension}）より大きい次元数は指定できません")
+
+    target_index = ensure_target_index(service, args)
+    if not args.compare_only:
+        migrate(service, target_index, args)
+    if not args.skip_compare:
+        compare(service, target_index, args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+事前に計算した埋め込みベクトルのインポート・エクスポートツール（再埋め込みを行わずに復元・環境の複製を行う）
+
+使用例:
+    python -m src.tools.vector_io export --namespace property --output backup/property.jsonl.gz
+    python -m src.tools.vector_io import backup/property.jsonl.gz --namespace property
+    python -m src.tools.vector_io import embeddings.parquet --batch-size 1000 --skip-invalid
+"""
+from typing import List, Optional
+import argparse
+from src.config.settings import IMPORT_BATCH_SIZE
+from src.services.pinecone_service import PineconeService
+from src.services.vector_import import iter_records, write_jsonl
+
+def run_import(service: PineconeService, args: argparse.Namespace) -> None:
+    """ファイルのベクトルを順にインポート"""
+    for path in args.paths:
+        print(f"{path} をnamespace '{args.namespace or ''}' にインポートします（{service.dimension}次元）")
+        report = service.import_vectors(
+            iter_records(path, args.batch_size),
+            namespace=args.namespace,
+            batch_size=args.batch_size,
+            skip_invalid=args.skip_invalid
+        )
+        upsert_requests = report["upsert_requests"]
+        print(f"  アップロード: {upsert_requests['vectors']}件 / {upsert_requests['requests']}リクエスト / {upsert_requests['megabytes']}MB")
+        for error in report["errors"]:
+            print(f"  無効なレコード: {error}")
+
+def run_export(service: PineconeService, args: argparse.Namespace) -> None:
+    """namespaceのベクトルをJSONLファイルに書き出し"""
+    print(f"namespace '{args.namespace or ''}' のベクトルを {args.output} に書き出します")
+    count = write_jsonl(service.iter_vectors(namespace=args.namespace, include_values=True), args.output)
+    print(f"  {count}件 書き出しました")
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description="埋め込み済みのベクトルをParquet/JSONLからインポート、またはJSONLへエクスポートします")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="Parquet/JSONLのベクトルをインポート")
+    import_parser.add_argument("paths", nargs="+", help="インポートするファイル（.parquet / .jsonl / .jsonl.gz）")
+    import_parser.add_argument("--namespace", help="インポート先のnamespace")
+    import_parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="1回に読み込んでアップロードする件数")
+    import_parser.add_argument("--skip-invalid", action="store_true", help="次元数が異なるなど無効なレコードをスキップする（既定ではエラーで中断）")
+
+    export_parser = subparsers.add_parser("export", help="namespaceのベクトルをJSONLへエクスポート")
+    export_parser.add_argument("--namespace", help="エクスポートするnamespace")
+    export_parser.add_argument("--output", required=True, help="出力先のファイル（.gzで終わる場合は圧縮）")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """インポートまたはエクスポートを実行"""
+    args = parse_args(argv)
+    service = PineconeService()
+    if args.command == "import":
+        run_import(service, args)
+    else:
+        run_export(service, args)
+
+if __name__ == "__main__":
+    main()
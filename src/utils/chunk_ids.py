@@ -0,0 +1,24 @@
+from typing import Dict, Any, Iterable
+import hashlib
+import json
+
+# IDに含めるハッシュの桁数（ソースは短く、内容は衝突しにくい長さにする）
+SOURCE_HASH_LENGTH = 8
+CONTENT_HASH_LENGTH = 16
+
+def _digest(value: str) -> str:
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()
+
+def chunk_id_prefix(prefix: str, source: str) -> str:
+    """同じソースから作成したチャンクIDに共通する接頭辞を取得"""
+    return f"{prefix}_{_digest(source or '')[:SOURCE_HASH_LENGTH]}_"
+
+def make_chunk_id(prefix: str, source: str, text: str) -> str:
+    """ソース（ファイル名など）と本文のハッシュから決定的なチャンクIDを作成（同じ内容は常に同じIDになる）"""
+    return f"{chunk_id_prefix(prefix, source)}{_digest(text.strip())[:CONTENT_HASH_LENGTH]}"
+
+def make_content_hash(metadata: Dict[str, Any], excluded_fields: Iterable[str] = ()) -> str:
+    """アップロードするメタデータ全体のハッシュを作成（アップロード日時など毎回変わるフィールドは除外）"""
+    excluded = set(excluded_fields)
+    content = {key: value for key, value in metadata.items() if key not in excluded}
+    return _digest(json.dumps(content, ensure_ascii=False, sort_keys=True, default=str))
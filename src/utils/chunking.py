@@ -0,0 +1,163 @@
+"""
+Streamlitに依存しないチャンク分割処理（画面からのアップロードとコマンドラインの一括登録で共用）
+"""
+from typing import List, Dict, Any, Callable, Optional
+import io
+import json
+import pandas as pd
+from src.utils.chunk_ids import make_chunk_id
+
+# 日本語のテキスト・CSVで一般的なエンコーディング（先頭から順に試す）
+TEXT_ENCODINGS = ['utf-8', 'shift-jis', 'cp932', 'euc-jp']
+# 施設CSVの列（ヘッダー行なし）
+FACILITY_CSV_COLUMNS = ["大カテゴリ", "中カテゴリ", "施設名", "緯度", "経度", "徒歩距離", "徒歩分数", "直線距離"]
+
+def decode_text(content: bytes) -> str:
+    """バイト列を適切なエンコーディングで文字列に変換"""
+    for encoding in TEXT_ENCODINGS:
+        try:
+            # バイト列を文字列にデコード
+            decoded_content = content.decode(encoding)
+            # デコードした文字列を再度エンコードして元のバイト列と比較
+            if decoded_content.encode(encoding) == content:
+                return decoded_content
+        except (UnicodeDecodeError, UnicodeEncodeError):
+            continue
+
+    # すべてのエンコーディングで失敗した場合
+    try:
+        # UTF-8で強制的にデコードを試みる（一部の文字が化ける可能性あり）
+        return content.decode('utf-8', errors='replace')
+    except Exception as e:
+        raise ValueError(f"ファイルのエンコーディングを特定できませんでした。エラー: {str(e)}")
+
+def read_facility_csv(content: bytes) -> pd.DataFrame:
+    """施設CSVのバイト列をエンコーディングを判定しながら読み込む"""
+    for encoding in TEXT_ENCODINGS:
+        try:
+            return pd.read_csv(io.StringIO(content.decode(encoding)), header=None, names=FACILITY_CSV_COLUMNS)
+        except (UnicodeDecodeError, pd.errors.EmptyDataError):
+            continue
+    raise ValueError("CSVファイルのエンコーディングを特定できませんでした。")
+
+def build_csv_chunks(
+    df: pd.DataFrame,
+    filename: str,
+    on_error: Optional[Callable[[int, Exception], None]] = None
+) -> List[Dict[str, Any]]:
+    """施設CSVの各行をチャンクに変換（変換できない行はon_errorに渡してスキップ）"""
+    chunks = []
+    for index, row in df.iterrows():
+        try:
+            # 各行をテキストに変換
+            text = f"{row['施設名']}は{row['大カテゴリ']}の{row['中カテゴリ']}です。"
+            if not text.strip():
+                continue
+            # NaN値を適切に処理し、型変換を確実に行う
+            metadata = {
+                "main_category": str(row['大カテゴリ']) if pd.notna(row['大カテゴリ']) else "",
+                "sub_category": str(row['中カテゴリ']) if pd.notna(row['中カテゴリ']) else "",
+                "facility_name": str(row['施設名']) if pd.notna(row['施設名']) else "",
+                "latitude": float(row['緯度']) if pd.notna(row['緯度']) else 0.0,
+                "longitude": float(row['経度']) if pd.notna(row['経度']) else 0.0,
+                "walking_distance": int(float(row['徒歩距離'])) if pd.notna(row['徒歩距離']) else 0,
+                "walking_minutes": int(float(row['徒歩分数'])) if pd.notna(row['徒歩分数']) else 0,
+                "straight_distance": int(float(row['直線距離'])) if pd.notna(row['直線距離']) else 0
+            }
+            # 同じファイルの同じ行は再アップロードしても同じIDになる
+            chunks.append({
+                "id": make_chunk_id("csv", filename, f"{text}\n{json.dumps(metadata, ensure_ascii=False, sort_keys=True)}"),
+                "text": text,
+                "filename": filename,
+                "metadata": metadata
+            })
+        except Exception as e:
+            if on_error:
+                on_error(index, e)
+    return chunks
+
+def advanced_manual_chunk_split(text: str, chunk_separators: str = "---", source: str = "") -> List[Dict[str, Any]]:
+    """高度な手動チャンク分割（複数セパレータ対応。IDはソースのファイル名と本文のハッシュから作成）"""
+    chunks = []
+
+    if not chunk_separators:
+        # セパレータがない場合は全体を1つのチャンクとして扱う
+        if text.strip():
+            chunks.append({
+                "id": make_chunk_id("manual", source, text),
+                "text": text.strip(),
+                "metadata": {
+                    "chunk_type": "manual",
+                    "chunk_index": 0
+                }
+            })
+        return chunks
+
+    # 複数のセパレータをサポート（改行で区切る）
+    separators = [sep.strip() for sep in chunk_separators.split('\n') if sep.strip()]
+
+    if not separators:
+        # 有効なセパレータがない場合
+        if text.strip():
+            chunks.append({
+                "id": make_chunk_id("manual", source, text),
+                "text": text.strip(),
+                "metadata": {
+                    "chunk_type": "manual",
+                    "chunk_index": 0
+                }
+            })
+        return chunks
+
+    # 最初のセパレータで分割
+    parts = text.split(separators[0])
+
+    # 各部分を処理
+    chunk_index = 0
+    for part in parts:
+        part = part.strip()
+        if not part:  # 空の部分はスキップ
+            continue
+
+        # 追加のセパレータがある場合は、さらに分割を試みる
+        if len(separators) > 1:
+            sub_parts = []
+            current_part = part
+
+            for sep in separators[1:]:
+                if sep in current_part:
+                    sub_parts.extend(current_part.split(sep))
+                    current_part = ""
+                    break
+                else:
+                    sub_parts = [current_part]
+                    break
+
+            # サブパーツを処理
+            for sub_part in sub_parts:
+                sub_part = sub_part.strip()
+                if sub_part:  # 空でない部分のみをチャンクとして追加
+                    chunks.append({
+                        "id": make_chunk_id("manual", source, sub_part),
+                        "text": sub_part,
+                        "metadata": {
+                            "chunk_type": "manual",
+                            "chunk_index": chunk_index,
+                            "separators_used": separators
+                        }
+                    })
+                    chunk_index += 1
+        else:
+            # 単一セパレータの場合
+            chunks.append({
+                "id": make_chunk_id("manual", source, part),
+                "text": part,
+                "metadata": {
+                    "chunk_type": "manual",
+                    "chunk_index": chunk_index,
+                    "separators_used": separators
+                }
+            })
+            chunk_index += 1
+
+    return chunks
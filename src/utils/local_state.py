@@ -0,0 +1,26 @@
+from typing import List
+from array import array
+import os
+import sqlite3
+
+def open_sqlite(path: str) -> sqlite3.Connection:
+    """ローカル状態用のSQLiteデータベースを開く（ディレクトリがなければ作成）"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    # Streamlitのスレッドやアップロード処理のワーカーから共有するためスレッドチェックを無効化
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def encode_vector(vector: List[float]) -> bytes:
+    """ベクトルをfloat32のバイト列に変換"""
+    return array("f", vector).tobytes()
+
+def decode_vector(blob: bytes) -> List[float]:
+    """float32のバイト列をベクトルに変換"""
+    values = array("f")
+    values.frombytes(blob)
+    return values.tolist()
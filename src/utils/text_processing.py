@@ -1,7 +1,15 @@
 from typing import List, Dict, Any
 from janome.tokenizer import Tokenizer
 from src.config.settings import CHUNK_SIZE
+from src.utils.chunk_ids import make_chunk_id
 import time
+import unicodedata
+
+# 検索用の語として扱う品詞と、除外する品詞細分類
+CONTENT_PARTS_OF_SPEECH = {"名詞", "動詞", "形容詞"}
+IGNORED_SUBCATEGORIES = {"非自立", "代名詞", "数", "接尾"}
+# 地名に続くと駅名・施設名になる語
+FACILITY_SUFFIXES = ("駅", "線", "公園", "病院", "小学校", "中学校", "高校", "図書館", "保育園", "幼稚園", "センター", "ホール", "モール")
 
 class JapaneseTextProcessor:
     def __init__(self):
@@ -23,6 +31,40 @@ class JapaneseTextProcessor:
         
         return sentences
 
+    def extract_terms(self, text: str) -> List[str]:
+        """検索用の語（名詞・動詞・形容詞の基本形）を抽出（全角・半角と大文字・小文字の揺れを吸収）"""
+        terms = []
+        for token in self.tokenizer.tokenize(unicodedata.normalize("NFKC", text)):
+            pos = token.part_of_speech.split(",")
+            if pos[0] not in CONTENT_PARTS_OF_SPEECH or pos[1] in IGNORED_SUBCATEGORIES:
+                continue
+            term = token.base_form if token.base_form != "*" else token.surface
+            term = term.strip().lower()
+            if term:
+                terms.append(term)
+        return terms
+
+    def count_proper_nouns(self, text: str) -> int:
+        """固有名詞（施設名・駅名・地名など）の数を取得"""
+        return sum(
+            1 for token in self.tokenizer.tokenize(unicodedata.normalize("NFKC", text))
+            if token.part_of_speech.startswith("名詞,固有名詞")
+        )
+
+    def count_named_facilities(self, text: str) -> int:
+        """地名を除く固有名詞（施設名・組織名など）と、駅・施設を表す語が続く地名（「川越駅」など）の数を取得"""
+        tokens = list(self.tokenizer.tokenize(unicodedata.normalize("NFKC", text)))
+        count = 0
+        for i, token in enumerate(tokens):
+            pos = token.part_of_speech.split(",")
+            if pos[0] != "名詞" or pos[1] != "固有名詞":
+                continue
+            if pos[2] != "地域":
+                count += 1
+            elif i + 1 < len(tokens) and tokens[i + 1].surface.startswith(FACILITY_SUFFIXES):
+                count += 1
+        return count
+
     def is_sentence_boundary(self, text: str) -> bool:
         """文の区切りかどうかを判定"""
         if not text:
@@ -50,7 +92,7 @@ class JapaneseTextProcessor:
                 # 現在のチャンクが空でない場合、新しいチャンクを作成
                 if current_chunk:
                     chunks.append({
-                        "id": f"{filename}_chunk_{chunk_id}",  # ファイル名を含めたID
+                        "id": make_chunk_id("text", filename, current_chunk),  # ファイル名と本文から決まるID
                         "text": current_chunk.strip(),
                         "metadata": {
                             "filename": filename,
@@ -67,7 +109,7 @@ class JapaneseTextProcessor:
                     for i in range(0, len(sentence), chunk_size):
                         sub_chunk = sentence[i:i + chunk_size]
                         chunks.append({
-                            "id": f"{filename}_chunk_{chunk_id}",  # ファイル名を含めたID
+                            "id": make_chunk_id("text", filename, sub_chunk),  # ファイル名と本文から決まるID
                             "text": sub_chunk,
                             "metadata": {
                                 "filename": filename,
@@ -83,7 +125,7 @@ class JapaneseTextProcessor:
         # 最後のチャンクを追加
         if current_chunk:
             chunks.append({
-                "id": f"{filename}_chunk_{chunk_id}",  # ファイル名を含めたID
+                "id": make_chunk_id("text", filename, current_chunk),  # ファイル名と本文から決まるID
                 "text": current_chunk.strip(),
                 "metadata": {
                     "filename": filename,
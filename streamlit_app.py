@@ -12,29 +12,23 @@ if SRC_DIR not in sys.path:
 # エラーハンドリングの改善
 try:
     from src.utils.text_processing import process_text_file
-    from src.services.pinecone_service import PineconeService
+    from src.services.service_container import get_service_container
     from src.components.file_upload import render_file_upload
     from src.components.chat import render_chat
     from src.components.settings import render_settings
     #from src.components.agent import render_agent
     from src.components.property_upload import render_property_upload
     from src.config.settings import DEFAULT_SYSTEM_PROMPT, DEFAULT_RESPONSE_TEMPLATE
-    from langsmith import Client
-    from langchain.callbacks.tracers import LangChainTracer
-    from langchain.callbacks.manager import CallbackManager
 except ImportError as e:
     st.error(f"モジュールのインポートに失敗しました: {str(e)}")
     st.error(f"詳細: {traceback.format_exc()}")
     st.stop()
 
-# LangSmithの設定
-try:
-    client = Client()
-    tracer = LangChainTracer()
-    callback_manager = CallbackManager([tracer])
-except Exception as e:
-    st.warning(f"LangSmithの初期化に失敗しました: {str(e)}")
-    callback_manager = None
+# 共有サービスの取得（クライアントの作成は初回のみで、再実行やセッション間で再利用する）
+service_container = get_service_container()
+for warning in service_container.warnings:
+    st.warning(warning)
+callback_manager = service_container.callback_manager
 
 # セッション状態の初期化
 if "messages" not in st.session_state:
@@ -49,13 +43,16 @@ if "response_template" not in st.session_state:
 # Pineconeサービスの初期化
 pinecone_service = None
 try:
-    pinecone_service = PineconeService()
+    pinecone_service = service_container.get_pinecone_service()
     # インデックスの状態を確認
     stats = pinecone_service.get_index_stats()
     if stats['total_vector_count'] == 0:
         st.info("データベースは空です。物件情報を登録してください。")
     else:
         st.write(f"データベースの状態: {stats['total_vector_count']}件のドキュメント")
+    stats_age = pinecone_service.get_stats_cache_info()["age_seconds"]
+    if stats_age:
+        st.caption(f"（{stats_age:.0f}秒前の情報）")
 except Exception as e:
     st.error(f"Pineconeサービスの初期化に失敗しました: {str(e)}")
     st.error("APIキーとインデックス名を確認してください。")
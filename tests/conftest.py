@@ -0,0 +1,49 @@
+"""
+テスト共通の設定
+
+設定モジュールは読み込み時に環境変数を参照するため、srcのモジュールを読み込む前に
+ローカルの状態を一時ディレクトリに向け、実際のAPIキーや.envの設定を使わないようにする。
+（APIキーなどは環境変数が未設定だとst.secretsを参照するため、すべて設定する）
+"""
+import os
+import sys
+import tempfile
+import types
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+os.environ.update({
+    "OPENAI_API_KEY": "sk-test",
+    "PINECONE_API_KEY": "test",
+    "PINECONE_INDEX_NAME": "test",
+    "PINECONE_ASSISTANT_NAME": "test",
+    "VECTOR_BACKEND": "local",
+    "EMBEDDING_DIMENSION": "256",
+    "EMBEDDING_CACHE_ENABLED": "false",
+    "QUERY_CACHE_ENABLED": "false",
+    "PINECHAT_STATE_DIR": tempfile.mkdtemp(prefix="pinechat-test-"),
+    "LANGCHAIN_TRACING_V2": "false"
+})
+
+# トークナイザーの語彙ファイルをダウンロードせずに実行できるようにする
+from src.tools.fake_services import fake_embedding, install_fake_tokenizer
+
+install_fake_tokenizer()
+
+class FakeEmbeddings:
+    """埋め込みを要求されたテキストを記録する代替のOpenAI埋め込みAPI"""
+
+    def __init__(self):
+        self.texts = []
+
+    def create(self, model, input, dimensions=None, **kwargs):
+        self.texts.extend(input)
+        data = [types.SimpleNamespace(index=i, embedding=fake_embedding(text, dimensions)) for i, text in enumerate(input)]
+        return types.SimpleNamespace(data=data)
+
+@pytest.fixture
+def openai_client():
+    """埋め込みだけに対応した代替のOpenAIクライアント（embeddings.textsで要求されたテキストを確認できる）"""
+    return types.SimpleNamespace(embeddings=FakeEmbeddings())
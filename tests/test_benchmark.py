@@ -0,0 +1,40 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_benchmark_smoke_run_with_fake_services(tmp_path):
+    # 設定モジュールは読み込み時に環境変数を参照するため、ベンチマークは別プロセスで実行する
+    output = tmp_path / "report.json"
+    result = subprocess.run(
+        [
+            sys.executable, "-m", "src.tools.benchmark",
+            "--documents", "20",
+            "--queries", "2",
+            "--chat-requests", "1",
+            "--batch-size", "10",
+            "--openai-latency-ms", "0",
+            "--openai-jitter-ms", "0",
+            "--pinecone-latency-ms", "0",
+            "--pinecone-jitter-ms", "0",
+            "--output", str(output)
+        ],
+        cwd=ROOT_DIR,
+        env=dict(os.environ),
+        capture_output=True,
+        text=True,
+        timeout=300
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+
+    report = json.loads(output.read_text(encoding="utf-8"))
+    assert report["ingestion"]["chunks"] == 20
+    assert report["ingestion"]["failed_chunks"] == 0
+    assert report["search"]["requests"] == 2
+    assert report["search"]["errors"] == 0
+    assert report["chat"]["requests"] == 1
+    assert report["chat"]["errors"] == 0
+    assert report["calls"]["openai"]
+    assert report["calls"]["pinecone"]
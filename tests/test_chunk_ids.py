@@ -0,0 +1,39 @@
+from src.utils.chunk_ids import make_chunk_id, make_content_hash
+
+def test_chunk_id_is_derived_from_source_and_text():
+    chunk_id = make_chunk_id("text", "guide.txt", "駅から徒歩5分です。")
+    assert chunk_id == make_chunk_id("text", "guide.txt", "  駅から徒歩5分です。\n")
+    prefix, source_hash, content_hash = chunk_id.split("_")
+    assert prefix == "text"
+    assert len(source_hash) == 8
+    assert len(content_hash) == 16
+
+    assert make_chunk_id("text", "other.txt", "駅から徒歩5分です。") != chunk_id
+    assert make_chunk_id("text", "guide.txt", "駅から徒歩6分です。") != chunk_id
+    assert make_chunk_id("text", None, "本文") == make_chunk_id("text", "", "本文")
+
+def test_content_hash_ignores_key_order_and_excluded_fields():
+    metadata = {"text": "本文", "city": "川越市", "upload_date": "2024-04-01"}
+    content_hash = make_content_hash(metadata, ["upload_date"])
+    assert content_hash == make_content_hash({"upload_date": "2025-01-01", "city": "川越市", "text": "本文"}, ["upload_date"])
+    assert content_hash != make_content_hash(dict(metadata, city="所沢市"), ["upload_date"])
+    assert content_hash != make_content_hash(metadata)
+
+def test_reupload_skips_unchanged_chunks(openai_client):
+    from src.services.pinecone_service import PineconeService
+
+    embeddings = openai_client.embeddings
+    service = PineconeService(openai_client=openai_client)
+    chunks = [
+        {"id": make_chunk_id("text", "skip.txt", text), "text": text, "filename": "skip.txt", "chunk_id": str(i), "metadata": {"city": "川越市"}}
+        for i, text in enumerate(["図書館は駅前にあります。", "市役所は本町にあります。"])
+    ]
+    service.upload_chunks(chunks, namespace="skip-unchanged")
+    assert len(embeddings.texts) == 2
+
+    # 内容が同じチャンクは埋め込みもアップロードも行わず、メタデータが変わったチャンクのみ登録し直す
+    chunks[1] = dict(chunks[1], metadata={"city": "川越市", "main_category": "行政"})
+    report = service.upload_chunks(chunks, namespace="skip-unchanged")
+    assert report["unchanged_chunks"] == 1
+    assert len(embeddings.texts) == 3
+    assert service.get_by_id(chunks[1]["id"], namespace="skip-unchanged")["metadata"]["main_category"] == "行政"
@@ -0,0 +1,116 @@
+import math
+import random
+from src.services.geo_index import GeoIndex, haversine_distances
+
+def make_entries(count, seed=0):
+    rng = random.Random(seed)
+    categories = ["医療", "教育", "公共施設"]
+    return [
+        {
+            "id": f"facility_{i}",
+            "metadata": {
+                "facility_name": f"施設{i}",
+                "main_category": categories[i % len(categories)],
+                "latitude": 35.90 + rng.uniform(-0.05, 0.05),
+                "longitude": 139.48 + rng.uniform(-0.05, 0.05)
+            }
+        }
+        for i in range(count)
+    ]
+
+def brute_force(entries, latitude, longitude, category=None):
+    candidates = [entry for entry in entries if category in (None, entry["metadata"]["main_category"])]
+    distances = haversine_distances(
+        latitude,
+        longitude,
+        [entry["metadata"]["latitude"] for entry in candidates],
+        [entry["metadata"]["longitude"] for entry in candidates]
+    )
+    return [(entry["id"], float(distance)) for entry, distance in sorted(zip(candidates, distances), key=lambda pair: pair[1])]
+
+def test_skips_entries_without_coordinates():
+    index = GeoIndex.build([
+        {"id": "missing", "metadata": {"facility_name": "位置なし"}},
+        {"id": "zero", "metadata": {"latitude": 0.0, "longitude": 0.0}},
+        {"id": "invalid", "metadata": {"latitude": "北緯", "longitude": 139.0}},
+        {"id": "valid", "metadata": {"latitude": "35.9", "longitude": "139.48"}}
+    ])
+    assert index.ids == ["valid"]
+
+def test_nearest_and_within_radius_match_brute_force():
+    entries = make_entries(300)
+    index = GeoIndex.build(entries)
+    latitude, longitude = 35.91, 139.47
+
+    expected = brute_force(entries, latitude, longitude)
+    results = index.nearest(latitude, longitude, k=7)
+    assert [result["id"] for result in results] == [vector_id for vector_id, _ in expected[:7]]
+    assert math.isclose(results[0]["distance"], expected[0][1])
+
+    within = index.within_radius(latitude, longitude, radius_meters=1500)
+    assert [result["id"] for result in within] == [vector_id for vector_id, distance in expected if distance <= 1500]
+
+    expected_medical = brute_force(entries, latitude, longitude, "医療")
+    assert [result["id"] for result in index.nearest(latitude, longitude, k=3, categories=["医療"])] == [vector_id for vector_id, _ in expected_medical[:3]]
+
+def test_describe_surroundings_only_answers_location_questions():
+    index = GeoIndex.build([
+        {"id": "hospital", "metadata": {"facility_name": "中央病院", "main_category": "医療", "sub_category": "病院", "latitude": 35.9010, "longitude": 139.4800}},
+        {"id": "school", "metadata": {"facility_name": "第一小学校", "main_category": "教育", "sub_category": "小学校", "latitude": 35.9000, "longitude": 139.4900}}
+    ])
+    assert index.match_categories("近くの病院と小学校は？") == ["小学校", "病院"]
+
+    text = index.describe_surroundings(35.9000, 139.4800, "一番近い病院はどこですか")
+    assert "【病院】最寄り1件" in text
+    assert "中央病院（医療/病院）: 約111m（徒歩約2分）" in text
+    assert "第一小学校" not in text
+
+    assert "第一小学校" in index.describe_surroundings(35.9000, 139.4800, "周辺に何がありますか")
+    assert index.describe_surroundings(35.9000, 139.4800, "家賃はいくらですか") == ""
+
+def make_facility(vector_id, name, city, latitude, longitude, category="公共施設"):
+    return {
+        "id": vector_id,
+        "text": f"{name}は{city}の{category}です。",
+        "filename": f"{vector_id}.txt",
+        "chunk_id": "0",
+        "metadata": {"facility_name": name, "city": city, "main_category": category, "latitude": latitude, "longitude": longitude}
+    }
+
+def test_service_geo_index_covers_namespaces_routed_for_city(openai_client):
+    from src.services.pinecone_service import PineconeService
+
+    service = PineconeService(openai_client=openai_client)
+    service.upload_chunks_by_city([
+        make_facility("kawagoe_library", "川越図書館", "川越市", 35.9251, 139.4858),
+        make_facility("tokorozawa_library", "所沢図書館", "所沢市", 35.7990, 139.4690),
+        make_facility("common_office", "県税事務所", "", 35.9255, 139.4862)
+    ])
+
+    # 市区町村ごとのnamespaceに分かれた施設も、検索と同じnamespaceの組み合わせで空間インデックスに含める
+    geo_index = service.get_geo_index(city="川越市")
+    assert sorted(geo_index.ids) == ["common_office", "kawagoe_library"]
+    assert service.get_geo_index(city="川越市") is geo_index
+    assert sorted(service.get_geo_index().ids) == ["common_office", "kawagoe_library", "tokorozawa_library"]
+
+def test_service_geo_index_is_built_outside_the_lock_and_dropped_if_a_write_overlaps(openai_client):
+    from src.services.pinecone_service import PineconeService
+
+    service = PineconeService(openai_client=openai_client)
+    service.upload_chunks([make_facility("library", "中央図書館", "", 35.9251, 139.4858)], namespace="geo-lock")
+
+    get_catalog = service.get_catalog
+
+    def get_catalog_during_write(namespaces=None):
+        # 作成中に別のスレッドで書き込みがあり、キャッシュが無効化された
+        service._invalidate_read_caches()
+        return get_catalog(namespaces)
+
+    service.get_catalog = get_catalog_during_write
+    geo_index = service.get_geo_index(namespace="geo-lock")
+    assert geo_index.ids == ["library"]
+    # 書き込みと重なって作成したインデックスは保存せず、次回に作り直す
+    assert service._geo_indexes == {}
+
+    service.get_catalog = get_catalog
+    assert service.get_geo_index(namespace="geo-lock") is service.get_geo_index(namespace="geo-lock")
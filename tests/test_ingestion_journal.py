@@ -0,0 +1,75 @@
+import pytest
+from src.services.ingestion_journal import IngestionJournal
+
+def make_chunks(prefix, count):
+    return [
+        {"id": f"{prefix}_{i}", "text": f"{prefix}の施設{i}は駅から徒歩{i}分です。", "filename": f"{prefix}.txt", "chunk_id": str(i), "metadata": {}}
+        for i in range(count)
+    ]
+
+def make_metadatas(chunks, **fields):
+    return [dict({"text": chunk["text"], "search_text": chunk["text"]}, **fields) for chunk in chunks]
+
+def test_job_id_depends_on_uploaded_metadata():
+    chunks = make_chunks("job", 3)
+    metadatas = make_metadatas(chunks, main_category="交通")
+    job_id = IngestionJournal.make_job_id(chunks, metadatas)
+    # チャンクの順序が変わっても同じジョブとみなす
+    assert IngestionJournal.make_job_id(chunks[::-1], metadatas[::-1]) == job_id
+    # アップロード日時だけが変わった場合は前回のジョブを再開する
+    assert IngestionJournal.make_job_id(chunks, make_metadatas(chunks, main_category="交通", upload_date="2024-04-01")) == job_id
+
+    assert IngestionJournal.make_job_id(chunks, metadatas, namespace="city-a") != job_id
+    # 本文が同じでもメタデータを変更した場合は別のジョブになり、記録済みの古いメタデータを使わない
+    assert IngestionJournal.make_job_id(chunks, make_metadatas(chunks, main_category="医療")) != job_id
+
+def test_journal_restores_progress_after_restart(tmp_path):
+    path = str(tmp_path / "journal.sqlite3")
+    chunks = make_chunks("restart", 3)
+    job_id = IngestionJournal.make_job_id(chunks, make_metadatas(chunks))
+
+    journal = IngestionJournal(path)
+    assert not journal.start(job_id, None, len(chunks))
+    journal.record_embedded(job_id, [
+        {"id": chunk["id"], "values": [0.5, 0.25], "metadata": {"text": chunk["text"]}} for chunk in chunks
+    ])
+    journal.record_upserted(job_id, ["restart_0"])
+
+    reopened = IngestionJournal(path)
+    assert reopened.start(job_id, None, len(chunks))
+    assert reopened.upserted_ids(job_id) == {"restart_0"}
+    restored = reopened.load_embedded(job_id, [chunk["id"] for chunk in chunks])
+    assert set(restored) == {"restart_1", "restart_2"}
+    assert restored["restart_1"] == ([0.5, 0.25], {"text": chunks[1]["text"]})
+
+    reopened.finish(job_id)
+    assert not reopened.start(job_id, None, len(chunks))
+
+def test_upload_resumes_from_journal_without_reembedding(openai_client):
+    from src.services.pinecone_service import PineconeService
+
+    embeddings = openai_client.embeddings
+    service = PineconeService(openai_client=openai_client)
+    chunks = make_chunks("resume", 4)
+
+    # 2つ目のバッチのアップロードだけが失敗し続ける
+    upsert = service.upsert_engine.upsert
+
+    def failing_upsert(vectors, *args, **kwargs):
+        if any(vector["id"] in ("resume_2", "resume_3") for vector in vectors):
+            raise ConnectionError("接続が切断されました")
+        return upsert(vectors, *args, **kwargs)
+
+    service.upsert_engine.upsert = failing_upsert
+    # ワーカーを1つずつにして、1つ目のバッチのアップロード後に中断されるようにする
+    with pytest.raises(Exception, match="チャンクのアップロードに失敗しました: .*接続が切断されました"):
+        service.upload_chunks(chunks, namespace="resume", batch_size=2, embedding_workers=1, upsert_workers=1)
+    assert len(embeddings.texts) == 4
+
+    # 1つ目のバッチは登録済みで内容が変わっていないため、再開時のジョブIDが変わらないことを確認する
+    service.upsert_engine.upsert = upsert
+    report = service.upload_chunks(chunks, namespace="resume", batch_size=2)
+    assert report["skipped_chunks"] == 2
+    assert len(embeddings.texts) == 4
+    # 状態ディレクトリは他のテストと共有しているため、専用のnamespaceの件数で確認する
+    assert service.index.describe_index_stats().namespaces["resume"].vector_count == 4
@@ -0,0 +1,93 @@
+import math
+import numpy as np
+import pytest
+from src.services.local_index import LocalIndex, matches_filter
+
+def make_index(tmp_path, **kwargs):
+    options = {"dimension": 3, "metric": "cosine", "dtype": "float32", "use_hnsw": False}
+    options.update(kwargs)
+    return LocalIndex(str(tmp_path / "index"), **options)
+
+def upsert_cities(index, namespace=None):
+    index.upsert([
+        {"id": "kawagoe", "values": [1.0, 0.0, 0.0], "metadata": {"city": "川越市", "year": 2023, "tags": ["駅", "図書館"]}},
+        {"id": "tokorozawa", "values": [0.8, 0.6, 0.0], "metadata": {"city": "所沢市", "year": 2024, "tags": ["公園"]}},
+        {"id": "sayama", "values": [0.0, 0.0, 2.0], "metadata": {"city": "狭山市", "year": 2022}}
+    ], namespace=namespace)
+
+def test_query_ranks_by_cosine_similarity(tmp_path):
+    index = make_index(tmp_path)
+    upsert_cities(index)
+    response = index.query([2.0, 0.0, 0.0], top_k=2, include_metadata=True, include_values=True)
+    assert [match.id for match in response.matches] == ["kawagoe", "tokorozawa"]
+    assert math.isclose(response.matches[0].score, 1.0, rel_tol=1e-6)
+    assert math.isclose(response.matches[1].score, 0.8, rel_tol=1e-6)
+    assert response.matches[0].metadata["city"] == "川越市"
+    assert response.matches[0].values == [1.0, 0.0, 0.0]
+
+def test_filters_follow_pinecone_operators(tmp_path):
+    metadata = {"city": "川越市", "year": 2023, "tags": ["駅", "図書館"]}
+    assert matches_filter(metadata, {"city": "川越市"})
+    assert matches_filter(metadata, {"tags": {"$in": ["図書館", "公園"]}})
+    assert matches_filter(metadata, {"$or": [{"year": {"$gte": 2024}}, {"city": {"$ne": "所沢市"}}]})
+    assert matches_filter(metadata, {"source": {"$exists": False}})
+    assert not matches_filter(metadata, {"$and": [{"city": "川越市"}, {"year": {"$lt": 2023}}]})
+    assert not matches_filter(metadata, {"tags": {"$nin": ["駅"]}})
+    with pytest.raises(ValueError):
+        matches_filter(metadata, {"city": {"$regex": "川"}})
+
+    index = make_index(tmp_path)
+    upsert_cities(index)
+    response = index.query([1.0, 0.0, 0.0], top_k=3, filter={"year": {"$gte": 2023}})
+    assert [match.id for match in response.matches] == ["kawagoe", "tokorozawa"]
+    index.delete(filter={"city": "所沢市"})
+    assert set(index.fetch(["kawagoe", "tokorozawa", "sayama"]).vectors) == {"kawagoe", "sayama"}
+
+def test_sparse_scores_are_added_to_dense_scores(tmp_path):
+    index = make_index(tmp_path)
+    index.upsert([
+        {"id": "dense", "values": [1.0, 0.0, 0.0]},
+        {"id": "keyword", "values": [0.8, 0.6, 0.0], "sparse_values": {"indices": [7], "values": [1.0]}}
+    ])
+    response = index.query([1.0, 0.0, 0.0], top_k=2, sparse_vector={"indices": [7], "values": [0.5]})
+    assert [match.id for match in response.matches] == ["keyword", "dense"]
+    assert math.isclose(response.matches[0].score, 1.3, rel_tol=1e-6)
+
+def test_namespaces_updates_and_deletes_survive_reopening(tmp_path):
+    index = make_index(tmp_path)
+    upsert_cities(index)
+    upsert_cities(index, namespace="city-a")
+    index.upsert([{"id": "kawagoe", "values": [0.0, 1.0, 0.0], "metadata": {"city": "川越市", "year": 2025}}])
+    index.delete(ids=["sayama"])
+    index.delete(delete_all=True, namespace="city-a")
+    # 削除した行は次の追加で再利用する
+    index.upsert([{"id": "iruma", "values": [0.0, 0.0, 1.0], "metadata": {"city": "入間市"}}])
+
+    reopened = make_index(tmp_path, dimension=8, metric="dotproduct")
+    assert (reopened.dimension, reopened.metric) == (3, "cosine")
+    stats = reopened.describe_index_stats()
+    assert {namespace: summary.vector_count for namespace, summary in stats.namespaces.items()} == {"": 3}
+    fetched = reopened.fetch(["kawagoe", "sayama", "iruma"]).vectors
+    assert set(fetched) == {"kawagoe", "iruma"}
+    assert fetched["kawagoe"].values == [0.0, 1.0, 0.0]
+    assert fetched["kawagoe"].metadata["year"] == 2025
+    assert reopened.query([0.0, 0.0, 1.0], top_k=1).matches[0].id == "iruma"
+
+def test_float16_storage_and_dimension_check(tmp_path):
+    index = make_index(tmp_path, dtype="float16", metric="dotproduct")
+    index.upsert([{"id": "a", "values": [0.5, 0.25, 0.125]}])
+    assert index.fetch(["a"]).vectors["a"].values == [0.5, 0.25, 0.125]
+    assert math.isclose(index.query([2.0, 0.0, 0.0], top_k=1).matches[0].score, 1.0)
+    with pytest.raises(ValueError):
+        index.upsert([{"id": "b", "values": [1.0, 0.0]}])
+
+def test_list_paginated_walks_ids_in_order(tmp_path):
+    index = make_index(tmp_path)
+    index.upsert([{"id": f"doc_{i}", "values": np.ones(3).tolist()} for i in range(5)])
+    first = index.list_paginated(limit=2)
+    assert [record.id for record in first.vectors] == ["doc_0", "doc_1"]
+    second = index.list_paginated(limit=2, pagination_token=first.pagination.next)
+    assert [record.id for record in second.vectors] == ["doc_2", "doc_3"]
+    last = index.list_paginated(limit=2, pagination_token=second.pagination.next)
+    assert [record.id for record in last.vectors] == ["doc_4"]
+    assert last.pagination is None
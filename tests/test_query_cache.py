@@ -0,0 +1,63 @@
+from src.services.query_cache import CachedMatch, QueryResultCache
+
+def make_matches(*ids):
+    return [CachedMatch(vector_id, 0.9 - i * 0.1, {"text": vector_id}) for i, vector_id in enumerate(ids)]
+
+def test_make_key_depends_on_every_query_condition():
+    key = QueryResultCache.make_key("city-a", 5, [0.1, 0.2], {"city": "川越市"})
+    assert key == QueryResultCache.make_key("city-a", 5, [0.1, 0.2], {"city": "川越市"})
+    assert key != QueryResultCache.make_key(None, 5, [0.1, 0.2], {"city": "川越市"})
+    assert key != QueryResultCache.make_key("city-a", 10, [0.1, 0.2], {"city": "川越市"})
+    assert key != QueryResultCache.make_key("city-a", 5, [0.1, 0.3], {"city": "川越市"})
+    assert key != QueryResultCache.make_key("city-a", 5, [0.1, 0.2], None)
+    assert key != QueryResultCache.make_key("city-a", 5, [0.1, 0.2], {"city": "川越市"}, {"indices": [1], "values": [1.0]})
+
+def test_returns_copies_of_cached_matches():
+    cache = QueryResultCache(max_entries=10, ttl_seconds=0)
+    matches, generation = cache.lookup("key")
+    assert matches is None
+    cache.put("key", make_matches("a", "b"), generation)
+
+    cached = cache.get("key")
+    assert [match.id for match in cached] == ["a", "b"]
+    cached[0].metadata["text"] = "changed"
+    assert cache.get("key")[0].metadata["text"] == "a"
+    assert cache.stats()["hits"] == 2
+
+def test_write_invalidates_cached_results():
+    cache = QueryResultCache(max_entries=10, ttl_seconds=0)
+    cache.put("key", make_matches("a"))
+    cache.bump_generation()
+    assert cache.get("key") is None
+
+def test_result_of_query_overlapping_a_write_is_not_cached():
+    cache = QueryResultCache(max_entries=10, ttl_seconds=0)
+    _, generation = cache.lookup("key")
+    # 検索中にアップロードがあり世代が進んだ
+    cache.bump_generation()
+    cache.put("key", make_matches("stale"), generation)
+    assert cache.get("key") is None
+
+def test_evicts_least_recently_used_entries():
+    cache = QueryResultCache(max_entries=2, ttl_seconds=0)
+    cache.put("a", make_matches("a"))
+    cache.put("b", make_matches("b"))
+    cache.get("a")
+    cache.put("c", make_matches("c"))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+def test_persistent_cache_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "query_cache.sqlite3")
+    writer = QueryResultCache(max_entries=10, ttl_seconds=0, path=path)
+    reader = QueryResultCache(max_entries=10, ttl_seconds=0, path=path)
+    writer.put("key", make_matches("a"))
+    assert [match.id for match in reader.get("key")] == ["a"]
+
+    # 他のプロセスでの書き込みによる世代の更新も反映する
+    _, generation = reader.lookup("other")
+    writer.bump_generation()
+    assert reader.get("key") is None
+    reader.put("other", make_matches("stale"), generation)
+    assert writer.get("other") is None
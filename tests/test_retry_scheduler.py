@@ -0,0 +1,161 @@
+import pytest
+from src.services import retry_scheduler
+from src.services.retry_scheduler import CircuitBreaker, CircuitOpenError, RetryScheduler
+
+class StatusError(Exception):
+    """HTTPステータスと応答ヘッダーを持つ例外（OpenAIのAPIエラーと同じ属性名）"""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.headers = headers or {}
+
+class Clock:
+    """time.monotonicの代わりに進める時計"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(retry_scheduler.time, "monotonic", clock)
+    return clock
+
+def make_scheduler(**kwargs):
+    options = {"max_attempts": 3, "failure_threshold": 2, "reset_seconds": 30, "sleep": lambda seconds: None}
+    options.update(kwargs)
+    return RetryScheduler(**options)
+
+def failing(error):
+    def call():
+        raise error
+    return call
+
+def test_breaker_opens_after_consecutive_failures_and_recovers_after_trial(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+    assert breaker.state == "closed"
+
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    clock.now += 30
+    assert breaker.state == "half_open"
+    # 回復の確認は同時に1件のみ
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+def test_failed_trial_reopens_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.remaining_seconds() == 30
+
+def test_open_circuit_rejects_calls_without_calling(clock):
+    scheduler = make_scheduler()
+    calls = []
+
+    def call():
+        calls.append(1)
+        raise StatusError(503)
+
+    with pytest.raises(StatusError):
+        scheduler.call("pinecone.upsert", call)
+    assert len(calls) == 2
+    assert scheduler.stats()["pinecone.upsert"]["circuit"] == "open"
+
+    with pytest.raises(CircuitOpenError):
+        scheduler.call("pinecone.upsert", call)
+    assert len(calls) == 2
+    assert scheduler.stats()["pinecone.upsert"]["rejected"] == 1
+    assert scheduler.remaining_seconds("pinecone.upsert", "openai.embeddings") == 30
+
+    clock.now += 30
+    assert scheduler.call("pinecone.upsert", lambda: "ok") == "ok"
+    assert scheduler.stats()["pinecone.upsert"]["circuit"] == "closed"
+
+def test_rate_limits_do_not_open_breaker(clock):
+    scheduler = make_scheduler()
+    for _ in range(3):
+        with pytest.raises(StatusError):
+            scheduler.call("openai.embeddings", failing(StatusError(429)))
+    with pytest.raises(StatusError):
+        scheduler.call("openai.embeddings", failing(StatusError(503, {"retry-after": "1"})))
+
+    stats = scheduler.stats()["openai.embeddings"]
+    assert stats["circuit"] == "closed"
+    assert stats["calls"] == 12
+    assert stats["retries"] == 8
+
+def test_retry_after_is_honoured_and_capped():
+    delays = []
+    scheduler = make_scheduler(retry_after_max=5, sleep=delays.append)
+    attempts = iter([StatusError(429, {"retry-after": "2"}), StatusError(429, {"retry-after": "120"})])
+
+    def call():
+        error = next(attempts, None)
+        if error:
+            raise error
+        return "ok"
+
+    assert scheduler.call("openai.chat", call) == "ok"
+    assert delays == [2.0, 5]
+
+def test_non_retryable_errors_fail_immediately_and_are_not_counted():
+    scheduler = make_scheduler()
+    for _ in range(3):
+        with pytest.raises(StatusError):
+            scheduler.call("openai.chat", failing(StatusError(400)))
+
+    stats = scheduler.stats()["openai.chat"]
+    assert stats["calls"] == 3
+    assert stats["retries"] == 0
+    assert stats["circuit"] == "closed"
+
+def test_non_retryable_error_does_not_count_as_recovery(clock):
+    scheduler = make_scheduler(max_attempts=1)
+    with pytest.raises(StatusError):
+        scheduler.call("pinecone.query", failing(StatusError(503)))
+    with pytest.raises(StatusError):
+        scheduler.call("pinecone.query", failing(StatusError(503)))
+    clock.now += 30
+
+    # 回復の確認中の入力エラーは成功とみなさず、次の呼び出しで改めて確認する
+    with pytest.raises(StatusError):
+        scheduler.call("pinecone.query", failing(StatusError(400)))
+    assert scheduler.stats()["pinecone.query"]["circuit"] == "half_open"
+    with pytest.raises(StatusError):
+        scheduler.call("pinecone.query", failing(StatusError(503)))
+    assert scheduler.stats()["pinecone.query"]["circuit"] == "open"
+
+class APIConnectionError(Exception):
+    """OpenAIクライアントの接続エラーと同じ名前の例外（ステータスを持たない）"""
+
+@pytest.mark.parametrize("error, retried", [
+    (ConnectionError("接続が切断されました"), True),
+    (TimeoutError("timed out"), True),
+    (APIConnectionError("Connection error."), True),
+    (StatusError(409), False),
+    (RuntimeError("想定外の状態です"), False),
+    (AttributeError("'NoneType' object has no attribute 'data'"), False)
+])
+def test_only_transport_errors_without_status_are_retried(error, retried):
+    scheduler = make_scheduler(failure_threshold=10)
+    with pytest.raises(type(error)):
+        scheduler.call("openai.embeddings", failing(error))
+    assert scheduler.stats()["openai.embeddings"]["calls"] == (3 if retried else 1)
@@ -0,0 +1,68 @@
+import math
+from src.services.sparse_encoder import BM25SparseEncoder
+
+DOCUMENTS = {
+    "doc_0": "川越駅の近くに図書館があります。",
+    "doc_1": "市役所の近くに公園があります。",
+    "doc_2": "図書館の開館時間は午前9時からです。"
+}
+
+def make_encoder(tmp_path):
+    return BM25SparseEncoder(str(tmp_path / "bm25.sqlite3"))
+
+def corpus(encoder):
+    return encoder._corpus_stats()
+
+def query_weights(encoder, text):
+    sparse = encoder.encode_query(text)
+    return dict(zip(sparse["indices"], sparse["values"]))
+
+def test_documents_and_queries_are_normalized_sparse_vectors(tmp_path):
+    encoder = make_encoder(tmp_path)
+    for sparse in encoder.encode_documents(list(DOCUMENTS.values())) + [encoder.encode_query("図書館の場所")]:
+        assert sparse["indices"] == sorted(sparse["indices"])
+        assert math.isclose(sum(value * value for value in sparse["values"]), 1.0)
+    assert encoder.encode_query("。") == {"indices": [], "values": []}
+
+def test_rare_terms_weigh_more_in_queries(tmp_path):
+    encoder = make_encoder(tmp_path)
+    encoder.fit(None, list(DOCUMENTS), list(DOCUMENTS.values()))
+    weights = query_weights(encoder, "図書館 公園")
+    # 「公園」は1件、「図書館」は2件の文書に含まれる
+    assert weights[encoder.term_id("公園")] > weights[encoder.term_id("図書館")]
+
+def test_refit_and_remove_keep_corpus_statistics_exact(tmp_path):
+    encoder = make_encoder(tmp_path)
+    encoder.fit(None, list(DOCUMENTS), list(DOCUMENTS.values()))
+    stats = corpus(encoder)
+    weights = query_weights(encoder, "図書館 公園")
+
+    # 同じIDの文書を登録し直しても二重に数えない
+    encoder.fit(None, ["doc_1"], [DOCUMENTS["doc_1"]])
+    assert corpus(encoder) == stats
+    assert query_weights(encoder, "図書館 公園") == weights
+
+    encoder.fit("city-a", ["doc_1"], [DOCUMENTS["doc_1"]])
+    assert corpus(encoder)[0] == 4
+    encoder.remove("city-a", ["doc_1", "missing"])
+    assert corpus(encoder) == stats
+
+    encoder.remove(None, ["doc_2"])
+    encoder.fit(None, ["doc_2"], [DOCUMENTS["doc_2"]])
+    assert query_weights(encoder, "図書館 公園") == weights
+
+def test_clear_only_removes_the_namespace(tmp_path):
+    encoder = make_encoder(tmp_path)
+    encoder.fit(None, ["doc_0"], [DOCUMENTS["doc_0"]])
+    encoder.fit("city-a", ["doc_1", "doc_2"], [DOCUMENTS["doc_1"], DOCUMENTS["doc_2"]])
+
+    encoder.clear("city-a")
+    assert corpus(encoder)[0] == 1
+    encoder.clear()
+    assert corpus(encoder) == (0, 0.0)
+
+def test_keyword_heavy_questions_name_facilities(tmp_path):
+    encoder = make_encoder(tmp_path)
+    assert encoder.is_keyword_heavy("川越駅の営業時間")
+    assert not encoder.is_keyword_heavy("川越市で子育てしやすい環境について教えて")
+    assert not encoder.is_keyword_heavy("ゴミの出し方を教えてください")
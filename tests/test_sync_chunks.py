@@ -0,0 +1,43 @@
+from src.utils.chunk_ids import chunk_id_prefix, make_chunk_id
+
+def make_property_chunks(city, name, texts, with_key=True):
+    source = f"埼玉県{city}本町1-1{name}"
+    metadata = {"property_name": name, "city": city}
+    if with_key:
+        metadata["property_key"] = source
+    return source, [
+        {"id": make_chunk_id("property", source, text), "text": text, "metadata": dict(metadata)}
+        for text in texts
+    ]
+
+def property_ids(service):
+    return {record.id for record in service.iter_vectors(namespace="property")}
+
+def test_property_sync_only_replaces_the_same_property(openai_client):
+    from src.services.pinecone_service import PineconeService
+
+    service = PineconeService(openai_client=openai_client)
+    _, kawagoe = make_property_chunks("川越市", "サンハイツ", ["3LDK、南向き", "駐車場あり"])
+    _, tokorozawa = make_property_chunks("所沢市", "サンハイツ", ["2LDK、東向き"])
+    service.upload_chunks(kawagoe + tokorozawa, namespace="property")
+
+    # 川越市の物件を修正して置き換えても、所沢市の同じ名前の物件は残る
+    _, updated = make_property_chunks("川越市", "サンハイツ", ["3LDK、南向き", "駐車場なし"])
+    report = service.sync_chunks(updated, namespace="property")
+    assert report["deleted_chunks"] == 1
+    assert property_ids(service) == {chunk["id"] for chunk in updated + tokorozawa}
+
+def test_property_sync_replaces_legacy_chunks_without_key(openai_client):
+    from src.services.pinecone_service import PineconeService
+
+    service = PineconeService(openai_client=openai_client)
+    source, legacy = make_property_chunks("狭山市", "グリーンコート", ["1LDK", "ペット可"], with_key=False)
+    _, other = make_property_chunks("入間市", "グリーンコート", ["2DK"], with_key=False)
+    service.upload_chunks(legacy + other, namespace="property")
+
+    _, updated = make_property_chunks("狭山市", "グリーンコート", ["1LDK", "ペット不可"])
+    report = service.sync_chunks(updated, namespace="property", legacy_id_prefixes=[chunk_id_prefix("property", source)])
+    assert report["deleted_chunks"] == 1
+    ids = property_ids(service)
+    assert legacy[1]["id"] not in ids
+    assert {chunk["id"] for chunk in updated + other} <= ids
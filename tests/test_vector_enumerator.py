@@ -0,0 +1,60 @@
+import types
+from src.services.local_index import LocalIndex
+from src.services.retry_scheduler import RetryScheduler
+from src.services.vector_enumerator import VectorEnumerator
+
+class ListUnsupportedError(Exception):
+    """ポッド型インデックスがlist_paginatedに返すエラー（Pineconeの例外と同じくstatusを持つ）"""
+
+    def __init__(self):
+        super().__init__("Bad Request")
+        self.status = 400
+
+class PodIndex:
+    """IDの列挙に対応していないインデックス"""
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.queries = 0
+
+    def list_paginated(self, **kwargs):
+        raise ListUnsupportedError()
+
+    def query(self, **kwargs):
+        self.queries += 1
+        return types.SimpleNamespace(matches=[types.SimpleNamespace(id=vector_id) for vector_id in self.ids])
+
+def make_enumerator(index, page_size=3):
+    return VectorEnumerator(index, dimension=4, page_size=page_size, max_workers=2, retry=RetryScheduler(sleep=lambda seconds: None))
+
+def make_local_index(tmp_path, count):
+    index = LocalIndex(str(tmp_path / "index"), dimension=4)
+    index.upsert([
+        {"id": f"doc_{i:02d}", "values": [1.0, float(i), 0.0, 0.5], "metadata": {"n": i}}
+        for i in range(count)
+    ])
+    return index
+
+def test_lists_every_id_page_by_page(tmp_path):
+    enumerator = make_enumerator(make_local_index(tmp_path, 8))
+    pages = list(enumerator.iter_ids())
+    assert [len(page) for page in pages] == [3, 3, 2]
+    assert [vector_id for page in pages for vector_id in page] == [f"doc_{i:02d}" for i in range(8)]
+    assert list(enumerator.iter_ids(prefix="doc_0")) == [[f"doc_0{i}" for i in range(3)], [f"doc_0{i}" for i in range(3, 6)], ["doc_06", "doc_07"]]
+
+def test_iter_vectors_keeps_listing_order_and_drops_values_by_default(tmp_path):
+    enumerator = make_enumerator(make_local_index(tmp_path, 8))
+    records = list(enumerator.iter_vectors())
+    assert [record.id for record in records] == [f"doc_{i:02d}" for i in range(8)]
+    assert [record.metadata["n"] for record in records] == list(range(8))
+    assert all(record.values is None for record in records)
+
+    fetched = enumerator.fetch_many(["doc_05", "missing"], include_values=True)
+    assert set(fetched) == {"doc_05"}
+    assert fetched["doc_05"].values == [1.0, 5.0, 0.0, 0.5]
+
+def test_falls_back_to_query_when_listing_is_unsupported():
+    index = PodIndex(["a", "b", "c", "d"])
+    enumerator = make_enumerator(index)
+    assert list(enumerator.iter_ids()) == [["a", "b", "c"], ["d"]]
+    assert index.queries == 1
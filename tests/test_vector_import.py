@@ -0,0 +1,37 @@
+from src.services.local_index import LocalIndex
+from src.services.retry_scheduler import RetryScheduler
+from src.services.vector_enumerator import VectorEnumerator
+from src.services.vector_import import iter_records, validate_record, write_jsonl
+
+SPARSE = {"indices": [3, 11], "values": [0.6, 0.8]}
+
+def make_index(tmp_path):
+    index = LocalIndex(str(tmp_path / "index"), dimension=4)
+    index.upsert([
+        {"id": "hybrid", "values": [0.5, 0.5, 0.5, 0.5], "metadata": {"text": "駅前の図書館"}, "sparse_values": SPARSE},
+        {"id": "dense", "values": [1.0, 0.0, 0.0, 0.0], "metadata": {"text": "市役所"}}
+    ])
+    return index
+
+def test_export_keeps_sparse_values_for_reimport(tmp_path):
+    enumerator = VectorEnumerator(make_index(tmp_path), dimension=4, retry=RetryScheduler(sleep=lambda seconds: None))
+    path = str(tmp_path / "export" / "vectors.jsonl.gz")
+    assert write_jsonl(enumerator.iter_vectors(include_values=True), path) == 2
+
+    records = {record["id"]: record for record in iter_records(path)}
+    assert records["hybrid"]["sparse_values"] == SPARSE
+    assert "sparse_values" not in records["dense"]
+    assert records["hybrid"]["metadata"] == {"text": "駅前の図書館"}
+    assert all(validate_record(record, 4) is None for record in records.values())
+
+def test_migration_carries_sparse_values_over(tmp_path):
+    from src.tools.migrate_index import build_target_vectors
+
+    source_vectors = [
+        {"id": "hybrid", "values": [3.0, 4.0, 1.0, 1.0], "metadata": {}, "sparse_values": SPARSE},
+        {"id": "dense", "values": [1.0, 0.0, 0.0, 0.0], "metadata": {}}
+    ]
+    target_vectors = build_target_vectors(None, source_vectors, 2, "truncate")
+    assert target_vectors[0]["values"] == [0.6, 0.8]
+    assert target_vectors[0]["sparse_values"] == SPARSE
+    assert "sparse_values" not in target_vectors[1]